@@ -0,0 +1,119 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+DEFAULT_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+# Assumed service time until a provider has completed a call in this process
+DEFAULT_SERVICE_TIME = 40.0
+SAMPLES = 200
+
+
+class AdmissionRejected(Exception):
+    """Raised when a provider's wait queue is full or it is rate-limiting us.
+
+    `retry_after` is the number of seconds the client should wait before
+    trying again.
+    """
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} is at capacity, retry after {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderAdmission:
+    """Concurrency limit plus a bounded wait queue in front of one provider."""
+
+    def __init__(self, name, concurrency, max_queue):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=SAMPLES)
+        self._service_times = deque(maxlen=SAMPLES)
+
+    @property
+    def service_time(self):
+        if not self._service_times:
+            return DEFAULT_SERVICE_TIME
+        return sum(self._service_times) / len(self._service_times)
+
+    def retry_after(self):
+        """Seconds until a newcomer would likely get a slot.
+
+        Everyone queued ahead, plus the newcomer, drains at `concurrency`
+        calls per mean service time.
+        """
+        return max(1, math.ceil((self.waiting + 1) / self.concurrency * self.service_time))
+
+    def check(self):
+        """Raise `AdmissionRejected` if a new call would not be admitted now."""
+        if self.in_flight >= self.concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the provider's concurrency slots for the enclosed call."""
+        self.check()
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.monotonic()
+        self._wait_times.append(started - queued_at)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self._service_times.append(time.monotonic() - started)
+
+    def stats(self):
+        waits = sorted(self._wait_times)
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "rejected": self.rejected,
+            "wait_p50": waits[len(waits) // 2] if waits else None,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+            "service_time_mean": self.service_time,
+        }
+
+
+class AdmissionController:
+    def __init__(self):
+        self._providers = {}
+
+    def for_provider(self, name):
+        if name not in self._providers:
+            suffix = name.upper()
+            self._providers[name] = ProviderAdmission(
+                name,
+                concurrency=int(os.getenv(f"LLM_MAX_CONCURRENCY_{suffix}", DEFAULT_CONCURRENCY)),
+                max_queue=int(os.getenv(f"LLM_MAX_QUEUE_{suffix}", DEFAULT_MAX_QUEUE)),
+            )
+        return self._providers[name]
+
+    def slot(self, name):
+        return self.for_provider(name).slot()
+
+    def stats(self):
+        return {name: admission.stats() for name, admission in self._providers.items()}
+
+
+admission = AdmissionController()
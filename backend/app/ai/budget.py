@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import deque
+
+# Generation stops as soon as the plan's closing tag is emitted; anything the
+# model would write after it is discarded by SVGOutputParser anyway.
+STOP_SEQUENCES = ["</svg>"]
+
+MIN_TOKENS = int(os.getenv("TOKEN_BUDGET_MIN", "2000"))
+MAX_TOKENS = int(os.getenv("TOKEN_BUDGET_MAX", "8000"))
+BASE_TOKENS = 1200
+TOKENS_PER_ROOM = 350
+# Rooms other than bedrooms on every floor (living, kitchen, bath, stairs/hall)
+EXTRA_ROOMS_PER_FLOOR = 3
+# `mode="layout"` replies are a short line per room, door and window
+LAYOUT_MIN_TOKENS = int(os.getenv("LAYOUT_TOKEN_BUDGET_MIN", "400"))
+LAYOUT_BASE_TOKENS = 150
+LAYOUT_TOKENS_PER_ROOM = 40
+HEADROOM = 1.25
+MIN_SAMPLES = 5
+HISTORY = 50
+
+
+def _is_layout(specs):
+    return getattr(specs, "mode", "llm") == "layout"
+
+
+def _bucket(specs):
+    return int(specs.num_floors), int(specs.num_bedrooms), _is_layout(specs)
+
+
+class TokenBudget:
+    """Choose `max_tokens` per spec and learn it from observed output sizes.
+
+    Until a (floors, bedrooms, layout mode) bucket has enough history the budget comes
+    from a rooms-based estimate. After that it is the largest recent output
+    for the bucket plus headroom, so small plans stop reserving (and the
+    provider stops queueing) the full 8000-token maximum. A truncated
+    generation raises its bucket's budget at once, however little history
+    there is.
+    """
+
+    def __init__(self):
+        self._history = {}
+        self._truncated = {}  # Largest need recorded by a truncated generation, per bucket
+        self._lock = threading.Lock()
+        self.counters = {"truncated": 0, "output_tokens": 0, "budgeted_tokens": 0}
+
+    @staticmethod
+    def estimate(specs):
+        rooms = int(specs.num_bedrooms) + EXTRA_ROOMS_PER_FLOOR * int(specs.num_floors)
+        if _is_layout(specs):
+            return LAYOUT_BASE_TOKENS + LAYOUT_TOKENS_PER_ROOM * rooms
+        return BASE_TOKENS + TOKENS_PER_ROOM * rooms
+
+    def max_tokens(self, specs):
+        with self._lock:
+            history = self._history.get(_bucket(specs))
+            # `history` includes truncations once it is long enough to be used
+            learned = max(history) if history and len(history) >= MIN_SAMPLES else self._truncated.get(_bucket(specs))
+        budget = learned * HEADROOM if learned else self.estimate(specs)
+        minimum = LAYOUT_MIN_TOKENS if _is_layout(specs) else MIN_TOKENS
+        return int(min(MAX_TOKENS, max(minimum, budget)))
+
+    def record(self, specs, output_tokens, budget, truncated=False):
+        """Record how many tokens a generation actually produced.
+
+        A truncated generation is recorded as having needed more than its
+        budget, which raises the ceiling for similar plans from the next call.
+        """
+        if truncated:
+            self.counters["truncated"] += 1
+            output_tokens = max(output_tokens, budget * HEADROOM)
+        self.counters["output_tokens"] += output_tokens
+        self.counters["budgeted_tokens"] += budget
+        bucket = _bucket(specs)
+        with self._lock:
+            self._history.setdefault(bucket, deque(maxlen=HISTORY)).append(output_tokens)
+            if truncated:
+                self._truncated[bucket] = max(self._truncated.get(bucket, 0), output_tokens)
+
+    def stats(self):
+        with self._lock:
+            buckets = {
+                f"{floors}f-{bedrooms}b{'-layout' if layout else ''}": {"samples": len(history), "max_output_tokens": max(history)}
+                for (floors, bedrooms, layout), history in self._history.items()
+            }
+        return {**self.counters, "buckets": buckets}
+
+
+token_budget = TokenBudget()
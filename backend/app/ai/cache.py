@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.ai.model import PROMPT_VERSION
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CACHE_DIR = os.getenv("GENERATION_CACHE_DIR", os.path.join(BASE_DIR, "generated_images", "cache"))
+CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DISK_MAX_BYTES = int(os.getenv("GENERATION_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+def normalize_specs(specs):
+    """Return the canonical form of a house specification.
+
+    Free-text fields are case- and whitespace-folded and preferences are
+    sorted and deduplicated, so requests that only differ cosmetically share
+    a cache entry.
+    """
+    return {
+        "house_type": " ".join(specs.house_type.split()).casefold(),
+        "num_marla": round(float(specs.num_marla), 2),
+        "num_bedrooms": int(specs.num_bedrooms),
+        "num_floors": int(specs.num_floors),
+        "additional_preferences": sorted({" ".join(p.split()).casefold() for p in specs.additional_preferences if p.strip()}),
+    }
+
+
+def spec_cache_key(specs, prompt_version=PROMPT_VERSION):
+    """Content-addressed key for a specification under a given prompt version."""
+    canonical = json.dumps(
+        {"spec": normalize_specs(specs), "prompt_version": prompt_version},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Two-tier cache of generated SVGs.
+
+    The first tier is an in-memory LRU bounded by the total size of its
+    entries; the second is a directory of JSON files bounded by total bytes on
+    disk. Entries in both tiers expire after `ttl` seconds.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, memory_max_bytes=CACHE_MEMORY_MAX_BYTES, disk_max_bytes=CACHE_DISK_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()  # key -> (value, created_at, size)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _is_expired(self, created_at):
+        return time.time() - created_at > self.ttl
+
+    def _memory_put(self, key, value, created_at):
+        size = len(value.encode("utf-8"))
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[2]
+            self._memory[key] = (value, created_at, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                self.counters["memory_evictions"] += 1
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created_at, size = entry
+            if self._is_expired(created_at):
+                del self._memory[key]
+                self._memory_bytes -= size
+                self.counters["expired"] += 1
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._is_expired(entry["created_at"]):
+            self.counters["expired"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self._memory_put(key, entry["value"], entry["created_at"])
+        return entry["value"]
+
+    def _disk_put(self, key, value, created_at):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": created_at, "value": value}, f)
+        # Atomic so other workers never read a half-written entry
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.disk_max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.counters["disk_evictions"] += 1
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss."""
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        value = self._disk_get(key)
+        if value is not None:
+            self.counters["disk_hits"] += 1
+            return value
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """Store `value` under `key` in both tiers."""
+        created_at = time.time()
+        self._memory_put(key, value, created_at)
+        try:
+            self._disk_put(key, value, created_at)
+        except OSError as e:
+            print(f"Failed to write generation cache entry {key}: {e}")
+        self.counters["stores"] += 1
+
+    async def aget(self, key):
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        return await asyncio.to_thread(self._aget_disk, key)
+
+    def _aget_disk(self, key):
+        value = self._disk_get(key)
+        self.counters["disk_hits" if value is not None else "misses"] += 1
+        return value
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    def stats(self):
+        with self._lock:
+            memory_entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": memory_entries,
+            "memory_bytes": memory_bytes,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+generation_cache = GenerationCache()
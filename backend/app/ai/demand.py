@@ -0,0 +1,73 @@
+import json
+import os
+import time
+from collections import Counter
+
+from app.ai.cache import BASE_DIR, normalize_specs
+from app.ai.plan_store import plan_store
+
+# One JSON line per generation request; read by the cache warmer to find
+# the specs worth generating ahead of time.
+DEMAND_LOG = os.getenv("DEMAND_LOG", os.path.join(BASE_DIR, "generated_images", "demand.log"))
+DEMAND_LOG_ENABLED = os.getenv("DEMAND_LOG_ENABLED", "true").lower() == "true"
+# The log is rotated to `<name>.1` past this size, keeping at most twice it on disk
+DEMAND_LOG_MAX_BYTES = int(os.getenv("DEMAND_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def record_demand(specs, parallel_floors=False):
+    """Append a generation request for `specs` to the demand log.
+
+    Blocking file I/O: call it from async code with `asyncio.to_thread`.
+    """
+    if not DEMAND_LOG_ENABLED:
+        return
+    record = {"t": round(time.time()), "spec": normalize_specs(specs), "parallel_floors": parallel_floors, "mode": specs.mode}
+    line = json.dumps(record)
+    try:
+        if os.path.getsize(DEMAND_LOG) > DEMAND_LOG_MAX_BYTES:
+            os.replace(DEMAND_LOG, DEMAND_LOG + ".1")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(DEMAND_LOG), exist_ok=True)
+    # Appends of a single short line are atomic, so worker processes can share the file
+    with open(DEMAND_LOG, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _read_log(since):
+    for path in (DEMAND_LOG + ".1", DEMAND_LOG):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if record.get("t", 0) >= since:
+                        yield record
+        except FileNotFoundError:
+            continue
+
+
+def popular_specs(top_n, window_days=7):
+    """Rank the specs requested in the last `window_days` by request count.
+
+    Falls back to the plans in the plan store (one vote each) when the demand
+    log has nothing in the window yet, e.g. right after deployment.
+
+    Returns:
+        Up to `top_n` `(spec, parallel_floors, mode, count)` tuples, most
+        requested first, with `spec` in `normalize_specs` form and `mode` the
+        generation mode it was requested with.
+    """
+    counts = Counter()
+    for record in _read_log(time.time() - window_days * 86400):
+        counts[(json.dumps(record["spec"], sort_keys=True), bool(record.get("parallel_floors")), record.get("mode", "llm"))] += 1
+    if not counts:
+        for meta in plan_store.iter_metadata():
+            engine = meta.get("engine", "llm")
+            if meta.get("specs") and not meta.get("derived_from") and engine in ("llm", "layout"):
+                counts[(json.dumps(meta["specs"], sort_keys=True), bool(meta.get("floor_plan_ids")), engine)] += 1
+    return [
+        (json.loads(spec), parallel_floors, mode, count)
+        for (spec, parallel_floors, mode), count in counts.most_common(top_n)
+    ]
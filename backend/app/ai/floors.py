@@ -0,0 +1,139 @@
+"""Generate a multi-floor house one floor per model call.
+
+A single SVG holding every floor is the slowest output to generate and the
+most likely to be cut off at `max_tokens`. Instead each floor is requested
+separately and concurrently, against a plot frame and staircase position
+derived from the spec so the floors line up, and the results are stitched
+side by side into one sheet.
+"""
+import re
+from xml.sax.saxutils import escape
+
+from app.ai.layout import use_layout
+from app.ai.procedural import (
+    FLOOR_GAP,
+    FLOOR_NAMES,
+    MARGIN,
+    SCALE,
+    SQFT_PER_MARLA,
+    TITLE_HEIGHT,
+    bedrooms_per_floor,
+    plot_dimensions,
+    stairs_rect,
+)
+
+_ROOT_RE = re.compile(r"<svg\b([^>]*)>", re.I)
+_ID_RE = re.compile(r"""\bid\s*=\s*(["'])([^"']+)\1""")
+_REF_RE = re.compile(r"""(url\(\s*["']?#|href\s*=\s*["']#)([^"')\s]+)""")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)")
+
+
+def use_per_floor(specs):
+    """Whether `specs` asks for (and has) several floors to generate separately.
+
+    Layouts are short enough to ask for every floor in one call.
+    """
+    return specs.parallel_floors and specs.num_floors > 1 and not use_layout(specs)
+
+
+def floor_name(level):
+    return FLOOR_NAMES[level] if level < len(FLOOR_NAMES) else f"Floor {level + 1}"
+
+
+def floor_prompts(specs):
+    """Fields for `build_floor_message`, one dict per floor, ground floor first."""
+    width, depth = plot_dimensions(specs.num_marla)
+    stairs_x, stairs_y, stairs_w, stairs_h = stairs_rect(width, depth, specs.num_floors)
+    shared = {
+        "scale": SCALE,
+        "plot_width": f"{width:.1f}",
+        "plot_depth": f"{depth:.1f}",
+        "view_width": round(width * SCALE),
+        "view_height": round(depth * SCALE),
+        "stairs_x": round(stairs_x * SCALE),
+        "stairs_y": round(stairs_y * SCALE),
+        "stairs_width": round(stairs_w * SCALE),
+        "stairs_height": round(stairs_h * SCALE),
+    }
+    floors = []
+    for level, bedrooms in enumerate(bedrooms_per_floor(specs.num_bedrooms, specs.num_floors)):
+        if level == 0:
+            program = "It also holds the drawing room, kitchen, dining area and a car porch at the front."
+        else:
+            program = "It also holds a family lounge; keep the front setback open above the car porch."
+        floors.append({
+            **shared,
+            "floor_name": floor_name(level),
+            "floor_number": level + 1,
+            "num_bedrooms": bedrooms,
+            "floor_program": program,
+        })
+    return floors
+
+
+def _split_root(svg_content):
+    """Return the root `<svg>` tag's attribute text and the markup inside it."""
+    match = _ROOT_RE.search(svg_content)
+    if not match:
+        return "", svg_content
+    end = svg_content.lower().rfind("</svg>")
+    return match.group(1), svg_content[match.end():end if end > match.end() else len(svg_content)]
+
+
+def _attribute(attrs, name):
+    match = re.search(rf"""\b{name}\s*=\s*["']([^"']*)["']""", attrs)
+    return match.group(1) if match else None
+
+
+def _view_box(attrs, default):
+    view_box = _attribute(attrs, "viewBox")
+    if view_box and len(_NUMBER_RE.findall(view_box)) == 4:
+        return view_box
+    width, height = _attribute(attrs, "width"), _attribute(attrs, "height")
+    if width and height and "%" not in width + height:
+        sizes = _NUMBER_RE.findall(width) + _NUMBER_RE.findall(height)
+        if len(sizes) == 2:
+            return f"0 0 {sizes[0]} {sizes[1]}"
+    return default
+
+
+def _namespace_ids(content, prefix):
+    """Prefix a floor's ids (and references to them) so floors can't collide."""
+    ids = {match.group(2) for match in _ID_RE.finditer(content)}
+    if not ids:
+        return content
+    content = _ID_RE.sub(lambda m: f"id={m.group(1)}{prefix}{m.group(2)}{m.group(1)}", content)
+    return _REF_RE.sub(lambda m: m.group(1) + (prefix + m.group(2) if m.group(2) in ids else m.group(2)), content)
+
+
+def stitch_floors(floor_svgs, specs):
+    """Lay the floors' SVGs out left to right on one titled sheet.
+
+    Each floor keeps its own coordinate system inside a nested `<svg>` sized
+    to the plot, so floors drawn at slightly different scales still line up.
+    """
+    width, depth = plot_dimensions(specs.num_marla)
+    panel_w, panel_h = width * SCALE, depth * SCALE
+    count = len(floor_svgs)
+    total_w = MARGIN * 2 + panel_w * count + FLOOR_GAP * (count - 1)
+    total_h = MARGIN * 2 + TITLE_HEIGHT + panel_h + 20
+    top = MARGIN + TITLE_HEIGHT
+
+    title = f"{specs.house_type.strip().title()} House - {specs.num_marla:g} Marla"
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_w:.0f}" height="{total_h:.0f}" viewBox="0 0 {total_w:.0f} {total_h:.0f}" font-family="Arial, sans-serif">',
+        f'<rect x="0" y="0" width="{total_w:.0f}" height="{total_h:.0f}" fill="#ffffff"/>',
+        f'<text x="{total_w / 2:.1f}" y="{MARGIN:.0f}" font-size="20" font-weight="bold" text-anchor="middle">{escape(title)}</text>',
+        f'<text x="{total_w / 2:.1f}" y="{MARGIN + 18:.0f}" font-size="10" text-anchor="middle" fill="#555">Plot {width:.1f} x {depth:.1f} ft ({specs.num_marla * SQFT_PER_MARLA:.0f} sq ft)</text>',
+    ]
+    for level, svg_content in enumerate(floor_svgs):
+        attrs, inner = _split_root(svg_content)
+        x = MARGIN + level * (panel_w + FLOOR_GAP)
+        view_box = _view_box(attrs, f"0 0 {panel_w:.0f} {panel_h:.0f}")
+        parts.append(f'<text x="{x + panel_w / 2:.1f}" y="{top - 12:.0f}" font-size="14" font-weight="bold" text-anchor="middle">{floor_name(level)}</text>')
+        parts.append(
+            f'<svg id="floor-{level}" x="{x:.1f}" y="{top:.0f}" width="{panel_w:.1f}" height="{panel_h:.1f}" viewBox="{view_box}" preserveAspectRatio="xMidYMid meet">'
+            f"{_namespace_ids(inner, f'f{level}-')}</svg>"
+        )
+    parts.append("</svg>")
+    return "".join(parts)
@@ -0,0 +1,546 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Optional
+
+from langchain.schema.output_parser import OutputParserException
+
+from app.ai.admission import admission
+from app.ai.budget import STOP_SEQUENCES, token_budget
+from app.ai.cache import generation_cache, spec_cache_key
+from app.ai.demand import record_demand
+from app.ai.floors import floor_prompts, stitch_floors, use_per_floor
+from app.ai.layout import LAYOUT_STOP_SEQUENCES, InvalidLayout, parse_layout, use_layout
+from app.ai.model import (
+    FLOOR_PROMPT_VERSION,
+    LAYOUT_PROMPT_VERSION,
+    VARIANT_PROMPT_VERSION,
+    build_floor_message,
+    build_human_message,
+    build_layout_message,
+    build_messages,
+    build_variant_message,
+    get_llm,
+    is_truncated,
+    usage_from_response,
+)
+from app.ai.plan_store import PlanNotFound, plan_store
+from app.ai.procedural import plot_dimensions, render_layout, render_procedural, use_procedural
+from app.ai.providers import provider_router
+from app.ai.quality import check_stored_plan, rejected
+from app.ai.ranking import CRITERIA, rank_variants
+from app.ai.rescale import derive_plan
+from app.ai.singleflight import generation_flight
+from app.ai.stream_guard import STREAM_RETRIES, StreamAborted, StreamGuard, stream_stats
+from app.ai.svg_optimize import optimize_svg
+from app.ai.svg_parser import SVGExtractor
+from app.ai.svg_repair import InvalidSVG, repair_svg
+
+# Upper bound on `num_variants`: each variant past the first is a model call
+MAX_VARIANTS = int(os.getenv("MAX_VARIANTS", "4"))
+
+
+@dataclass
+class GenerationResult:
+    """Outcome of a floor-plan generation."""
+    svg_content: str
+    cache_hit: bool = False
+    usage: dict = field(default_factory=dict)
+    plan_id: Optional[str] = None  # Id of the stored plan, see `plan_store`
+    engine: str = "llm"  # "llm", "layout" or "procedural"
+    derived_from: Optional[str] = None  # Plan this one was rescaled from, see `rescale`
+    floor_plan_ids: list = field(default_factory=list)  # Per-floor plans of a `parallel_floors` sheet
+    quality: Optional[dict] = None  # Geometric checks of the plan, see `quality.check_plan`
+    variants: list = field(default_factory=list)  # Ranked alternatives, see `generate_variants`
+    layout: Optional[dict] = None  # What the model wrote in layout mode, see `layout.parse_layout`
+    partial: bool = False  # Cut off mid-way and closed: returned, but neither stored nor cached
+
+
+# Running token totals for this worker, including prompt-cache reads/writes
+usage_totals = Counter()
+
+
+def _record_usage(usage):
+    usage_totals.update(usage)
+    usage_totals["generations"] += 1
+
+
+def cache_key_for(specs):
+    """Generation cache key for `specs`, which depends on how it is generated."""
+    if use_layout(specs):
+        return spec_cache_key(specs, LAYOUT_PROMPT_VERSION)
+    if use_per_floor(specs):
+        return spec_cache_key(specs, FLOOR_PROMPT_VERSION)
+    return spec_cache_key(specs)
+
+
+def _human_message(specs, variant=None, num_variants=None):
+    """The human message asking the model for `specs`, or for alternative `variant` of it."""
+    args = (specs.house_type, specs.num_marla, specs.num_bedrooms, specs.num_floors)
+    if use_layout(specs):
+        return build_layout_message(*args, *plot_dimensions(specs.num_marla), variant, num_variants)
+    if variant is not None:
+        return build_variant_message(*args, variant, num_variants)
+    return build_human_message(*args)
+
+
+async def generate_svg(specs, provider_limits=None, track_demand=True):
+    """Generate (or fetch from cache) the SVG floor plan for `specs`.
+
+    On a cache miss a stored plan with the same room program and a plot size
+    within `RESCALE_TOLERANCE` is rescaled instead, and flagged via
+    `derived_from`. Specs asking for several `num_variants` go through
+    `generate_variants`.
+
+    Args:
+        specs: A `HouseSpecifications` request body.
+        provider_limits: Optional per-provider semaphores bounding concurrency.
+        track_demand: Whether to count the request in the demand log the
+            cache warmer ranks specs by.
+
+    Returns:
+        A `GenerationResult` with the extracted SVG, its stored plan id and
+        its quality report.
+
+    Raises:
+        OutputParserException: If the model response contains no SVG (or,
+            in layout mode, no drawable layout).
+        PlanNotFound: If `specs.plan_id` names a plan that isn't stored.
+    """
+    if specs.num_variants > 1 and not specs.plan_id and not use_procedural(specs):
+        return await generate_variants(specs, provider_limits, track_demand)
+    result = await _generate(specs, provider_limits, track_demand)
+    return await _check_quality(result, specs)
+
+
+async def generate_variants(specs, provider_limits=None, track_demand=True):
+    """Generate `specs.num_variants` alternative plans concurrently and rank them.
+
+    The first variant is the plan `generate_svg` makes for the specs alone
+    (cached and coalesced as usual); the others come from concurrent calls
+    each asking for a differently organised layout, cached per variant. A
+    variant that fails or is cut off by the token limit is left out unless
+    they all are.
+
+    Nothing is rendered here: clients rasterize the variants they show via
+    the plans endpoints.
+
+    Returns:
+        The best variant's `GenerationResult`, with `variants` listing every
+        candidate best first and `usage` totalling all of their calls.
+    """
+    num_variants = min(specs.num_variants, MAX_VARIANTS)
+    base = specs.model_copy(update={"num_variants": 1})
+    calls = [asyncio.ensure_future(generate_svg(base, provider_limits, track_demand))]
+    calls += [
+        asyncio.ensure_future(_generate_variant(base, variant, num_variants, provider_limits))
+        for variant in range(2, num_variants + 1)
+    ]
+    try:
+        outcomes = await asyncio.gather(*calls, return_exceptions=True)
+    except BaseException:
+        for call in calls:
+            call.cancel()
+        raise
+    results = [outcome for outcome in outcomes if isinstance(outcome, GenerationResult)]
+    for variant, outcome in enumerate(outcomes, 1):
+        if not isinstance(outcome, GenerationResult):
+            print(f"Variant {variant} of {num_variants} failed: {outcome}")
+    if not results:
+        raise outcomes[0]
+    usage = Counter()
+    for result in results:
+        usage.update(result.usage)
+    # Partial plans aren't stored, so they can't be ranked or linked to
+    complete = [result for result in results if not result.partial]
+    if not complete:
+        results[0].usage = dict(usage)
+        return results[0]
+    results = complete
+    # Variants can converge on one plan (e.g. a rescaled stored plan); list it once
+    unique = {}
+    for result in results:
+        unique.setdefault(result.plan_id, result)
+    results = list(unique.values())
+
+    order, scores, penalties = await asyncio.to_thread(
+        rank_variants, [(result.plan_id, result.quality) for result in results], specs.num_bedrooms
+    )
+    best = results[order[0]]
+    variants = [
+        {
+            "rank": rank + 1,
+            "plan_id": results[i].plan_id,
+            "score": round(float(scores[i]), 4),
+            "penalties": {name: round(float(value), 4) for name, value in zip(CRITERIA, penalties[i])},
+            "quality": results[i].quality,
+            "cache_hit": results[i].cache_hit,
+        }
+        for rank, i in enumerate(order)
+    ]
+    return GenerationResult(
+        svg_content=best.svg_content,
+        cache_hit=all(result.cache_hit for result in results),
+        usage=dict(usage),
+        plan_id=best.plan_id,
+        engine=best.engine,
+        derived_from=best.derived_from,
+        floor_plan_ids=best.floor_plan_ids,
+        quality=best.quality,
+        variants=variants,
+    )
+
+
+async def _generate_variant(specs, variant, num_variants, provider_limits=None):
+    """Alternative `variant` of a multi-variant request (see `generate_variants`)."""
+    version = LAYOUT_PROMPT_VERSION if use_layout(specs) else VARIANT_PROMPT_VERSION
+    key = spec_cache_key(specs, f"{version}-{variant}")
+    if not specs.force_regenerate:
+        cached = await generation_cache.aget(key)
+        if cached is not None:
+            return await _check_quality(await _cached(cached, specs), specs)
+    human_message = _human_message(specs, variant, num_variants)
+    return await generation_flight.do(key, lambda: _generate_uncached(specs, key, provider_limits, human_message))
+
+
+async def _check_quality(result, specs):
+    """Attach the quality report of `result`'s stored plan, unless it has one."""
+    if result.quality is None and result.plan_id:
+        result.quality = await asyncio.to_thread(check_stored_plan, result.plan_id, specs.num_marla)
+        if rejected(result.quality):
+            print(f"Plan {result.plan_id} failed quality checks: {[i['message'] for i in result.quality['issues'] if i['severity'] == 'error']}")
+    return result
+
+
+async def _generate(specs, provider_limits, track_demand):
+    if specs.plan_id:
+        # Serve a previous generation (e.g. in another format) without the model
+        svg_content = await plan_store.aload_svg(specs.plan_id)
+        if svg_content is None:
+            raise PlanNotFound(specs.plan_id)
+        return GenerationResult(svg_content=svg_content, cache_hit=True, plan_id=specs.plan_id)
+
+    if use_procedural(specs):
+        # Milliseconds to compute, so neither cached nor coalesced
+        svg_content = render_procedural(specs)
+        plan_id = await plan_store.asave(svg_content, specs, engine="procedural")
+        return GenerationResult(svg_content=svg_content, plan_id=plan_id, engine="procedural")
+
+    per_floor = use_per_floor(specs)
+    key = cache_key_for(specs)
+    if track_demand:
+        await asyncio.to_thread(record_demand, specs, per_floor)
+    if not specs.force_regenerate:
+        reused = await _reuse(specs, key)
+        if reused is not None:
+            return reused
+
+    # Concurrent requests for the same normalized spec share one model call
+    generate = _generate_floors if per_floor else _generate_uncached
+    return await generation_flight.do(key, lambda: generate(specs, key, provider_limits))
+
+
+async def _reuse(specs, key):
+    """Answer `specs` from the cache, or by rescaling a plan for a nearby plot size."""
+    cached = await generation_cache.aget(key)
+    if cached is not None:
+        return await _cached(cached, specs)
+
+    derived = await asyncio.to_thread(derive_plan, specs)
+    if derived is not None:
+        svg_content, source_id = derived
+        # Not cached: a later forced generation for these exact specs should win
+        plan_id = await plan_store.asave(svg_content, specs, derived_from=source_id)
+        result = await _check_quality(GenerationResult(svg_content=svg_content, plan_id=plan_id, derived_from=source_id), specs)
+        # Rescaling is deterministic: a failing plan would be derived again on every retry
+        if not rejected(result.quality):
+            return result
+    return None
+
+
+async def _cached(svg_content, specs):
+    """Result for a cached plan, completed from its stored metadata where needed."""
+    plan_id = await plan_store.asave(svg_content, specs)
+    result = GenerationResult(svg_content=svg_content, cache_hit=True, plan_id=plan_id)
+    if use_per_floor(specs) or use_layout(specs):
+        meta = await asyncio.to_thread(plan_store.load_metadata, plan_id) or {}
+        result.engine = meta.get("engine", result.engine)
+        result.floor_plan_ids = meta.get("floor_plan_ids", [])
+        result.layout = meta.get("layout")
+    return result
+
+
+def _message_text(message):
+    """Return the text carried by a model message or streamed chunk."""
+    if isinstance(message.content, str):
+        return message.content
+    # Anthropic streams content blocks, e.g. [{"type": "text", "text": "..."}]
+    return "".join(block.get("text", "") for block in message.content if isinstance(block, dict))
+
+
+def _restore_stop_sequence(text, truncated):
+    """Re-attach the `</svg>` stop sequence, which providers leave out of the output."""
+    lowered = text.lower()
+    if not truncated and "<svg" in lowered and "</svg>" not in lowered:
+        return text + "</svg>"
+    return text
+
+
+def _extract_svg(extractor):
+    """Return the SVG fed to `extractor`, repaired so it can be stored and rendered.
+
+    An SVG cut off mid-way is kept and closed rather than thrown away, since
+    it usually holds most of the plan, but it is flagged as partial.
+
+    Returns:
+        `(svg_content, partial)`.
+
+    Raises:
+        OutputParserException: If there is no SVG or it is beyond repair.
+    """
+    partial = False
+    try:
+        svg_content = extractor.finish()
+    except OutputParserException:
+        svg_content = extractor.partial()
+        if svg_content is None:
+            raise
+        partial = True
+    try:
+        svg_content, repairs = repair_svg(svg_content)
+    except InvalidSVG as e:
+        raise OutputParserException(str(e))
+    if repairs:
+        print(f"Repaired generated SVG: {', '.join(repairs)}")
+    return svg_content, partial or "closed_truncated" in repairs
+
+
+def _draw_layout(text, specs, truncated):
+    """Parse the layout the model wrote and draw it.
+
+    Raises:
+        OutputParserException: If there is no layout or it can't be drawn.
+    """
+    try:
+        layout = parse_layout(text, plot_dimensions(specs.num_marla), truncated)
+    except InvalidLayout as e:
+        raise OutputParserException(str(e))
+    return render_layout(layout, specs), layout
+
+
+async def _invoke(specs, human_message, provider_limits=None):
+    """Make one routed model call for `human_message` and extract its SVG.
+
+    `specs` describes what the message asks for and sizes the token budget.
+    In layout mode the model writes a layout, which is drawn here.
+    """
+    budget = token_budget.max_tokens(specs)
+    layout_mode = use_layout(specs)
+
+    def parse(response):
+        truncated = is_truncated(response)
+        usage = usage_from_response(response)
+        token_budget.record(specs, usage["output_tokens"], budget, truncated)
+        if layout_mode:
+            svg_content, layout = _draw_layout(_message_text(response), specs, truncated)
+            return GenerationResult(svg_content=svg_content, usage=usage, engine="layout", layout=layout, partial=truncated)
+        extractor = SVGExtractor()
+        extractor.feed(_restore_stop_sequence(_message_text(response), truncated))
+        svg_content, partial = _extract_svg(extractor)
+        return GenerationResult(svg_content=svg_content, usage=usage, partial=truncated or partial)
+
+    messages = build_messages(human_message, layout_mode)
+    result = await provider_router.invoke(
+        lambda provider: messages,
+        parse,
+        limits=provider_limits,
+        stop=LAYOUT_STOP_SEQUENCES if layout_mode else STOP_SEQUENCES,
+        max_tokens=budget,
+    )
+    _record_usage(result.usage)
+    return result
+
+
+async def _generate_uncached(specs, key, provider_limits=None, human_message=None):
+    if human_message is None:
+        human_message = _human_message(specs)
+    result = await _invoke(specs, human_message, provider_limits)
+    if result.partial:
+        # Missing whatever came after the cut; a retry should generate the whole plan
+        print("Generation was cut off, returning it without storing or caching it")
+        result.svg_content = await asyncio.to_thread(optimize_svg, result.svg_content)
+        return result
+    if result.layout is not None:
+        # Drawn by `render_layout`, so already compact
+        result.plan_id = await plan_store.asave(result.svg_content, specs, engine="layout", layout=result.layout)
+    else:
+        result.svg_content = await asyncio.to_thread(optimize_svg, result.svg_content)
+        result.plan_id = await plan_store.asave(result.svg_content, specs)
+    # A plan failing the checks is stored but not cached, so it isn't served again
+    await _check_quality(result, specs)
+    if not rejected(result.quality):
+        await generation_cache.aset(key, result.svg_content)
+    return result
+
+
+async def _generate_floors(specs, key, provider_limits=None):
+    """Generate every floor in its own concurrent model call and stitch the sheet."""
+    calls = []
+    for floor in floor_prompts(specs):
+        # Budgeted (and learned) like a single-floor plan with this floor's bedrooms
+        floor_specs = specs.model_copy(update={"num_floors": 1, "num_bedrooms": floor["num_bedrooms"]})
+        human_message = build_floor_message(specs.house_type, specs.num_marla, specs.num_floors, **floor)
+        calls.append(asyncio.ensure_future(_invoke(floor_specs, human_message, provider_limits)))
+    try:
+        floors = await asyncio.gather(*calls)
+    except BaseException:
+        # One failed floor fails the sheet; don't keep paying for the others
+        for call in calls:
+            call.cancel()
+        raise
+
+    usage = Counter()
+    for floor in floors:
+        usage.update(floor.usage)
+    if any(floor.partial for floor in floors):
+        print("A floor was cut off, returning the sheet without storing or caching it")
+        svg_content = await asyncio.to_thread(optimize_svg, stitch_floors([floor.svg_content for floor in floors], specs))
+        return GenerationResult(svg_content=svg_content, usage=dict(usage), partial=True)
+    # Floors are stored without specs so they aren't mistaken for whole houses
+    floor_plan_ids = [
+        await plan_store.asave(await asyncio.to_thread(optimize_svg, floor.svg_content), floor=level)
+        for level, floor in enumerate(floors)
+    ]
+    # Stitched from the unoptimized floors: classes generated for each floor
+    # would collide on one sheet
+    svg_content = await asyncio.to_thread(optimize_svg, stitch_floors([floor.svg_content for floor in floors], specs))
+    plan_id = await plan_store.asave(svg_content, specs, floor_plan_ids=floor_plan_ids)
+    result = GenerationResult(svg_content=svg_content, usage=dict(usage), plan_id=plan_id, floor_plan_ids=floor_plan_ids)
+    await _check_quality(result, specs)
+    if not rejected(result.quality):
+        await generation_cache.aset(key, svg_content)
+    return result
+
+
+async def stream_svg(specs):
+    """Stream the generation for `specs` as it arrives.
+
+    Yields `("token", text)` for each chunk of model output and finally
+    `("svg", GenerationResult)`. A stored, procedural, cached or rescaled plan
+    yields the result immediately. Floors generated in parallel, layouts and
+    multi-variant requests aren't streamed; their result is yielded once
+    complete.
+
+    Output that can't become a plan is abandoned early (see `StreamGuard`)
+    and generated again, up to `STREAM_RETRIES` times. Each retry yields
+    `("retry", details)` first: the tokens yielded before it are void.
+    """
+    if specs.plan_id or use_procedural(specs) or use_per_floor(specs) or use_layout(specs) or specs.num_variants > 1:
+        yield "svg", await generate_svg(specs)
+        return
+
+    key = cache_key_for(specs)
+    await asyncio.to_thread(record_demand, specs)
+    if not specs.force_regenerate:
+        reused = await _reuse(specs, key)
+        if reused is not None:
+            yield "svg", await _check_quality(reused, specs)
+            return
+
+    human_message = _human_message(specs)
+    budget = token_budget.max_tokens(specs)
+    usage = Counter()
+    failed = set()
+    for attempt in range(STREAM_RETRIES + 1):
+        # A retry goes to another provider when there is one
+        provider = next((name for name in provider_router.ranked() if name not in failed), provider_router.pick())
+        guard = StreamGuard()
+        message = None
+        error = None
+        async with admission.slot(provider):
+            started = time.monotonic()
+            try:
+                stream = get_llm(provider).astream(build_messages(human_message), stop=STOP_SEQUENCES, max_tokens=budget)
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        # Merging the chunks accumulates the usage reported by the stream
+                        message = chunk if message is None else message + chunk
+                        text = _message_text(chunk)
+                        if text:
+                            yield "token", text
+                            # A provider that ignores the stop sequence is cut off
+                            # as soon as the plan is complete
+                            if guard.feed(text) is not None:
+                                break
+
+                truncated = is_truncated(message)
+                if not guard.extractor.done and not truncated:
+                    guard.extractor.feed("</svg>")  # The stop sequence isn't part of the output
+                svg_content, partial = _extract_svg(guard.extractor)
+            except OutputParserException as e:
+                provider_router.record(provider, time.monotonic() - started, False)
+                error = e
+            except Exception:
+                provider_router.record(provider, time.monotonic() - started, False)
+                raise
+            else:
+                provider_router.record(provider, time.monotonic() - started, True)
+        usage.update(usage_from_response(message))
+        if error is None:
+            break
+        if attempt == STREAM_RETRIES:
+            raise error
+        failed.add(provider)
+        stream_stats["retries"] += 1
+        print(f"Streamed generation from {provider} failed, retrying: {error}")
+        # The tokens sent so far are void; the retry's tokens follow
+        reason = error.reason if isinstance(error, StreamAborted) else "invalid"
+        yield "retry", {"attempt": attempt + 2, "reason": reason}
+
+    usage = dict(usage)
+    token_budget.record(specs, usage_from_response(message)["output_tokens"], budget, truncated)
+    _record_usage(usage)
+    svg_content = await asyncio.to_thread(optimize_svg, svg_content)
+    if truncated or partial:
+        print("Streamed generation was cut off, returning it without storing or caching it")
+        yield "svg", GenerationResult(svg_content=svg_content, usage=usage, partial=True)
+        return
+    plan_id = await plan_store.asave(svg_content, specs)
+    result = await _check_quality(GenerationResult(svg_content=svg_content, usage=usage, plan_id=plan_id), specs)
+    if not rejected(result.quality):
+        await generation_cache.aset(key, svg_content)
+    yield "svg", result
+
+
+async def generate_batch(specs_list, concurrency_per_provider):
+    """Generate plans for many specs, yielding results as each completes.
+
+    Identical specs (by normalized cache key) are generated once and their
+    result is reported for every index that asked for it.
+
+    Yields:
+        `(indices, GenerationResult or Exception)` per unique spec.
+    """
+    limits = {name: asyncio.Semaphore(concurrency_per_provider) for name in provider_router.providers}
+
+    groups = {}
+    for index, specs in enumerate(specs_list):
+        group = (cache_key_for(specs), use_procedural(specs), specs.plan_id, specs.num_variants)
+        groups.setdefault(group, (specs, []))[1].append(index)
+
+    async def run(specs, indices):
+        try:
+            return indices, await generate_svg(specs, provider_limits=limits)
+        except Exception as e:
+            return indices, e
+
+    tasks = [asyncio.ensure_future(run(specs, indices)) for specs, indices in groups.values()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,716 @@
+"""Compact geometry model of a floor plan, parsed from its SVG.
+
+`FloorPlan.from_svg` reads a plan in one streaming (expat) pass into NumPy
+structured arrays, one row per shape:
+
+- `rects`: rooms, stairs, outlines, walls, windows and fixtures drawn as
+  rectangles (circles and ellipses are kept as their bounding box);
+- `segments`: lines and straight path segments (walls, windows, stair treads);
+- `doors`: door swings, i.e. circular arcs, by hinge, radius and angles;
+- `labels`: text, with the strings themselves in `texts`.
+
+Everything is in the root `<svg>`'s user units with transforms, nested
+`<svg>` viewports and `<use>` references applied. Each row carries a `kind`
+(see `KINDS`) and the `floor` it belongs to. Plans don't say what their
+shapes are, so kinds are inferred: a rectangle holding a text label is a
+room (or stairs, by its name), one holding several rooms is a floor outline,
+thin rectangles and thick lines are walls, short lines along a room edge are
+windows. `data-kind`/`data-floor` attributes, class names like the
+procedural renderer's and `floor-N` ids take precedence over the guesses.
+
+`FloorPlan.to_svg` writes the model back out with those attributes, so it
+parses back to the same arrays.
+"""
+import math
+import re
+from functools import lru_cache
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from app.ai.plan_store import PlanNotFound, plan_store
+from app.ai.svg_optimize import parse_path
+
+KINDS = ("other", "room", "stairs", "outline", "background", "wall", "window", "door", "fixture")
+KIND = {name: code for code, name in enumerate(KINDS)}
+# Class names (e.g. from `procedural`) that say what a shape is
+CLASS_KINDS = {
+    "room": "room", "open": "room", "stairs": "stairs", "plot": "outline", "outline": "outline",
+    "wall": "wall", "window": "window", "door": "door", "door-gap": "door",
+}
+
+RECT_DTYPE = np.dtype([
+    ("x", "f4"), ("y", "f4"), ("w", "f4"), ("h", "f4"), ("stroke", "f4"),
+    ("kind", "u1"), ("floor", "i1"), ("label", "i4"),
+])
+SEGMENT_DTYPE = np.dtype([
+    ("x1", "f4"), ("y1", "f4"), ("x2", "f4"), ("y2", "f4"), ("stroke", "f4"), ("kind", "u1"), ("floor", "i1"),
+])
+# Arc from angle a0 to a1 (degrees, a0 < a1, increasing angle = clockwise on screen)
+DOOR_DTYPE = np.dtype([("cx", "f4"), ("cy", "f4"), ("r", "f4"), ("a0", "f4"), ("a1", "f4"), ("floor", "i1")])
+LABEL_DTYPE = np.dtype([("x", "f4"), ("y", "f4"), ("size", "f4"), ("floor", "i1"), ("rect", "i4"), ("text", "i4")])
+
+# Lines at least this thick (in user units) are walls
+WALL_STROKE = 3.0
+# Rectangles at most this thin, and this elongated, are walls
+WALL_THICKNESS = 12.0
+WALL_ASPECT = 4.0
+# How far a line may be from a room edge and still lie on it
+EDGE_TOLERANCE = 2.0
+_STAIRS_RE = re.compile(r"\bstair", re.I)
+_FLOOR_ID_RE = re.compile(r"^floor-(\d+)$")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LENGTH_RE = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?:px)?\s*$")
+_TRANSFORM_RE = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_CSS_RULE_RE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_SIMPLE_SELECTOR_RE = re.compile(r"^([A-Za-z][\w-]*)?((?:\.[\w-]+)*)$")
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _multiply(m, n):
+    """The transform applying `n`, then `m`."""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2, a * c2 + c * d2, b * c2 + d * d2, a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def _apply(m, x, y):
+    return m[0] * x + m[2] * y + m[4], m[1] * x + m[3] * y + m[5]
+
+
+def _scale_of(m):
+    return math.sqrt(abs(m[0] * m[3] - m[1] * m[2]))
+
+
+def _parse_transform(value):
+    m = IDENTITY
+    for name, args in _TRANSFORM_RE.findall(value or ""):
+        n = [float(v) for v in _NUMBER_RE.findall(args)]
+        if name == "matrix" and len(n) == 6:
+            step = tuple(n)
+        elif name == "translate" and n:
+            step = (1.0, 0.0, 0.0, 1.0, n[0], n[1] if len(n) > 1 else 0.0)
+        elif name == "scale" and n:
+            step = (n[0], 0.0, 0.0, n[1] if len(n) > 1 else n[0], 0.0, 0.0)
+        elif name == "rotate" and n:
+            cos, sin = math.cos(math.radians(n[0])), math.sin(math.radians(n[0]))
+            step = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(n) == 3:
+                step = _multiply(_multiply((1.0, 0.0, 0.0, 1.0, n[1], n[2]), step), (1.0, 0.0, 0.0, 1.0, -n[1], -n[2]))
+        elif name == "skewX" and n:
+            step = (1.0, 0.0, math.tan(math.radians(n[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and n:
+            step = (1.0, math.tan(math.radians(n[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        m = _multiply(m, step)
+    return m
+
+
+def _length(value, default=0.0):
+    if not value:
+        return default
+    try:
+        return float(value)  # The usual case
+    except ValueError:
+        pass
+    match = _LENGTH_RE.match(value)
+    return float(match.group(1)) if match else default
+
+
+def _first_number(value):
+    match = _NUMBER_RE.search(value or "")
+    return float(match.group()) if match else 0.0
+
+
+def _viewport(attrs, nested):
+    """Transform from a `<svg>`'s viewBox to its parent's user units."""
+    numbers = [float(v) for v in _NUMBER_RE.findall(attrs.get("viewBox", ""))]
+    x, y = (_length(attrs.get("x")), _length(attrs.get("y"))) if nested else (0.0, 0.0)
+    if len(numbers) != 4 or numbers[2] <= 0 or numbers[3] <= 0 or not nested:
+        # The root's viewBox *is* the coordinate system plans are measured in
+        return (1.0, 0.0, 0.0, 1.0, x, y)
+    vx, vy, vw, vh = numbers
+    width, height = _length(attrs.get("width"), vw), _length(attrs.get("height"), vh)
+    sx, sy = width / vw, height / vh
+    if attrs.get("preserveAspectRatio", "").strip() != "none":
+        # xMidYMid meet
+        sx = sy = min(sx, sy)
+        x += (width - vw * sx) / 2
+        y += (height - vh * sy) / 2
+    return (sx, 0.0, 0.0, sy, x - vx * sx, y - vy * sy)
+
+
+def _css_rules(css):
+    """`(tag, classes, declarations)` for the rules with a simple selector (`rect`, `.wall`, `line.door`)."""
+    rules = []
+    for selectors, body in _CSS_RULE_RE.findall(css):
+        declarations = {}
+        for part in body.split(";"):
+            name, sep, value = part.partition(":")
+            if sep:
+                declarations[name.strip()] = value.strip()
+        for selector in selectors.split(","):
+            match = _SIMPLE_SELECTOR_RE.match(selector.strip())
+            if match and selector.strip():
+                rules.append((match.group(1), set(match.group(2).split(".")[1:]), declarations))
+    return rules
+
+
+def _arc_center(x1, y1, rx, ry, phi, large, sweep, x2, y2):
+    """Center of an SVG arc from its endpoint parameters (SVG 1.1, F.6.5)."""
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or (x1 == x2 and y1 == y2):
+        return None
+    cos, sin = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p, y1p = cos * dx + sin * dy, -sin * dx + cos * dy
+    scale = x1p * x1p / (rx * rx) + y1p * y1p / (ry * ry)
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    numerator = rx * rx * ry * ry - rx * rx * y1p * y1p - ry * ry * x1p * x1p
+    denominator = rx * rx * y1p * y1p + ry * ry * x1p * x1p
+    coef = math.sqrt(max(numerator / denominator, 0.0))
+    if large == sweep:
+        coef = -coef
+    cxp, cyp = coef * rx * y1p / ry, -coef * ry * x1p / rx
+    return cos * cxp - sin * cyp + (x1 + x2) / 2, sin * cxp + cos * cyp + (y1 + y2) / 2, rx, ry
+
+
+def _walk_path(commands):
+    """Yield ("line", x1, y1, x2, y2) and ("arc", x1, y1, rx, ry, phi, large, sweep, x2, y2) in absolute coordinates."""
+    x = y = start_x = start_y = 0.0
+    for command, args in commands:
+        relative = command.islower()
+        op = command.upper()
+        if op == "Z":
+            if (x, y) != (start_x, start_y):
+                yield ("line", x, y, start_x, start_y)
+            x, y = start_x, start_y
+            continue
+        step = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7}[op]
+        for i in range(0, len(args), step):
+            a = args[i:i + step]
+            if op == "H":
+                nx, ny = (x + a[0] if relative else a[0]), y
+            elif op == "V":
+                nx, ny = x, (y + a[0] if relative else a[0])
+            else:
+                nx, ny = a[-2], a[-1]
+                if relative:
+                    nx, ny = x + nx, y + ny
+            if op == "M" and i == 0:
+                start_x, start_y = nx, ny
+            elif op in "MLHV":
+                yield ("line", x, y, nx, ny)
+            elif op == "A":
+                yield ("arc", x, y, a[0], a[1], a[2], a[3], a[4], nx, ny)
+            # Curves only move the current point
+            x, y = nx, ny
+
+
+class _Frame:
+    __slots__ = ("tag", "ctm", "props", "floor", "capture", "in_defs")
+
+    def __init__(self, tag, ctm, props, floor, capture, in_defs):
+        self.tag = tag
+        self.ctm = ctm
+        self.props = props
+        self.floor = floor
+        self.capture = capture  # Id of the <defs> entry being recorded, if any
+        self.in_defs = in_defs
+
+
+class _Parser:
+    """Single expat pass collecting transformed primitives."""
+
+    def __init__(self):
+        self.view_box = None
+        self.rects = []  # (x, y, w, h, stroke, hint, floor)
+        self.segments = []  # (x1, y1, x2, y2, stroke, hint, floor)
+        self.doors = []  # (cx, cy, r, a0, a1, floor)
+        self.labels = []  # (x, y, size, floor, text)
+        self.texts = []
+        self.css = []
+        self.defs = {}  # id -> [(shape, attrs, ctm, props, hint)]
+        self.uses = []  # (href, ctm, props, floor)
+        self.stack = []
+        self._text = None  # (x, y, size, floor, parts) while inside <text>
+        self._style = None
+
+    def parse(self, svg_content):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.data
+        parser.Parse(svg_content.encode("utf-8"), True)
+        for href, ctm, props, floor in self.uses:
+            for shape, attrs, local_ctm, local_props, hint in self.defs.get(href, ()):
+                self.emit(shape, attrs, _multiply(ctm, local_ctm), {**props, **local_props}, hint, floor)
+
+    def _props(self, tag, attrs, inherited):
+        props = dict(inherited)
+        classes = set(attrs.get("class", "").split())
+        for key in ("stroke", "stroke-width", "font-size"):
+            if key in attrs:
+                props[key] = attrs[key]
+        for rule_tag, rule_classes, declarations in self.css:
+            if (rule_tag is None or rule_tag == tag) and rule_classes <= classes and (rule_tag or rule_classes):
+                props.update((k, v) for k, v in declarations.items() if k in ("stroke", "stroke-width", "font-size"))
+        for part in attrs.get("style", "").split(";"):
+            name, sep, value = part.partition(":")
+            if sep and name.strip() in ("stroke", "stroke-width", "font-size"):
+                props[name.strip()] = value.strip()
+        return props
+
+    def start(self, tag, attrs):
+        parent = self.stack[-1] if self.stack else None
+        if parent is None:
+            numbers = [float(v) for v in _NUMBER_RE.findall(attrs.get("viewBox", ""))]
+            if len(numbers) == 4:
+                self.view_box = tuple(numbers)
+            else:
+                self.view_box = (0.0, 0.0, _length(attrs.get("width"), 0.0), _length(attrs.get("height"), 0.0))
+            frame = _Frame(tag, _parse_transform(attrs.get("transform")), self._props(tag, attrs, {}), -1, None, False)
+            self.stack.append(frame)
+            return
+
+        ctm, floor, capture, in_defs = parent.ctm, parent.floor, parent.capture, parent.in_defs
+        props = parent.props
+        if in_defs and capture is None and "id" in attrs:
+            # Recorded in its own coordinates and style; placed by <use>
+            capture, ctm, props = attrs["id"], IDENTITY, {}
+            self.defs[capture] = []
+        if tag == "svg":
+            ctm = _multiply(ctm, _viewport(attrs, nested=True))
+        if "transform" in attrs:
+            ctm = _multiply(ctm, _parse_transform(attrs["transform"]))
+        match = _FLOOR_ID_RE.match(attrs.get("id", ""))
+        if match:
+            floor = int(match.group(1))
+        elif attrs.get("data-floor", "").lstrip("-").isdigit():
+            floor = int(attrs["data-floor"])
+        if attrs.keys() & {"stroke", "stroke-width", "font-size", "style", "class"} or self.css:
+            props = self._props(tag, attrs, props)
+        frame = _Frame(tag, ctm, props, floor, capture, in_defs or tag in ("defs", "symbol"))
+        self.stack.append(frame)
+
+        hint = attrs.get("data-kind")
+        if hint not in KIND:
+            hint = next((CLASS_KINDS[c] for c in attrs.get("class", "").split() if c in CLASS_KINDS), None)
+        if tag == "style":
+            self._style = []
+        elif tag == "text":
+            # x and y may be lists, one position per character
+            px, py = _apply(ctm, _first_number(attrs.get("x")), _first_number(attrs.get("y")))
+            size = _length(props.get("font-size"), 16.0) * _scale_of(ctm)
+            self._text = (px, py, size, floor, [])
+        elif tag == "use":
+            href = attrs.get("xlink:href") or attrs.get("href") or ""
+            if href.startswith("#"):
+                placed = _multiply(ctm, (1.0, 0.0, 0.0, 1.0, _length(attrs.get("x")), _length(attrs.get("y"))))
+                self.uses.append((href[1:], placed, props, floor))
+        elif tag in ("rect", "line", "path", "polyline", "polygon", "circle", "ellipse"):
+            if capture is not None:
+                self.defs[capture].append((tag, attrs, ctm, props, hint))
+            elif not frame.in_defs:
+                self.emit(tag, attrs, ctm, props, hint, floor)
+
+    def end(self, tag):
+        self.stack.pop()
+        if tag == "style" and self._style is not None:
+            self.css.extend(_css_rules("".join(self._style)))
+            self._style = None
+        elif tag == "text" and self._text is not None:
+            x, y, size, floor, parts = self._text
+            text = " ".join("".join(parts).split())
+            if text and not (self.stack and self.stack[-1].in_defs):
+                self.labels.append((x, y, size, floor, len(self.texts)))
+                self.texts.append(text)
+            self._text = None
+
+    def data(self, text):
+        if self._text is not None:
+            self._text[4].append(text)
+        elif self._style is not None:
+            self._style.append(text)
+
+    def emit(self, tag, attrs, ctm, props, hint, floor):
+        scale = _scale_of(ctm)
+        stroke = 0.0 if props.get("stroke", "none") == "none" else _length(props.get("stroke-width"), 1.0) * scale
+        if tag in ("rect", "circle", "ellipse"):
+            if tag == "rect":
+                x, y = _length(attrs.get("x")), _length(attrs.get("y"))
+                w, h = _length(attrs.get("width")), _length(attrs.get("height"))
+            else:
+                rx = _length(attrs.get("r")) if tag == "circle" else _length(attrs.get("rx"))
+                ry = _length(attrs.get("r")) if tag == "circle" else _length(attrs.get("ry"))
+                x, y, w, h = _length(attrs.get("cx")) - rx, _length(attrs.get("cy")) - ry, 2 * rx, 2 * ry
+                hint = hint or "fixture"
+            if w <= 0 or h <= 0:
+                return
+            corners = [_apply(ctm, x, y), _apply(ctm, x + w, y), _apply(ctm, x, y + h), _apply(ctm, x + w, y + h)]
+            xs, ys = [c[0] for c in corners], [c[1] for c in corners]
+            self.rects.append((min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys), stroke, hint, floor))
+        elif tag == "line":
+            x1, y1 = _apply(ctm, _length(attrs.get("x1")), _length(attrs.get("y1")))
+            x2, y2 = _apply(ctm, _length(attrs.get("x2")), _length(attrs.get("y2")))
+            self.segments.append((x1, y1, x2, y2, stroke, hint, floor))
+        elif tag in ("polyline", "polygon"):
+            values = [float(v) for v in _NUMBER_RE.findall(attrs.get("points", ""))]
+            points = [_apply(ctm, values[i], values[i + 1]) for i in range(0, len(values) - 1, 2)]
+            if tag == "polygon" and len(points) > 2:
+                points.append(points[0])
+            for (x1, y1), (x2, y2) in zip(points, points[1:]):
+                self.segments.append((x1, y1, x2, y2, stroke, hint, floor))
+        elif tag == "path":
+            commands = parse_path(attrs.get("d", ""))
+            if not commands:
+                return
+            pieces = list(_walk_path(commands))
+            arcs = [p for p in pieces if p[0] == "arc"]
+            if arcs:
+                # A door symbol: the swing plus, usually, the leaf
+                for arc in arcs:
+                    self._emit_door(arc, ctm, floor)
+                return
+            for _, x1, y1, x2, y2 in pieces:
+                (x1, y1), (x2, y2) = _apply(ctm, x1, y1), _apply(ctm, x2, y2)
+                self.segments.append((x1, y1, x2, y2, stroke, hint, floor))
+
+    def _emit_door(self, arc, ctm, floor):
+        _, x1, y1, rx, ry, phi, large, sweep, x2, y2 = arc
+        center = _arc_center(x1, y1, rx, ry, phi, large, sweep, x2, y2)
+        if center is None:
+            return
+        cx, cy, rx, ry = center
+        (cx, cy), (x1, y1), (x2, y2) = _apply(ctm, cx, cy), _apply(ctm, x1, y1), _apply(ctm, x2, y2)
+        r = (rx + ry) / 2 * _scale_of(ctm)
+        a0 = math.degrees(math.atan2(y1 - cy, x1 - cx))
+        a1 = math.degrees(math.atan2(y2 - cy, x2 - cx))
+        mirrored = ctm[0] * ctm[3] - ctm[1] * ctm[2] < 0
+        if bool(sweep) == mirrored:
+            a0, a1 = a1, a0  # Swept towards decreasing angles
+        while a1 <= a0:
+            a1 += 360.0
+        self.doors.append((cx, cy, r, a0, a1, floor))
+
+
+class FloorPlan:
+    """Shapes of a floor plan in NumPy structured arrays; see the module docstring."""
+
+    __slots__ = ("view_box", "rects", "segments", "doors", "labels", "texts")
+
+    def __init__(self, view_box, rects, segments, doors, labels, texts):
+        self.view_box = view_box
+        self.rects = rects
+        self.segments = segments
+        self.doors = doors
+        self.labels = labels
+        self.texts = texts
+
+    @classmethod
+    def from_svg(cls, svg_content):
+        """Parse a plan.
+
+        Raises:
+            ValueError: If `svg_content` isn't well-formed XML.
+        """
+        parser = _Parser()
+        try:
+            parser.parse(svg_content)
+        except expat.ExpatError as e:
+            raise ValueError(f"Not a well-formed SVG: {e}") from e
+        rects = np.zeros(len(parser.rects), RECT_DTYPE)
+        hints = []
+        for i, (x, y, w, h, stroke, hint, floor) in enumerate(parser.rects):
+            rects[i] = (x, y, w, h, stroke, 0, floor, -1)
+            hints.append(hint)
+        segments = np.zeros(len(parser.segments), SEGMENT_DTYPE)
+        segment_hints = []
+        for i, (x1, y1, x2, y2, stroke, hint, floor) in enumerate(parser.segments):
+            segments[i] = (x1, y1, x2, y2, stroke, 0, floor)
+            segment_hints.append(hint)
+        doors = np.array(parser.doors, DOOR_DTYPE) if parser.doors else np.zeros(0, DOOR_DTYPE)
+        labels = np.zeros(len(parser.labels), LABEL_DTYPE)
+        for i, (x, y, size, floor, text) in enumerate(parser.labels):
+            labels[i] = (x, y, size, floor, -1, text)
+        plan = cls(parser.view_box or (0.0, 0.0, 0.0, 0.0), rects, segments, doors, labels, parser.texts)
+        plan._classify(hints, segment_hints)
+        return plan
+
+    def _classify(self, hints, segment_hints):
+        rects, labels, segments = self.rects, self.labels, self.segments
+        hinted = np.array([h is not None for h in hints], bool)
+        rects["kind"][hinted] = [KIND[h] for h in hints if h is not None]
+
+        # A rectangle covering the canvas is the background
+        vx, vy, vw, vh = self.view_box
+        covers = (rects["w"] * rects["h"] >= 0.95 * vw * vh) & (rects["x"] <= vx + 1) & (rects["y"] <= vy + 1)
+        rects["kind"][covers & ~hinted] = KIND["background"]
+        # Rectangles known to be something else (fixtures, windows...) can't be rooms
+        candidates = ~hinted & (rects["kind"] != KIND["background"]) | np.isin(rects["kind"], (KIND["room"], KIND["stairs"]))
+
+        # Each label belongs to the smallest rectangle around it
+        if len(labels) and len(rects):
+            inside = (
+                (labels["x"][:, None] >= rects["x"]) & (labels["x"][:, None] <= rects["x"] + rects["w"])
+                & (labels["y"][:, None] >= rects["y"]) & (labels["y"][:, None] <= rects["y"] + rects["h"])
+                & candidates
+            )
+            area = np.where(inside, rects["w"] * rects["h"], np.inf)
+            # Furniture drawn around a label (a bed icon) has a lighter stroke than room walls
+            if inside.any():
+                typical = np.median(rects["stroke"][inside.any(axis=0)])
+                walled = np.where(inside & (rects["stroke"] >= typical), area, np.inf)
+                area = np.where(np.isfinite(walled).any(axis=1)[:, None], walled, area)
+            smallest = area.argmin(axis=1)
+            labels["rect"] = np.where(inside.any(axis=1), smallest, -1)
+            labelled = labels["rect"] >= 0
+            # The first label inside a rectangle is its name
+            first = np.full(len(rects), -1, np.int64)
+            for i in np.flatnonzero(labelled)[::-1]:
+                first[labels["rect"][i]] = i
+            rects["label"] = first
+            unhinted_named = (first >= 0) & ~hinted & candidates
+            for i in np.flatnonzero(unhinted_named):
+                is_stairs = _STAIRS_RE.search(self.texts[labels["text"][first[i]]])
+                rects["kind"][i] = KIND["stairs"] if is_stairs else KIND["room"]
+
+        # Rectangles holding several rooms are floor outlines
+        rooms = np.isin(rects["kind"], (KIND["room"], KIND["stairs"]))
+        if rooms.sum() >= 2:
+            cx = rects["x"][rooms] + rects["w"][rooms] / 2
+            cy = rects["y"][rooms] + rects["h"][rooms] / 2
+            holds = (
+                (cx >= rects["x"][:, None]) & (cx <= (rects["x"] + rects["w"])[:, None])
+                & (cy >= rects["y"][:, None]) & (cy <= (rects["y"] + rects["h"])[:, None])
+            ).sum(axis=1) - rooms
+            container = (holds >= 2) & (rects["kind"] != KIND["background"]) & ~hinted
+            rects["kind"][container] = KIND["outline"]
+            rects["label"][container] = -1
+            if len(labels):
+                labels["rect"][np.isin(labels["rect"], np.flatnonzero(container))] = -1
+
+        free = (rects["kind"] == KIND["other"]) & ~hinted
+        thin = np.minimum(rects["w"], rects["h"])
+        elongated = np.maximum(rects["w"], rects["h"]) >= WALL_ASPECT * np.maximum(thin, 1e-6)
+        rects["kind"][free & (thin <= WALL_THICKNESS) & elongated] = KIND["wall"]
+        rects["kind"][(rects["kind"] == KIND["other"]) & ~hinted] = KIND["fixture"]
+
+        self._assign_floors()
+        self._classify_segments(segment_hints)
+        if len(labels):
+            labels["floor"] = np.where(
+                (labels["floor"] < 0) & (labels["rect"] >= 0), rects["floor"][np.maximum(labels["rect"], 0)], labels["floor"]
+            )
+
+    def _assign_floors(self):
+        """Give shapes without a floor the floor of the outline around them."""
+        rects = self.rects
+        outlines = np.flatnonzero(rects["kind"] == KIND["outline"])
+        # Innermost outlines only: a sheet may frame the floors once more
+        if len(outlines) > 1:
+            ox, oy, ow, oh = (rects[f][outlines] for f in ("x", "y", "w", "h"))
+            holds_other = (
+                (ox[:, None] <= ox) & (oy[:, None] <= oy) & (ox[:, None] + ow[:, None] >= ox + ow)
+                & (oy[:, None] + oh[:, None] >= oy + oh) & ~np.eye(len(outlines), dtype=bool)
+            ).any(axis=1)
+            outlines = outlines[~holds_other]
+        if not len(outlines):
+            for array in (rects, self.segments, self.doors, self.labels):
+                array["floor"][array["floor"] < 0] = 0
+            return
+        # Floors are drawn top to bottom or left to right
+        order = np.lexsort((rects["x"][outlines], np.round(rects["y"][outlines] / 10)))
+        outlines = outlines[order]
+        unassigned_outlines = rects["floor"][outlines] < 0
+        rects["floor"][outlines[unassigned_outlines]] = np.flatnonzero(unassigned_outlines)
+
+        def floor_at(x, y):
+            inside = (
+                (x[:, None] >= rects["x"][outlines]) & (x[:, None] <= rects["x"][outlines] + rects["w"][outlines])
+                & (y[:, None] >= rects["y"][outlines]) & (y[:, None] <= rects["y"][outlines] + rects["h"][outlines])
+            )
+            return np.where(inside.any(axis=1), rects["floor"][outlines][inside.argmax(axis=1)], 0)
+
+        for array, x, y in (
+            (rects, rects["x"] + rects["w"] / 2, rects["y"] + rects["h"] / 2),
+            (self.segments, (self.segments["x1"] + self.segments["x2"]) / 2, (self.segments["y1"] + self.segments["y2"]) / 2),
+            (self.doors, self.doors["cx"], self.doors["cy"]),
+        ):
+            missing = array["floor"] < 0
+            if missing.any():
+                array["floor"][missing] = floor_at(x[missing], y[missing])
+        labels = self.labels
+        missing = (labels["floor"] < 0) & (labels["rect"] < 0)
+        if missing.any():
+            labels["floor"][missing] = floor_at(labels["x"][missing], labels["y"][missing])
+
+    def _classify_segments(self, hints):
+        segments, rects = self.segments, self.rects
+        if not len(segments):
+            return
+        hinted = np.array([h is not None for h in hints], bool)
+        segments["kind"][hinted] = [KIND[h] for h in hints if h is not None]
+        free = ~hinted
+        mx, my = (segments["x1"] + segments["x2"]) / 2, (segments["y1"] + segments["y2"]) / 2
+
+        stairs = rects[rects["kind"] == KIND["stairs"]]
+        if len(stairs):
+            in_stairs = (
+                (mx[:, None] >= stairs["x"]) & (mx[:, None] <= stairs["x"] + stairs["w"])
+                & (my[:, None] >= stairs["y"]) & (my[:, None] <= stairs["y"] + stairs["h"])
+            ).any(axis=1)
+            segments["kind"][free & in_stairs] = KIND["stairs"]
+            free &= ~in_stairs
+
+        # A short line along a room or outline edge is an opening in it
+        boxes = rects[np.isin(rects["kind"], (KIND["room"], KIND["outline"]))]
+        if len(boxes):
+            length = np.hypot(segments["x2"] - segments["x1"], segments["y2"] - segments["y1"])
+            horizontal = np.abs(segments["y1"] - segments["y2"]) <= EDGE_TOLERANCE
+            vertical = np.abs(segments["x1"] - segments["x2"]) <= EDGE_TOLERANCE
+            lo_x, hi_x = np.minimum(segments["x1"], segments["x2"]), np.maximum(segments["x1"], segments["x2"])
+            lo_y, hi_y = np.minimum(segments["y1"], segments["y2"]), np.maximum(segments["y1"], segments["y2"])
+            bx, by, bw, bh = boxes["x"], boxes["y"], boxes["w"], boxes["h"]
+            t = EDGE_TOLERANCE
+            on_horizontal_edge = (
+                horizontal[:, None]
+                & ((np.abs(my[:, None] - by) <= t) | (np.abs(my[:, None] - (by + bh)) <= t))
+                & (lo_x[:, None] >= bx - t) & (hi_x[:, None] <= bx + bw + t)
+                & (length[:, None] < 0.9 * bw)
+            )
+            on_vertical_edge = (
+                vertical[:, None]
+                & ((np.abs(mx[:, None] - bx) <= t) | (np.abs(mx[:, None] - (bx + bw)) <= t))
+                & (lo_y[:, None] >= by - t) & (hi_y[:, None] <= by + bh + t)
+                & (length[:, None] < 0.9 * bh)
+            )
+            opening = (on_horizontal_edge | on_vertical_edge).any(axis=1) & (length > 2 * t)
+            segments["kind"][free & opening] = KIND["window"]
+            free &= ~opening
+        segments["kind"][free & (segments["stroke"] >= WALL_STROKE)] = KIND["wall"]
+
+    @property
+    def floors(self):
+        """Number of floors."""
+        values = [a["floor"].max() for a in (self.rects, self.segments, self.doors, self.labels) if len(a)]
+        return int(max(values)) + 1 if values else 0
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.rects, self.segments, self.doors, self.labels)) + sum(len(t) for t in self.texts)
+
+    def name(self, rect_index):
+        """Name of a rectangle (its first label), or None."""
+        label = self.rects["label"][rect_index]
+        return self.texts[self.labels["text"][label]] if label >= 0 else None
+
+    def rooms(self, floor=None):
+        """Indices into `rects` of the rooms (and stairs), optionally of one floor."""
+        mask = np.isin(self.rects["kind"], (KIND["room"], KIND["stairs"]))
+        if floor is not None:
+            mask &= self.rects["floor"] == floor
+        return np.flatnonzero(mask)
+
+    def bbox(self):
+        """`(x, y, width, height)` around everything drawn but the background."""
+        xs, ys = [], []
+        drawn = self.rects[self.rects["kind"] != KIND["background"]]
+        xs += [drawn["x"], drawn["x"] + drawn["w"]]
+        ys += [drawn["y"], drawn["y"] + drawn["h"]]
+        xs += [self.segments["x1"], self.segments["x2"]]
+        ys += [self.segments["y1"], self.segments["y2"]]
+        xs += [self.doors["cx"] - self.doors["r"], self.doors["cx"] + self.doors["r"]]
+        ys += [self.doors["cy"] - self.doors["r"], self.doors["cy"] + self.doors["r"]]
+        xs, ys = np.concatenate(xs), np.concatenate(ys)
+        if not len(xs):
+            return (0.0, 0.0, 0.0, 0.0)
+        return (float(xs.min()), float(ys.min()), float(xs.max() - xs.min()), float(ys.max() - ys.min()))
+
+    def to_dict(self):
+        """JSON-friendly summary: rooms with their areas, per floor."""
+        rooms = []
+        for i in self.rooms():
+            rect = self.rects[i]
+            rooms.append({
+                "name": self.name(i),
+                "kind": KINDS[rect["kind"]],
+                "floor": int(rect["floor"]),
+                "x": round(float(rect["x"]), 2),
+                "y": round(float(rect["y"]), 2),
+                "width": round(float(rect["w"]), 2),
+                "height": round(float(rect["h"]), 2),
+                "area": round(float(rect["w"] * rect["h"]), 2),
+            })
+        counts = {}
+        for array in (self.rects, self.segments):
+            for code, count in zip(*np.unique(array["kind"], return_counts=True)):
+                counts[KINDS[code]] = counts.get(KINDS[code], 0) + int(count)
+        counts["door"] = counts.get("door", 0) + len(self.doors)
+        return {
+            "view_box": [float(v) for v in self.view_box],
+            "bbox": [round(v, 2) for v in self.bbox()],
+            "floors": self.floors,
+            "rooms": rooms,
+            "counts": counts,
+        }
+
+    def to_svg(self):
+        """Serialize back to SVG, marking every shape's kind and floor."""
+        def fmt(value):
+            return np.format_float_positional(np.float32(value), trim="-")
+
+        def stroke(width):
+            return f' stroke="#000" stroke-width="{fmt(width)}"/>' if width > 0 else "/>"
+
+        view_box = " ".join(fmt(v) for v in self.view_box)
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{view_box}">']
+        for rect in self.rects:
+            parts.append(
+                f'<rect data-kind="{KINDS[rect["kind"]]}" data-floor="{rect["floor"]}" x="{fmt(rect["x"])}" y="{fmt(rect["y"])}" '
+                f'width="{fmt(rect["w"])}" height="{fmt(rect["h"])}" fill="none"' + stroke(rect["stroke"])
+            )
+        for seg in self.segments:
+            parts.append(
+                f'<line data-kind="{KINDS[seg["kind"]]}" data-floor="{seg["floor"]}" x1="{fmt(seg["x1"])}" y1="{fmt(seg["y1"])}" '
+                f'x2="{fmt(seg["x2"])}" y2="{fmt(seg["y2"])}"' + stroke(seg["stroke"])
+            )
+        for door in self.doors:
+            cx, cy, r, a0, a1 = (float(door[f]) for f in ("cx", "cy", "r", "a0", "a1"))
+            x0, y0 = cx + r * math.cos(math.radians(a0)), cy + r * math.sin(math.radians(a0))
+            x1, y1 = cx + r * math.cos(math.radians(a1)), cy + r * math.sin(math.radians(a1))
+            large = 1 if a1 - a0 > 180 else 0
+            # The leaf, then the swing
+            parts.append(
+                f'<path data-kind="door" data-floor="{door["floor"]}" d="M{fmt(cx)} {fmt(cy)}L{fmt(x0)} {fmt(y0)}'
+                f'A{fmt(r)} {fmt(r)} 0 {large} 1 {fmt(x1)} {fmt(y1)}" fill="none" stroke="#000"/>'
+            )
+        for label in self.labels:
+            parts.append(
+                f'<text data-floor="{label["floor"]}" x="{fmt(label["x"])}" y="{fmt(label["y"])}" font-size="{fmt(label["size"])}">'
+                f'{escape(self.texts[label["text"]])}</text>'
+            )
+        parts.append("</svg>")
+        return "".join(parts)
+
+
+def load_floor_plan(plan_id):
+    """Parsed geometry of a stored plan (plans never change, so it is cached), or None."""
+    try:
+        return _load_floor_plan(plan_id)
+    except PlanNotFound:
+        # Not cached: the plan may be stored later
+        return None
+
+
+@lru_cache(maxsize=256)
+def _load_floor_plan(plan_id):
+    svg_content = plan_store.load_svg(plan_id)
+    if svg_content is None:
+        raise PlanNotFound(plan_id)
+    return FloorPlan.from_svg(svg_content)
@@ -0,0 +1,169 @@
+"""Compact layout format the model can write instead of SVG.
+
+Most of a generated SVG is markup around a handful of rectangles and labels.
+With `mode="layout"` the model writes one short line per element instead and
+the server draws the plan (see `procedural.render_layout`), which takes a
+fraction of the output tokens:
+
+    P 25 45                     plot width and depth, in feet
+    F Ground Floor              starts a floor, ground floor first
+    R 4 0 12.5 14 Drawing Room  room: x y width height name, in feet from the
+                                plot's top-left corner, street along the bottom
+    S 0 0 4 12                  staircase: x y width height
+    D 2 N 1.5                   door in the floor's 2nd room, on its N/S/E/W
+                                wall, 1.5 ft from the wall's top/left end
+    W 2 E 3                     window, placed like a door
+    END
+
+The parsed layout is stored with the plan as structured data.
+"""
+import math
+import re
+from collections import Counter
+
+from app.ai.procedural import DOOR_WIDTH, FLOOR_NAMES, WINDOW_WIDTH
+
+# The model stops at the closing line; nothing after it is used
+LAYOUT_STOP_SEQUENCES = ["\nEND"]
+# How far (in feet) a room may overshoot the plot before the layout is rejected;
+# smaller overshoots are clipped
+PLOT_TOLERANCE = 2.0
+WALLS = ("N", "S", "E", "W")
+
+_FENCE_RE = re.compile(r"^`{3}")
+
+layout_stats = Counter()
+
+
+class InvalidLayout(ValueError):
+    """A layout that can't be drawn."""
+
+
+def use_layout(specs):
+    """Whether `specs` asks the model for a layout rather than SVG."""
+    return specs.mode == "layout"
+
+
+def _numbers(fields, count, line_number):
+    try:
+        values = [float(field) for field in fields[:count]]
+    except ValueError:
+        raise InvalidLayout(f"Line {line_number}: expected {count} numbers, got {' '.join(fields[:count])!r}")
+    if len(values) < count:
+        raise InvalidLayout(f"Line {line_number}: expected {count} numbers")
+    if not all(math.isfinite(value) for value in values):
+        raise InvalidLayout(f"Line {line_number}: expected {count} finite numbers, got {' '.join(fields[:count])!r}")
+    return values
+
+
+def _rect(fields, width, depth, line_number):
+    x, y, w, h = _numbers(fields, 4, line_number)
+    if w <= 0 or h <= 0:
+        raise InvalidLayout(f"Line {line_number}: width and height must be positive")
+    if x < -PLOT_TOLERANCE or y < -PLOT_TOLERANCE or x + w > width + PLOT_TOLERANCE or y + h > depth + PLOT_TOLERANCE:
+        raise InvalidLayout(f"Line {line_number}: ({x:g}, {y:g}, {w:g}, {h:g}) is outside the {width:g} x {depth:g} ft plot")
+    x0, y0 = max(x, 0.0), max(y, 0.0)
+    x1, y1 = min(x + w, width), min(y + h, depth)
+    if (x0, y0, x1, y1) != (x, y, x + w, y + h):
+        layout_stats["clipped"] += 1
+    return {"x": x0, "y": y0, "w": x1 - x0, "h": y1 - y0}
+
+
+def _opening(fields, line_number):
+    if len(fields) < 3:
+        raise InvalidLayout(f"Line {line_number}: expected a room number, a wall and an offset")
+    wall = fields[1].upper()
+    if wall not in WALLS:
+        raise InvalidLayout(f"Line {line_number}: wall must be one of {', '.join(WALLS)}, got {fields[1]!r}")
+    room, offset = _numbers([fields[0], fields[2]], 2, line_number)
+    if not room.is_integer():
+        raise InvalidLayout(f"Line {line_number}: room number must be a whole number, got {fields[0]!r}")
+    return {"room": int(room) - 1, "wall": wall, "offset": offset, "line": line_number}
+
+
+def _place_openings(floor, kind, size):
+    """Resolve the openings' room numbers and keep them on their wall."""
+    placed = []
+    for opening in floor[kind]:
+        if not 0 <= opening["room"] < len(floor["rooms"]):
+            raise InvalidLayout(f"Line {opening['line']}: {floor['name']} has no room {opening['room'] + 1}")
+        room = floor["rooms"][opening["room"]]
+        length = room["w"] if opening["wall"] in ("N", "S") else room["h"]
+        if length < size:
+            layout_stats["dropped_openings"] += 1
+            continue
+        offset = min(max(opening["offset"], 0.0), length - size)
+        placed.append({"room": opening["room"], "wall": opening["wall"], "offset": offset})
+    floor[kind] = placed
+
+
+def parse_layout(text, plot, truncated=False):
+    """Parse and validate a layout written by the model.
+
+    Args:
+        text: The model's reply. Code fences and chatter around the layout
+            lines are ignored.
+        plot: `(width, depth)` of the plot in feet, used if the layout has
+            no `P` line.
+        truncated: Whether the reply was cut off by the token limit; its
+            last, possibly partial, line is then dropped.
+
+    Returns:
+        A JSON-friendly dict: `plot` and `floors`, each floor with its
+        `name`, `rooms`, `stairs`, `doors` and `windows`.
+
+    Raises:
+        InvalidLayout: If the layout has no rooms, or a line can't be drawn.
+    """
+    try:
+        layout = _parse_layout(text, plot, truncated)
+    except InvalidLayout:
+        layout_stats["invalid"] += 1
+        raise
+    layout_stats["parsed"] += 1
+    return layout
+
+
+def _parse_layout(text, plot, truncated):
+    lines = text.splitlines()
+    if truncated and lines:
+        lines = lines[:-1]
+        layout_stats["truncated"] += 1
+    width, depth = plot
+    floors = []
+    for line_number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or _FENCE_RE.match(fields[0]):
+            continue
+        command, fields = fields[0].upper(), fields[1:]
+        if command == "END":
+            break
+        if command == "P":
+            width, depth = _numbers(fields, 2, line_number)
+            if width <= 0 or depth <= 0:
+                raise InvalidLayout(f"Line {line_number}: the plot must have a positive size")
+        elif command == "F":
+            floors.append({"name": " ".join(fields) or None, "rooms": [], "stairs": [], "doors": [], "windows": []})
+        elif command in ("R", "S", "D", "W"):
+            if not floors:
+                floors.append({"name": None, "rooms": [], "stairs": [], "doors": [], "windows": []})
+            floor = floors[-1]
+            if command == "R":
+                name = " ".join(fields[4:]) or f"Room {len(floor['rooms']) + 1}"
+                floor["rooms"].append({"name": name, **_rect(fields, width, depth, line_number)})
+            elif command == "S":
+                floor["stairs"].append(_rect(fields, width, depth, line_number))
+            else:
+                floor["doors" if command == "D" else "windows"].append(_opening(fields, line_number))
+        else:
+            layout_stats["ignored_lines"] += 1
+
+    floors = [floor for floor in floors if floor["rooms"] or floor["stairs"]]
+    if not any(floor["rooms"] for floor in floors):
+        raise InvalidLayout("The layout has no rooms")
+    for level, floor in enumerate(floors):
+        if floor["name"] is None:
+            floor["name"] = FLOOR_NAMES[level] if level < len(FLOOR_NAMES) else f"Floor {level + 1}"
+        _place_openings(floor, "doors", DOOR_WIDTH)
+        _place_openings(floor, "windows", WINDOW_WIDTH)
+    return {"plot": {"width": width, "depth": depth}, "floors": floors}
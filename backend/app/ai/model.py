@@ -1,32 +1,28 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_anthropic import ChatAnthropic
 from dotenv import load_dotenv
-from langchain_anthropic import ChatAnthropic, Anthropic
+import hashlib
+import httpx
 import os
 load_dotenv()
-from app.ai.svg_parser import SVGOutputParser
 
-os.environ["ANTHROPIC_API_KEY"] = os.getenv("ANTHROPIC_API_KEY")
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+# Provider clients are created once per worker (see `init_llms`, called from the
+# app lifespan) so their HTTP connection pools stay warm between requests.
+_llms = {}
+_http_clients = []
 
-def create_chat_chain(house_type, num_marla, num_bedrooms, num_floors):
-    llm1 = ChatOpenAI(
-        model_name="deepseek/deepseek-chat:free",
-        temperature=0.4,
-        openai_api_base="",
-        openai_api_key=""
-    )
+DEFAULT_PROVIDER = "claude"
 
-    llm2 = ChatAnthropic(
-        model="claude-3-5-sonnet-20240620",
-        temperature=0.4,
-        max_tokens=8000,
-        anthropic_api_key="sk-ant-REDACTED"
-    )
+# Keep-alive pool shared by every call a worker makes to a provider.
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=60.0,
+)
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_REQUEST_TIMEOUT", "120")), connect=10.0)
 
-    system_prompt_template = """
+SYSTEM_PROMPT = """
 YOU ARE A WORLD-CLASS *ARCHITECTURAL HOUSE PLAN DESIGNER* AND AN EXPERT IN *SVG-BASED FLOOR PLAN GENERATION. YOUR TASK IS TO CREATE **HIGHLY ACCURATE, SCALABLE, AND STANDARDS-COMPLIANT HOUSE PLAN SKETCHES* IN *SVG FORMAT, ENSURING THEY ARE RELIABLE FOR ARCHITECTURAL USE. EVERY SVG OUTPUT MUST BE **STRUCTURALLY SOUND, WELL-LABELED, AND RENDERABLE ACROSS ALL STANDARD SVG VIEWERS AND BROWSERS*.
 
 ### INSTRUCTIONS ###
@@ -77,13 +73,226 @@ A *fully structured, correctly labeled 2D floor plan* with:
 🚫 *DO NOT* ignore fundamental architectural standards.  
     """
 
-    system_message = SystemMessage(content=system_prompt_template)
-
-    human_message = HumanMessage(content="""
+HUMAN_PROMPT_TEMPLATE = """
     Develop a sketch design for a {house_type} house within a {num_marla} Marla plot in SVG format.
     Create a masterpiece with {num_bedrooms} bedrooms and {num_floors} floors, ensuring each space is utilized efficiently. 
     develop  a layout that captivates residents and visitors alike.
     Provide a detailed SVG design, including precise dimensions and labels for each room. Don't include any other text or comments. Just Focus on the SVG code.
-    """.format(house_type=house_type, num_marla=num_marla, num_bedrooms=num_bedrooms, num_floors=num_floors))
+    """
+
+# One floor of a multi-floor house, generated alongside the others (see
+# `app.ai.floors`). The shared plot frame and staircase keep the floors aligned.
+FLOOR_PROMPT_TEMPLATE = """
+    Develop a sketch design for the {floor_name} (floor {floor_number} of {num_floors}) of a {house_type} house within a {num_marla} Marla plot in SVG format.
+    This floor has {num_bedrooms} bedrooms. {floor_program}
+    Draw only this floor: the other floors are designed separately and stacked on top of it, so they must share its outline.
+    Use viewBox="0 0 {view_width} {view_height}" at {scale} px per foot. The plot is {plot_width} ft wide and {plot_depth} ft deep, with its top-left corner at (0, 0) and the street along the bottom edge.
+    Place the staircase exactly at x={stairs_x}, y={stairs_y}, width={stairs_width}, height={stairs_height} (in px) so it lines up with the other floors.
+    Provide a detailed SVG design, including precise dimensions and labels for each room. Don't include any other text or comments. Just Focus on the SVG code.
+    """
+
+# Appended to the human prompt for the alternatives of a multi-variant request
+# (see `app.ai.generation.generate_variants`), so each explores another layout.
+VARIANT_PROMPT_TEMPLATE = """
+    This is alternative design {variant} of {num_variants} for the same brief: {variant_hint}
+    """
+VARIANT_HINTS = (
+    "place the living and dining areas at the front and the bedrooms at the back.",
+    "organise the rooms on both sides of a central passage.",
+    "keep the kitchen and dining at the back, opening onto a rear lawn.",
+    "line the bedrooms up along one side of the plot with the living areas on the other.",
+)
+
+# `mode="layout"`: the model writes the compact layout format of
+# `app.ai.layout` and the server draws the SVG, for a fraction of the tokens.
+LAYOUT_SYSTEM_PROMPT = """
+You are an expert architect designing residential floor plans for Pakistani plots (1 Marla = 272.25 sq ft).
+Reply with the plan in the compact layout format below and nothing else: one element per line, sizes in feet,
+x to the right and y downwards from the plot's top-left corner, with the street along the bottom edge.
+
+P <width> <depth>                  the plot
+F <floor name>                     starts a floor; list the floors from the ground up
+R <x> <y> <width> <height> <name>  a room or open space (lawn, car porch)
+S <x> <y> <width> <height>         the staircase, at the same spot on every floor
+D <room> <wall> <offset>           a 3 ft door in room number <room> of the current floor (its R lines counted from 1),
+                                   on the room's N, S, E or W wall, <offset> ft from the wall's top or left end
+W <room> <wall> <offset>           a 4 ft window, placed like a door
+END
+
+Rules:
+- Rooms on a floor must not overlap, must stay inside the plot and should fill the built area without gaps.
+- Every room needs a door onto a passage or a neighbouring room; bedrooms, the kitchen and living areas need a window on an outside wall.
+- Leave an open car porch or lawn at the front (street side) of the ground floor.
+- Use realistic sizes: bedrooms at least 10 x 11 ft, baths at least 5 x 7 ft, passages at least 3.5 ft wide.
+
+Example (5 Marla, 1 floor, 2 bedrooms):
+P 25 45
+F Ground Floor
+R 0 0 13 14 Bedroom 1
+R 13 0 12 14 Bedroom 2
+R 0 14 25 4 Passage
+R 0 18 6 8 Bath 1
+R 6 18 19 8 Dining
+R 0 26 10 11 Kitchen
+R 10 26 15 11 Drawing Room
+R 0 37 25 8 Car Porch / Lawn
+D 1 S 2
+D 2 S 2
+D 4 N 1
+D 5 N 4
+D 6 N 7
+D 7 N 3
+D 7 S 10
+W 1 N 4
+W 2 N 4
+W 5 E 2
+W 6 W 4
+W 7 E 3
+END
+"""
+
+LAYOUT_PROMPT_TEMPLATE = """
+    Design a {house_type} house on a {num_marla} Marla plot, {plot_width:.1f} ft wide and {plot_depth:.1f} ft deep, with {num_bedrooms} bedrooms over {num_floors} floors.
+    """
+
+# Bumped automatically whenever the prompts change, so cached generations made
+# with an older prompt are never served for the new one.
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + HUMAN_PROMPT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+FLOOR_PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + FLOOR_PROMPT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+LAYOUT_PROMPT_VERSION = hashlib.sha256(
+    (LAYOUT_SYSTEM_PROMPT + LAYOUT_PROMPT_TEMPLATE + VARIANT_PROMPT_TEMPLATE + "".join(VARIANT_HINTS)).encode("utf-8")
+).hexdigest()[:12]
+VARIANT_PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + HUMAN_PROMPT_TEMPLATE + VARIANT_PROMPT_TEMPLATE + "".join(VARIANT_HINTS)).encode("utf-8")
+).hexdigest()[:12]
+
+# The system prompts never change, so their messages are built once at import
+# time and only the small human message is formatted per request. They are
+# too short for Anthropic prompt caching (1,024 tokens at least), so they
+# carry no cache breakpoint.
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+LAYOUT_SYSTEM_MESSAGE = SystemMessage(content=LAYOUT_SYSTEM_PROMPT)
+
+
+def build_llms():
+    """Create the provider clients used for generation.
+
+    Returns:
+        A dict mapping provider name to a LangChain chat model.
+    """
+    async_client = httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+    sync_client = httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+    _http_clients.extend([async_client, sync_client])
+
+    llms = {}
+    llms["deepseek"] = ChatOpenAI(
+        model_name="deepseek/deepseek-chat:free",
+        temperature=0.4,
+        openai_api_base=os.getenv("DEEPSEEK_API_BASE", ""),
+        openai_api_key=os.getenv("DEEPSEEK_API_KEY", ""),
+        http_client=sync_client,
+        http_async_client=async_client,
+    )
+
+    # ChatAnthropic keeps its own pooled httpx client for the lifetime of the
+    # instance, so building it once is enough to reuse connections.
+    llms["claude"] = ChatAnthropic(
+        model="claude-3-5-sonnet-20240620",
+        temperature=0.4,
+        max_tokens=8000,
+        default_request_timeout=HTTP_TIMEOUT.read,
+    )
+    return llms
+
+
+def init_llms():
+    """Build the provider clients once for this worker process."""
+    if not _llms:
+        _llms.update(build_llms())
+    return _llms
+
+
+async def close_llms():
+    """Release the pooled HTTP connections held by the provider clients."""
+    for client in _http_clients:
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        else:
+            client.close()
+    _http_clients.clear()
+    _llms.clear()
+
+
+def get_llm(name=DEFAULT_PROVIDER):
+    """Return the long-lived chat model for `name`, creating clients on first use."""
+    return init_llms()[name]
+
+
+def system_message_for(layout=False):
+    """Return the prebuilt system message (for layout mode, if `layout`)."""
+    return LAYOUT_SYSTEM_MESSAGE if layout else SYSTEM_MESSAGE
+
+
+def build_human_message(house_type, num_marla, num_bedrooms, num_floors):
+    return HumanMessage(content=HUMAN_PROMPT_TEMPLATE.format(house_type=house_type, num_marla=num_marla, num_bedrooms=num_bedrooms, num_floors=num_floors))
+
+
+def build_variant_message(house_type, num_marla, num_bedrooms, num_floors, variant, num_variants):
+    """Human message asking for alternative `variant` (1-based, the first being the plain prompt)."""
+    hint = VARIANT_HINTS[(variant - 2) % len(VARIANT_HINTS)]
+    content = HUMAN_PROMPT_TEMPLATE.format(house_type=house_type, num_marla=num_marla, num_bedrooms=num_bedrooms, num_floors=num_floors)
+    return HumanMessage(content=content + VARIANT_PROMPT_TEMPLATE.format(variant=variant, num_variants=num_variants, variant_hint=hint))
+
+
+def build_layout_message(house_type, num_marla, num_bedrooms, num_floors, plot_width, plot_depth, variant=None, num_variants=None):
+    """Human message asking for a plan in the compact layout format, or for alternative `variant` of it."""
+    content = LAYOUT_PROMPT_TEMPLATE.format(
+        house_type=house_type, num_marla=num_marla, num_bedrooms=num_bedrooms, num_floors=num_floors,
+        plot_width=plot_width, plot_depth=plot_depth,
+    )
+    if variant is not None:
+        hint = VARIANT_HINTS[(variant - 2) % len(VARIANT_HINTS)]
+        content += VARIANT_PROMPT_TEMPLATE.format(variant=variant, num_variants=num_variants, variant_hint=hint)
+    return HumanMessage(content=content)
+
+
+def build_floor_message(house_type, num_marla, num_floors, **floor):
+    """Human message asking for one floor; `floor` fills the rest of `FLOOR_PROMPT_TEMPLATE`."""
+    return HumanMessage(content=FLOOR_PROMPT_TEMPLATE.format(house_type=house_type, num_marla=num_marla, num_floors=num_floors, **floor))
+
+
+def build_messages(human_message, layout=False):
+    """Messages to send a provider for a request's human message."""
+    return [system_message_for(layout), human_message]
+
+
+def usage_from_response(message):
+    """Extract token usage, including prompt-cache reads/writes, from a response.
+
+    Args:
+        message: The `AIMessage` (or merged streamed chunks) returned by a model.
+
+    Returns:
+        A dict of input, output and cached input token counts.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    raw = (getattr(message, "response_metadata", None) or {}).get("usage") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_read_input_tokens": details.get("cache_read", raw.get("cache_read_input_tokens", 0)) or 0,
+        "cache_creation_input_tokens": details.get("cache_creation", raw.get("cache_creation_input_tokens", 0)) or 0,
+    }
+
+
+def is_truncated(message):
+    """Whether the provider stopped because it ran out of `max_tokens`."""
+    metadata = getattr(message, "response_metadata", None) or {}
+    return metadata.get("stop_reason") == "max_tokens" or metadata.get("finish_reason") == "length"
+
+
+def create_chat_chain(house_type, num_marla, num_bedrooms, num_floors):
+    human_message = build_human_message(house_type, num_marla, num_bedrooms, num_floors)
 
-    return system_message, human_message, llm2
+    return system_message_for(), human_message, get_llm()
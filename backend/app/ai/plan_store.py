@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from app.ai.cache import BASE_DIR, normalize_specs
+from app.ai.svg_optimize import expand_for_raster
+from app.ai.svg_repair import InvalidSVG, repair_svg
+from app.api.routes.helpers import svg_to_png_wand
+
+PLANS_DIR = os.getenv("PLANS_DIR", os.path.join(BASE_DIR, "generated_images", "plans"))
+
+_PLAN_ID = re.compile(r"^[0-9a-f]{24}$")
+
+
+class PlanNotFound(Exception):
+    """Raised when a request refers to a plan id that isn't stored."""
+
+
+def plan_id_for(svg_content):
+    """Content-addressed id, so the same SVG always maps to the same plan."""
+    return hashlib.sha256(svg_content.encode("utf-8")).hexdigest()[:24]
+
+
+class PlanStore:
+    """Persist generated plans so any format can be served without regenerating.
+
+    Each plan is stored as `<id>.svg` with a `<id>.json` metadata file; the
+    PNG rendering is produced on first request and kept as `<id>.png`.
+    """
+
+    def __init__(self, directory=PLANS_DIR):
+        self.directory = directory
+
+    def _path(self, plan_id, extension):
+        if not _PLAN_ID.match(plan_id):
+            raise KeyError(plan_id)
+        return os.path.join(self.directory, f"{plan_id}.{extension}")
+
+    def save(self, svg_content, specs=None, **metadata):
+        """Store `svg_content` and return its plan id."""
+        plan_id = plan_id_for(svg_content)
+        svg_path = self._path(plan_id, "svg")
+        if os.path.exists(svg_path):
+            return plan_id
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {
+            "id": plan_id,
+            "created_at": time.time(),
+            "specs": normalize_specs(specs) if specs is not None else None,
+            **metadata,
+        }
+        self._write(self._path(plan_id, "json"), json.dumps(meta).encode("utf-8"))
+        # SVG last: its presence marks the plan as complete
+        self._write(svg_path, svg_content.encode("utf-8"))
+        return plan_id
+
+    @staticmethod
+    def _write(path, data):
+        # Unique per thread: saves run in worker threads and may write the same plan
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load_svg(self, plan_id):
+        """Return the stored SVG, or None if there is no such plan."""
+        try:
+            with open(self._path(plan_id, "svg"), "r", encoding="utf-8") as f:
+                return f.read()
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def load_metadata(self, plan_id):
+        try:
+            with open(self._path(plan_id, "json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, FileNotFoundError, ValueError):
+            return None
+
+    def load_png(self, plan_id):
+        """Return the plan rendered as PNG, rendering and storing it on first use.
+
+        Returns:
+            PNG bytes, or None if there is no such plan.
+
+        Raises:
+            Exception: If the stored SVG cannot be rasterized.
+        """
+        try:
+            png_path = self._path(plan_id, "png")
+        except KeyError:
+            return None
+        try:
+            with open(png_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        svg_content = self.load_svg(plan_id)
+        if svg_content is None:
+            return None
+        png_binary = self.render_png(svg_content)
+        self._write(png_path, png_binary)
+        return png_binary
+
+    @staticmethod
+    def render_png(svg_content):
+        """Rasterize `svg_content` without storing it, e.g. for a partial plan."""
+        try:
+            # Plans stored before generation repaired its output may not render as-is
+            svg_content, _ = repair_svg(svg_content)
+        except InvalidSVG:
+            pass
+        # ImageMagick draws unstyled shapes for classes and may drop <use>
+        return svg_to_png_wand(expand_for_raster(svg_content))
+
+    def iter_metadata(self):
+        """Yield the metadata of every stored plan."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(".json"):
+                meta = self.load_metadata(name[:-len(".json")])
+                if meta is not None:
+                    yield meta
+
+    async def asave(self, svg_content, specs=None, **metadata):
+        return await asyncio.to_thread(self.save, svg_content, specs, **metadata)
+
+    async def aload_svg(self, plan_id):
+        return await asyncio.to_thread(self.load_svg, plan_id)
+
+    async def aload_png(self, plan_id):
+        return await asyncio.to_thread(self.load_png, plan_id)
+
+    async def apng_for(self, result):
+        """PNG of a `GenerationResult`: its stored plan's, or rendered afresh for a partial plan that isn't stored."""
+        if result.plan_id is None:
+            return await asyncio.to_thread(self.render_png, result.svg_content)
+        return await self.aload_png(result.plan_id)
+
+
+plan_store = PlanStore()
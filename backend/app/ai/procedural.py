@@ -0,0 +1,357 @@
+"""Deterministic floor-plan generator.
+
+Lays out a plan by recursively subdividing the plot rectangle among a room
+program derived from the spec, then draws it in the same labelled SVG style
+the model produces. Runs in milliseconds, so common specs don't need an LLM
+call at all.
+
+Layouts the model writes in the compact format of `app.ai.layout` are drawn
+here too (`render_layout`), so both engines produce the same style.
+"""
+import math
+import os
+import re
+from xml.sax.saxutils import escape
+
+SQFT_PER_MARLA = 272.25
+# Typical Pakistani plots are roughly 1:1.8 (e.g. 25x45 ft for 5 marla)
+PLOT_ASPECT = 1.8
+SCALE = 8  # SVG px per foot
+MARGIN = 40
+FLOOR_GAP = 60
+TITLE_HEIGHT = 50
+
+FRONT_SETBACK = 0.18  # share of plot depth left open at the front of the ground floor
+STAIRS_WIDTH = 4.0
+STAIRS_LENGTH = 12.0
+DOOR_WIDTH = 3.0
+WINDOW_WIDTH = 4.0
+
+FLOOR_NAMES = ["Ground Floor", "First Floor", "Second Floor", "Third Floor"]
+# Rooms drawn as open space rather than walled rooms
+OPEN_SPACE_RE = re.compile(r"porch|lawn|garden|parking|terrace|courtyard", re.I)
+
+# Specs `mode=auto` serves procedurally: the standard plot sizes that make up
+# most traffic, with a conventional room program and no special requests.
+AUTO_MARLAS = {float(m) for m in os.getenv("PROCEDURAL_AUTO_MARLAS", "3,5,7,10").split(",")}
+AUTO_MAX_FLOORS = 3
+AUTO_MAX_BEDROOMS_PER_FLOOR = 3
+
+
+def use_procedural(specs):
+    """Whether `specs` should be generated by this engine instead of the LLM."""
+    if specs.mode == "procedural":
+        return True
+    if specs.mode != "auto":
+        return False
+    return (
+        float(specs.num_marla) in AUTO_MARLAS
+        and specs.num_floors <= AUTO_MAX_FLOORS
+        and specs.num_bedrooms <= AUTO_MAX_BEDROOMS_PER_FLOOR * specs.num_floors
+        and not specs.additional_preferences
+    )
+
+
+def plot_dimensions(num_marla):
+    """Plot width and depth in feet."""
+    area = num_marla * SQFT_PER_MARLA
+    width = math.sqrt(area / PLOT_ASPECT)
+    return width, area / width
+
+
+def bedrooms_per_floor(num_bedrooms, num_floors):
+    """Split the bedrooms over the floors, ground floor first."""
+    # Fewer bedrooms on the ground floor, which also holds the living areas
+    per_floor = [num_bedrooms // num_floors] * num_floors
+    for i in range(num_bedrooms % num_floors):
+        per_floor[num_floors - 1 - i] += 1
+    return per_floor
+
+
+def stairs_rect(width, depth, num_floors):
+    """The staircase `(x, y, w, h)` in feet, which is the same on every floor."""
+    built_depth = depth * (1 - FRONT_SETBACK)
+    strip_w = max(STAIRS_WIDTH if num_floors > 1 else 0.0, 3.5, width * 0.12)
+    return 0.0, 0.0, strip_w, min(STAIRS_LENGTH, built_depth * 0.4)
+
+
+def room_program(num_bedrooms, num_floors):
+    """Rooms (name, relative area weight) for each floor, ground floor first."""
+    floors = []
+    bedroom = 1
+    for level, bedrooms in enumerate(bedrooms_per_floor(num_bedrooms, num_floors)):
+        rooms = [("Drawing Room", 1.4), ("Kitchen", 0.8), ("Dining", 1.0)] if level == 0 else [("Lounge", 1.2)]
+        for _ in range(bedrooms):
+            rooms.append((f"Bedroom {bedroom}", 1.3))
+            rooms.append((f"Bath {bedroom}", 0.45))
+            bedroom += 1
+        if level == 0:
+            rooms.append(("Powder Room", 0.3))
+        floors.append(rooms)
+    return floors
+
+
+def _subdivide(x, y, w, h, rooms):
+    """Split the rectangle among `rooms` in proportion to their weights."""
+    if len(rooms) == 1:
+        return [(rooms[0][0], x, y, w, h)]
+    total = sum(weight for _, weight in rooms)
+    # Cut where the running weight first reaches half, keeping at least one room per side
+    running = 0.0
+    cut = 1
+    for i, (_, weight) in enumerate(rooms[:-1], start=1):
+        running += weight
+        cut = i
+        if running >= total / 2:
+            break
+    share = sum(weight for _, weight in rooms[:cut]) / total
+    if w >= h:
+        first_w = w * share
+        return _subdivide(x, y, first_w, h, rooms[:cut]) + _subdivide(x + first_w, y, w - first_w, h, rooms[cut:])
+    first_h = h * share
+    return _subdivide(x, y, w, first_h, rooms[:cut]) + _subdivide(x, y + first_h, w, h - first_h, rooms[cut:])
+
+
+def layout_floor(width, depth, rooms, level, num_floors):
+    """Place one floor's rooms on the plot.
+
+    Returns:
+        A list of `(name, x, y, w, h)` rectangles in feet, plot origin at the
+        top-left with the street at the bottom.
+    """
+    built_depth = depth * (1 - FRONT_SETBACK)
+    placed = []
+    if level == 0:
+        placed.append(("Car Porch / Lawn", 0.0, built_depth, width, depth - built_depth))
+
+    # A service strip on the left holds the stairs (same spot on every floor,
+    # so they line up) and the passage that every room opens onto.
+    _, _, strip_w, stairs_h = stairs_rect(width, depth, num_floors)
+    if num_floors > 1:
+        placed.append(("Stairs", 0.0, 0.0, strip_w, stairs_h))
+        placed.append(("Passage", 0.0, stairs_h, strip_w, built_depth - stairs_h))
+    else:
+        placed.append(("Passage", 0.0, 0.0, strip_w, built_depth))
+
+    placed.extend(_subdivide(strip_w, 0.0, width - strip_w, built_depth, rooms))
+    return placed
+
+
+def _feet(value):
+    feet = int(value)
+    inches = int(round((value - feet) * 12))
+    if inches == 12:
+        feet, inches = feet + 1, 0
+    return f"{feet}'{inches}\""
+
+
+def _door(x, y, w, h, strip_w):
+    """Door gap and swing arc on the wall facing the passage, else an interior wall."""
+    d = DOOR_WIDTH * SCALE
+    if abs(x - strip_w) < 1e-6 and h > DOOR_WIDTH + 1:
+        # Left wall, opening onto the passage
+        wx, wy = x * SCALE, (y + min(1.0, h / 4)) * SCALE
+        return (
+            f'<line class="door-gap" x1="{wx:.1f}" y1="{wy:.1f}" x2="{wx:.1f}" y2="{wy + d:.1f}"/>'
+            f'<path class="door" d="M{wx:.1f},{wy:.1f} L{wx + d:.1f},{wy:.1f} A{d:.1f},{d:.1f} 0 0,1 {wx:.1f},{wy + d:.1f}"/>'
+        )
+    # Top wall, or the bottom one for rooms along the back of the house
+    # whose top wall is external
+    wx = (x + min(1.0, w / 4)) * SCALE
+    if y > 1e-6:
+        wy, leaf, sweep = y * SCALE, d, 0
+    else:
+        wy, leaf, sweep = (y + h) * SCALE, -d, 1
+    return (
+        f'<line class="door-gap" x1="{wx:.1f}" y1="{wy:.1f}" x2="{wx + d:.1f}" y2="{wy:.1f}"/>'
+        f'<path class="door" d="M{wx:.1f},{wy:.1f} L{wx:.1f},{wy + leaf:.1f} A{d:.1f},{d:.1f} 0 0,{sweep} {wx + d:.1f},{wy:.1f}"/>'
+    )
+
+
+def _windows(x, y, w, h, width, built_depth):
+    """Windows on the room's walls that lie on the building's outer edge."""
+    parts = []
+    if y < 1e-6 and w > WINDOW_WIDTH + 1:
+        cx = x + w / 2 - WINDOW_WIDTH / 2
+        parts.append(f'<rect class="window" x="{cx * SCALE:.1f}" y="{-0.5 * SCALE:.1f}" width="{WINDOW_WIDTH * SCALE:.1f}" height="{1.0 * SCALE:.1f}"/>')
+    if abs(x + w - width) < 1e-6 and h > WINDOW_WIDTH + 1:
+        cy = y + h / 2 - WINDOW_WIDTH / 2
+        parts.append(f'<rect class="window" x="{(width - 0.5) * SCALE:.1f}" y="{cy * SCALE:.1f}" width="{1.0 * SCALE:.1f}" height="{WINDOW_WIDTH * SCALE:.1f}"/>')
+    if abs(y + h - built_depth) < 1e-6 and w > WINDOW_WIDTH + 1:
+        cx = x + w / 2 - WINDOW_WIDTH / 2
+        parts.append(f'<rect class="window" x="{cx * SCALE:.1f}" y="{(built_depth - 0.5) * SCALE:.1f}" width="{WINDOW_WIDTH * SCALE:.1f}" height="{1.0 * SCALE:.1f}"/>')
+    return "".join(parts)
+
+
+def _wall_door(x, y, w, h, wall, offset):
+    """Door gap and swing arc `offset` ft along a room's N, S, E or W wall."""
+    d = DOOR_WIDTH * SCALE
+    if wall in ("W", "E"):
+        wx, wy = (x if wall == "W" else x + w) * SCALE, (y + offset) * SCALE
+        leaf, sweep = (d, 1) if wall == "W" else (-d, 0)
+        return (
+            f'<line class="door-gap" x1="{wx:.1f}" y1="{wy:.1f}" x2="{wx:.1f}" y2="{wy + d:.1f}"/>'
+            f'<path class="door" d="M{wx:.1f},{wy:.1f} L{wx + leaf:.1f},{wy:.1f} A{d:.1f},{d:.1f} 0 0,{sweep} {wx:.1f},{wy + d:.1f}"/>'
+        )
+    wx, wy = (x + offset) * SCALE, (y if wall == "N" else y + h) * SCALE
+    leaf, sweep = (d, 0) if wall == "N" else (-d, 1)
+    return (
+        f'<line class="door-gap" x1="{wx:.1f}" y1="{wy:.1f}" x2="{wx + d:.1f}" y2="{wy:.1f}"/>'
+        f'<path class="door" d="M{wx:.1f},{wy:.1f} L{wx:.1f},{wy + leaf:.1f} A{d:.1f},{d:.1f} 0 0,{sweep} {wx + d:.1f},{wy:.1f}"/>'
+    )
+
+
+def _wall_window(x, y, w, h, wall, offset):
+    """Window `offset` ft along a room's N, S, E or W wall."""
+    if wall in ("W", "E"):
+        wx = (x if wall == "W" else x + w) - 0.5
+        return f'<rect class="window" x="{wx * SCALE:.1f}" y="{(y + offset) * SCALE:.1f}" width="{1.0 * SCALE:.1f}" height="{WINDOW_WIDTH * SCALE:.1f}"/>'
+    wy = (y if wall == "N" else y + h) - 0.5
+    return f'<rect class="window" x="{(x + offset) * SCALE:.1f}" y="{wy * SCALE:.1f}" width="{WINDOW_WIDTH * SCALE:.1f}" height="{1.0 * SCALE:.1f}"/>'
+
+
+def _stairs(x, y, w, h, level, num_floors):
+    treads = "".join(
+        f'<line x1="{x * SCALE:.1f}" y1="{(y + step) * SCALE:.1f}" x2="{(x + w) * SCALE:.1f}" y2="{(y + step) * SCALE:.1f}"/>'
+        for step in range(1, int(h))
+    )
+    direction = "UP" if level < num_floors - 1 else "DN"
+    return f'<g class="stairs-treads">{treads}</g><text class="dim" x="{(x + w / 2) * SCALE:.1f}" y="{(y + h - 1) * SCALE:.1f}">{direction}</text>'
+
+
+def _floor_header(width, depth, level, name=None):
+    if name is None:
+        name = FLOOR_NAMES[level] if level < len(FLOOR_NAMES) else f"Floor {level + 1}"
+    return (
+        f'<text class="floor-title" x="{width * SCALE / 2:.1f}" y="-12">{escape(name)}</text>'
+        f'<rect class="plot" x="0" y="0" width="{width * SCALE:.1f}" height="{depth * SCALE:.1f}"/>'
+    )
+
+
+def _room(name, x, y, w, h, css):
+    """A room's rectangle with its name and dimensions."""
+    cx, cy = (x + w / 2) * SCALE, (y + h / 2) * SCALE
+    return (
+        f'<rect class="{css}" data-room="{escape(name)}" x="{x * SCALE:.1f}" y="{y * SCALE:.1f}" width="{w * SCALE:.1f}" height="{h * SCALE:.1f}"/>'
+        f'<text class="label" x="{cx:.1f}" y="{cy:.1f}">{escape(name)}</text>'
+        f'<text class="dim" x="{cx:.1f}" y="{cy + 14:.1f}">{_feet(w)} x {_feet(h)}</text>'
+    )
+
+
+def _staircase(x, y, w, h, level, num_floors):
+    return (
+        f'<rect class="stairs" data-room="Stairs" x="{x * SCALE:.1f}" y="{y * SCALE:.1f}" width="{w * SCALE:.1f}" height="{h * SCALE:.1f}"/>'
+        + _stairs(x, y, w, h, level, num_floors)
+    )
+
+
+def render_floor(width, depth, placed, level, num_floors):
+    built_depth = depth * (1 - FRONT_SETBACK)
+    strip_w = next(w for name, _, _, w, _ in placed if name == "Passage")
+    parts = [_floor_header(width, depth, level)]
+    for name, x, y, w, h in placed:
+        if name == "Stairs":
+            parts.append(_staircase(x, y, w, h, level, num_floors))
+            continue
+        css = "open" if name.startswith("Car Porch") else "room"
+        parts.append(_room(name, x, y, w, h, css))
+        if css == "room" and name != "Passage":
+            parts.append(_door(x, y, w, h, strip_w))
+            parts.append(_windows(x, y, w, h, width, built_depth))
+    parts.append(f'<rect class="wall" x="0" y="0" width="{width * SCALE:.1f}" height="{built_depth * SCALE:.1f}"/>')
+    return "".join(parts)
+
+
+def render_layout_floor(width, depth, floor, level, num_floors):
+    """Draw one floor of a parsed layout (see `app.ai.layout.parse_layout`)."""
+    parts = [_floor_header(width, depth, level, floor["name"])]
+    walled = []
+    for room in floor["rooms"]:
+        css = "open" if OPEN_SPACE_RE.search(room["name"]) else "room"
+        parts.append(_room(room["name"], room["x"], room["y"], room["w"], room["h"], css))
+        if css == "room":
+            walled.append(room)
+    for stairs in floor["stairs"]:
+        parts.append(_staircase(stairs["x"], stairs["y"], stairs["w"], stairs["h"], level, num_floors))
+        walled.append(stairs)
+    for kind, draw in (("doors", _wall_door), ("windows", _wall_window)):
+        for opening in floor[kind]:
+            room = floor["rooms"][opening["room"]]
+            parts.append(draw(room["x"], room["y"], room["w"], room["h"], opening["wall"], opening["offset"]))
+    if walled:
+        x0 = min(r["x"] for r in walled)
+        y0 = min(r["y"] for r in walled)
+        x1 = max(r["x"] + r["w"] for r in walled)
+        y1 = max(r["y"] + r["h"] for r in walled)
+        parts.append(f'<rect class="wall" x="{x0 * SCALE:.1f}" y="{y0 * SCALE:.1f}" width="{(x1 - x0) * SCALE:.1f}" height="{(y1 - y0) * SCALE:.1f}"/>')
+    return "".join(parts)
+
+
+STYLE = (
+    ".plot{fill:#f4f9ef;stroke:#7a7a7a;stroke-width:1;stroke-dasharray:6 4}"
+    ".wall{fill:none;stroke:#222;stroke-width:5}"
+    ".room{fill:#fffdf7;stroke:#333;stroke-width:2}"
+    ".open{fill:#e3f1d8;stroke:#7a7a7a;stroke-width:1}"
+    ".stairs{fill:#ececec;stroke:#333;stroke-width:2}"
+    ".stairs-treads line{stroke:#777;stroke-width:1}"
+    ".door-gap{stroke:#fffdf7;stroke-width:4}"
+    ".door{fill:none;stroke:#8b4513;stroke-width:1.5}"
+    ".window{fill:#cfe8ff;stroke:#1e6fb8;stroke-width:1}"
+    ".label{font-size:12px;font-weight:bold;text-anchor:middle;fill:#222}"
+    ".dim{font-size:10px;text-anchor:middle;fill:#555}"
+    ".title{font-size:20px;font-weight:bold;text-anchor:middle;fill:#111}"
+    ".floor-title{font-size:14px;font-weight:bold;text-anchor:middle;fill:#333}"
+)
+
+
+def render_sheet(specs, width, depth, panels):
+    """Lay out drawn floors (see `render_floor`) side by side under the plan's title.
+
+    Returns:
+        The SVG document as a string, one floor per panel left to right.
+    """
+    panel_w = width * SCALE
+    total_w = MARGIN * 2 + panel_w * len(panels) + FLOOR_GAP * (len(panels) - 1)
+    total_h = MARGIN * 2 + TITLE_HEIGHT + depth * SCALE + 20
+
+    title = f"{specs.house_type.strip().title()} House - {specs.num_marla:g} Marla"
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{total_w:.0f}" height="{total_h:.0f}" viewBox="0 0 {total_w:.0f} {total_h:.0f}" font-family="Arial, sans-serif">',
+        f"<style>{STYLE}</style>",
+        f'<rect x="0" y="0" width="{total_w:.0f}" height="{total_h:.0f}" fill="#ffffff"/>',
+        f'<text class="title" x="{total_w / 2:.1f}" y="{MARGIN:.0f}">{escape(title)}</text>',
+        f'<text class="dim" x="{total_w / 2:.1f}" y="{MARGIN + 18:.0f}">Plot {_feet(width)} x {_feet(depth)} ({specs.num_marla * SQFT_PER_MARLA:.0f} sq ft)</text>',
+    ]
+    for level, panel in enumerate(panels):
+        offset_x = MARGIN + level * (panel_w + FLOOR_GAP)
+        parts.append(f'<g id="floor-{level}" transform="translate({offset_x:.1f},{MARGIN + TITLE_HEIGHT:.0f})">')
+        parts.append(panel)
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def render_procedural(specs):
+    """Generate the SVG floor plan for `specs` without calling a model.
+
+    Args:
+        specs: A `HouseSpecifications` request body.
+
+    Returns:
+        The SVG document as a string, one floor per panel left to right.
+    """
+    width, depth = plot_dimensions(specs.num_marla)
+    floors = room_program(specs.num_bedrooms, specs.num_floors)
+    panels = [
+        render_floor(width, depth, layout_floor(width, depth, rooms, level, len(floors)), level, len(floors))
+        for level, rooms in enumerate(floors)
+    ]
+    return render_sheet(specs, width, depth, panels)
+
+
+def render_layout(layout, specs):
+    """Draw a layout the model wrote (see `app.ai.layout.parse_layout`) as an SVG sheet."""
+    width, depth = layout["plot"]["width"], layout["plot"]["depth"]
+    floors = layout["floors"]
+    panels = [render_layout_floor(width, depth, floor, level, len(floors)) for level, floor in enumerate(floors)]
+    return render_sheet(specs, width, depth, panels)
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from app.ai.admission import AdmissionRejected, admission
+from app.ai.model import get_llm
+
+# Providers in order of preference; DeepSeek only takes traffic once it is configured.
+PROVIDERS = os.getenv("LLM_PROVIDERS", "claude,deepseek" if os.getenv("DEEPSEEK_API_BASE") else "claude").split(",")
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Used until the primary provider has enough samples to estimate its percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "45"))
+STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", "100"))
+MIN_SAMPLES = 5
+MAX_ERROR_RATE = 0.5
+FAILURE_COOLDOWN = 30.0
+
+
+def is_rate_limited(error):
+    """Whether a provider SDK error is an HTTP 429 rate-limit response."""
+    return getattr(error, "status_code", None) == 429
+
+
+def provider_retry_after(error):
+    """The provider's own Retry-After, in seconds, if it sent one."""
+    response = getattr(error, "response", None)
+    try:
+        return max(1, int(float(response.headers["retry-after"])))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ProviderStats:
+    """Sliding-window latency and error statistics for one provider."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= 3:
+                self.cooldown_until = time.monotonic() + FAILURE_COOLDOWN
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def healthy(self):
+        if time.monotonic() < self.cooldown_until:
+            return False
+        return len(self.outcomes) < MIN_SAMPLES or self.error_rate <= MAX_ERROR_RATE
+
+    def snapshot(self):
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "error_rate": self.error_rate,
+            "samples": len(self.outcomes),
+            "healthy": self.healthy,
+        }
+
+
+class ProviderRouter:
+    """Route generations to the fastest healthy provider, optionally hedging.
+
+    Providers are ranked by median latency; ones without enough samples yet
+    keep their configured order so each gets measured. With hedging enabled, a
+    second provider is started once the primary has run past its p95 latency
+    and whichever returns a valid result first wins.
+    """
+
+    def __init__(self, providers=PROVIDERS, hedge=HEDGE_ENABLED, hedge_percentile=HEDGE_PERCENTILE):
+        self.providers = [name.strip() for name in providers if name.strip()]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self._stats = {name: ProviderStats() for name in self.providers}
+        self.counters = {"hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+    def ranked(self):
+        """Providers ordered best-first, unhealthy ones last."""
+        def score(item):
+            position, name = item
+            stats = self._stats[name]
+            measured = len(stats.latencies) >= MIN_SAMPLES
+            return (not stats.healthy, measured, stats.percentile(50) if measured else 0, position)
+        return [name for _, name in sorted(enumerate(self.providers), key=score)]
+
+    def pick(self):
+        return self.ranked()[0]
+
+    def record(self, name, latency, ok):
+        self._stats[name].record(latency, ok)
+
+    def hedge_delay(self, name):
+        stats = self._stats[name]
+        if len(stats.latencies) < MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return stats.percentile(self.hedge_percentile)
+
+    async def _attempt(self, name, messages_for, parse, limits=None, **kwargs):
+        if limits and name in limits:
+            async with limits[name]:
+                return await self._attempt(name, messages_for, parse, **kwargs)
+        async with admission.slot(name):
+            started = time.monotonic()
+            try:
+                response = await get_llm(name).ainvoke(messages_for(name), **kwargs)
+                result = parse(response)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.record(name, time.monotonic() - started, False)
+                if is_rate_limited(e):
+                    raise AdmissionRejected(name, provider_retry_after(e) or admission.for_provider(name).retry_after()) from e
+                raise
+            self.record(name, time.monotonic() - started, True)
+            return result
+
+    async def invoke(self, messages_for, parse, limits=None, **kwargs):
+        """Run a prompt against the best provider and return `parse(response)`.
+
+        `messages_for(name)` builds the messages for a given provider, so each
+        can get its own variant of the prompt. `parse` receives the model's
+        message and should raise if the output is unusable, so an invalid
+        response counts as a failure and the other provider's answer can win.
+        `limits` optionally maps provider names to semaphores capping how many
+        calls the caller runs against each provider at once.
+        """
+        order = self.ranked()
+        pending = {asyncio.ensure_future(self._attempt(order[0], messages_for, parse, limits, **kwargs)): order[0]}
+        remaining = order[1:]
+        hedged = set()
+        last_error = None
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and remaining and len(pending) == 1:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than its usual p95: hedge on the next provider
+                    name = remaining.pop(0)
+                    pending[asyncio.ensure_future(self._attempt(name, messages_for, parse, limits, **kwargs))] = name
+                    hedged.add(name)
+                    self.counters["hedges"] += 1
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if name in hedged:
+                            self.counters["hedge_wins"] += 1
+                        elif name != order[0]:
+                            self.counters["failovers"] += 1
+                        return task.result()
+                    last_error = task.exception()
+                    print(f"Provider {name} failed: {last_error}")
+
+                if not pending and remaining:
+                    name = remaining.pop(0)
+                    pending[asyncio.ensure_future(self._attempt(name, messages_for, parse, limits, **kwargs))] = name
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            "ranking": self.ranked(),
+            "hedge_enabled": self.hedge,
+            **self.counters,
+            "providers": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+
+provider_router = ProviderRouter()
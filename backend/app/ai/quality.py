@@ -0,0 +1,304 @@
+"""Geometric quality checks on generated plans.
+
+Works on the `FloorPlan` arrays (see `geometry`) and reports, per plan:
+
+- room areas, in square feet when the plan's scale is known: from the
+  dimension labels in its rooms ("12' x 14'"), else from its floor outline
+  standing for the plot;
+- rooms overlapping each other, and walls running through rooms;
+- rooms sticking out of their floor's outline;
+- enclosed rooms without a door;
+- the built area of each floor against the plot size (`num_marla`).
+
+Pairs of boxes are found with a sweep over their x extents (`box_pairs`),
+so the checks stay well below quadratic on dense multi-floor plans.
+
+Plans with errors (as opposed to warnings) are "rejected": they aren't
+cached or rendered to PNG, so the next request generates a new one.
+"""
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from app.ai.geometry import KIND, WALL_THICKNESS, load_floor_plan
+from app.ai.procedural import SQFT_PER_MARLA
+
+QUALITY_REJECT = os.getenv("PLAN_QUALITY_REJECT", "true").lower() == "true"
+
+# Share of the smaller room two rooms may overlap by (walls drawn twice, rounding)
+OVERLAP_TOLERANCE = 0.05
+# Share of a room that may lie outside its floor's outline
+OUTSIDE_TOLERANCE = 0.05
+# Built area of a floor against the plot area
+BUILT_AREA_MAX = 1.10
+BUILT_AREA_MIN = 0.40
+# Dimension labels disagree with the drawing when their scales spread wider than this
+SCALE_SPREAD = 1.5
+# How far (in plan units) a door's hinge may be from a room's edge and still serve it
+DOOR_TOLERANCE = 4.0
+# A wall inside a room for more than this share of the room's width or height crosses it
+WALL_CROSSING = 0.25
+
+# Spaces that need no door and may lie outside the house outline
+OPEN_SPACES_RE = re.compile(
+    r"lawn|garden|porch|terrace|balcony|court|veranda|parking|car\b|garage|passage|corridor|lobby|hall|open|stair|lift",
+    re.I,
+)
+_FEET = r"(\d+(?:\.\d+)?)\s*(?:['′]|ft\.?)\s*(?:(\d+(?:\.\d+)?)\s*[\"″])?"
+_DIMENSIONS_RE = re.compile(rf"{_FEET}\s*[xX×]\s*{_FEET}|(\d+(?:\.\d+)?)\s*[xX×]\s*(\d+(?:\.\d+)?)")
+
+quality_stats = Counter()
+
+
+def box_pairs(x0, y0, x1, y1):
+    """Index pairs `(a, b)` of boxes whose interiors intersect.
+
+    Boxes are sorted by their left edge; each box is only compared with the
+    boxes starting before its right edge, found by binary search.
+    """
+    n = len(x0)
+    if n < 2:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    order = np.argsort(x0, kind="stable")
+    starts = x0[order]
+    ends = np.searchsorted(starts, x1[order], side="left")
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+    first = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a, b = order[first], order[first + 1 + offsets]
+    keep = (y0[a] < y1[b]) & (y0[b] < y1[a])
+    return a[keep], b[keep]
+
+
+def cross_pairs(first, second):
+    """Index pairs `(i, j)` of intersecting boxes, `i` from `first` and `j` from `second`.
+
+    Each of `first` and `second` is an `(x0, y0, x1, y1)` tuple of arrays.
+    """
+    n = len(first[0])
+    a, b = box_pairs(*(np.concatenate([f, s]) for f, s in zip(first, second)))
+    mixed = (a < n) != (b < n)
+    a, b = a[mixed], b[mixed]
+    return np.where(a < n, a, b), np.where(a < n, b, a) - n
+
+
+def _intersection(rects, a, b):
+    w = np.minimum(rects["x"][a] + rects["w"][a], rects["x"][b] + rects["w"][b]) - np.maximum(rects["x"][a], rects["x"][b])
+    h = np.minimum(rects["y"][a] + rects["h"][a], rects["y"][b] + rects["h"][b]) - np.maximum(rects["y"][a], rects["y"][b])
+    return np.maximum(w, 0) * np.maximum(h, 0)
+
+
+def _feet(whole, inches):
+    return float(whole) + (float(inches) / 12 if inches else 0.0)
+
+
+def _label_scales(plan, rooms):
+    """Feet per plan unit implied by each room's dimension label."""
+    labels = plan.labels
+    scales = []
+    measured = set()
+    for rect, text_index in zip(labels["rect"][np.isin(labels["rect"], rooms)], labels["text"][np.isin(labels["rect"], rooms)]):
+        match = rect not in measured and _DIMENSIONS_RE.search(plan.texts[text_index])
+        if not match:
+            continue
+        measured.add(rect)
+        if match.group(1):
+            feet = sorted((_feet(match.group(1), match.group(2)), _feet(match.group(3), match.group(4))))
+        else:
+            feet = sorted((float(match.group(5)), float(match.group(6))))
+        units = sorted((float(plan.rects["w"][rect]), float(plan.rects["h"][rect])))
+        if min(feet) > 0 and min(units) > 0:
+            scales += [feet[0] / units[0], feet[1] / units[1]]
+    return np.array(scales)
+
+
+class _Report:
+    def __init__(self):
+        self.issues = []
+
+    def add(self, check, severity, message, floor=None, rooms=()):
+        self.issues.append({"check": check, "severity": severity, "message": message, "floor": floor, "rooms": list(rooms)})
+
+
+def check_plan(plan, num_marla=None):
+    """Run every check on a parsed plan.
+
+    Args:
+        plan: A `FloorPlan`.
+        num_marla: Plot size the plan was generated for, if known.
+
+    Returns:
+        A JSON-friendly dict: `ok` (no errors), `issues`, `rooms` with their
+        areas, the built area of each floor and the scale used.
+    """
+    report = _Report()
+    rects = plan.rects
+    rooms = plan.rooms()
+    names = [plan.name(i) or f"Room {n + 1}" for n, i in enumerate(rooms)]
+    plot_sqft = num_marla * SQFT_PER_MARLA if num_marla else None
+    floors = sorted({int(f) for f in rects["floor"][rooms]})
+    outlines = rects[rects["kind"] == KIND["outline"]]
+
+    # Scale: dimension labels first, else the outline is the plot
+    scale, scale_source = None, None
+    scales = _label_scales(plan, rooms)
+    if len(scales):
+        scale, scale_source = float(np.median(scales)), "labels"
+        if scales.max() > SCALE_SPREAD * scales.min():
+            report.add("dimensions", "warning", "Room dimension labels don't match the drawn room sizes")
+    elif plot_sqft and len(outlines):
+        largest = outlines[np.argmax(outlines["w"] * outlines["h"])]
+        scale, scale_source = float(np.sqrt(plot_sqft / (largest["w"] * largest["h"]))), "plot"
+
+    areas = (rects["w"][rooms] * rects["h"][rooms]).astype(np.float64)
+    room_floor = rects["floor"][rooms]
+    open_space = np.array([bool(OPEN_SPACES_RE.search(name)) for name in names], bool)
+
+    if not len(rooms):
+        report.add("rooms", "warning", "No rooms recognised in the plan; geometry checks skipped")
+
+    # Overlapping rooms
+    sub = rects[rooms]
+    a, b = box_pairs(sub["x"], sub["y"], sub["x"] + sub["w"], sub["y"] + sub["h"])
+    same_floor = room_floor[a] == room_floor[b]
+    a, b = a[same_floor], b[same_floor]
+    overlap = _intersection(sub, a, b)
+    smaller = np.minimum(areas[a], areas[b])
+    significant = overlap > OVERLAP_TOLERANCE * smaller
+    for i, j, shared, least in zip(a[significant], b[significant], overlap[significant], smaller[significant]):
+        if shared >= 0.99 * least:
+            # A labelled box drawn inside a room (a wardrobe, a bed) rather than a clash
+            report.add("overlap", "warning", f"{names[j] if areas[j] < areas[i] else names[i]} is drawn inside "
+                       f"{names[i] if areas[j] < areas[i] else names[j]}", int(room_floor[i]), (names[i], names[j]))
+        else:
+            report.add("overlap", "error", f"{names[i]} overlaps {names[j]} ({shared / least:.0%} of the smaller room)",
+                       int(room_floor[i]), (names[i], names[j]))
+
+    # Walls through rooms: thin wall rectangles and wall lines, against the rooms' interiors
+    walls = rects[(rects["kind"] == KIND["wall"]) & (np.minimum(rects["w"], rects["h"]) <= WALL_THICKNESS)]
+    segments = plan.segments[plan.segments["kind"] == KIND["wall"]]
+    wx0 = np.concatenate([walls["x"], np.minimum(segments["x1"], segments["x2"])])
+    wy0 = np.concatenate([walls["y"], np.minimum(segments["y1"], segments["y2"])])
+    wx1 = np.concatenate([walls["x"] + walls["w"], np.maximum(segments["x1"], segments["x2"])])
+    wy1 = np.concatenate([walls["y"] + walls["h"], np.maximum(segments["y1"], segments["y2"])])
+    wall_floor = np.concatenate([walls["floor"], segments["floor"]])
+    if len(wx0) and len(rooms):
+        inset = DOOR_TOLERANCE
+        rx0, ry0 = sub["x"] + inset, sub["y"] + inset
+        rx1, ry1 = sub["x"] + sub["w"] - inset, sub["y"] + sub["h"] - inset
+        # Lines have no width; give them a hair so they can intersect
+        room_side, wall_side = cross_pairs((rx0, ry0, rx1, ry1), (wx0 - 0.01, wy0 - 0.01, wx1 + 0.01, wy1 + 0.01))
+        same_floor = room_floor[room_side] == wall_floor[wall_side]
+        room_side, wall_side = room_side[same_floor], wall_side[same_floor]
+        inside_w = np.minimum(rx1[room_side], wx1[wall_side]) - np.maximum(rx0[room_side], wx0[wall_side])
+        inside_h = np.minimum(ry1[room_side], wy1[wall_side]) - np.maximum(ry0[room_side], wy0[wall_side])
+        crossing = (inside_w > WALL_CROSSING * (rx1 - rx0)[room_side]) | (inside_h > WALL_CROSSING * (ry1 - ry0)[room_side])
+        # Thin boxes wholly inside a room are furniture drawn at a small scale, not walls
+        crossing &= ~((wx0[wall_side] >= rx0[room_side]) & (wx1[wall_side] <= rx1[room_side])
+                      & (wy0[wall_side] >= ry0[room_side]) & (wy1[wall_side] <= ry1[room_side]))
+        for i in np.unique(room_side[crossing]):
+            report.add("walls", "warning", f"A wall runs through {names[i]}", int(room_floor[i]), (names[i],))
+
+    # Rooms outside their floor's outline
+    for floor in floors:
+        frame = outlines[outlines["floor"] == floor]
+        if not len(frame):
+            continue
+        fx0, fy0 = frame["x"].min(), frame["y"].min()
+        fx1, fy1 = (frame["x"] + frame["w"]).max(), (frame["y"] + frame["h"]).max()
+        on_floor = np.flatnonzero((room_floor == floor) & ~open_space)
+        inside_w = np.minimum(sub["x"][on_floor] + sub["w"][on_floor], fx1) - np.maximum(sub["x"][on_floor], fx0)
+        inside_h = np.minimum(sub["y"][on_floor] + sub["h"][on_floor], fy1) - np.maximum(sub["y"][on_floor], fy0)
+        outside = 1 - np.maximum(inside_w, 0) * np.maximum(inside_h, 0) / areas[on_floor]
+        for i, share in zip(on_floor[outside > OUTSIDE_TOLERANCE], outside[outside > OUTSIDE_TOLERANCE]):
+            report.add("outside", "error", f"{share:.0%} of {names[i]} lies outside the house outline", floor, (names[i],))
+
+    # Doors: a door serves the rooms whose edge its hinge is on
+    enclosed = np.flatnonzero(~open_space & (rects["kind"][rooms] == KIND["room"]))
+    door_lines = plan.segments[plan.segments["kind"] == KIND["door"]]
+    px = np.concatenate([plan.doors["cx"], (door_lines["x1"] + door_lines["x2"]) / 2])
+    py = np.concatenate([plan.doors["cy"], (door_lines["y1"] + door_lines["y2"]) / 2])
+    door_floor = np.concatenate([plan.doors["floor"], door_lines["floor"]])
+    if len(enclosed) and not len(px):
+        report.add("doors", "warning", "The plan has no doors drawn")
+    elif len(enclosed):
+        x0, y0 = sub["x"][enclosed], sub["y"][enclosed]
+        x1, y1 = x0 + sub["w"][enclosed], y0 + sub["h"][enclosed]
+        t = DOOR_TOLERANCE
+        room_side, door_side = cross_pairs((x0 - t, y0 - t, x1 + t, y1 + t), (px - 0.01, py - 0.01, px + 0.01, py + 0.01))
+        x0, y0, x1, y1 = x0[room_side], y0[room_side], x1[room_side], y1[room_side]
+        dx, dy = px[door_side], py[door_side]
+        outside = np.hypot(np.maximum(np.maximum(x0 - dx, dx - x1), 0), np.maximum(np.maximum(y0 - dy, dy - y1), 0))
+        inside = np.minimum(np.minimum(dx - x0, x1 - dx), np.minimum(dy - y0, y1 - dy))
+        to_edge = np.where(outside > 0, outside, np.abs(inside))
+        near = (to_edge <= DOOR_TOLERANCE) & (door_floor[door_side] == room_floor[enclosed][room_side])
+        served = np.zeros(len(enclosed), bool)
+        served[room_side[near]] = True
+        for i in enclosed[~served]:
+            report.add("doors", "warning", f"{names[i]} has no door", int(room_floor[i]), (names[i],))
+
+    # Built area per floor against the plot
+    floor_areas = []
+    for floor in floors:
+        frame = outlines[outlines["floor"] == floor]
+        on_floor = room_floor == floor
+        built = float(areas[on_floor & ~open_space].sum())
+        entry = {"floor": floor, "rooms": int(on_floor.sum()), "built_area_sqft": None}
+        if scale is not None:
+            entry["built_area_sqft"] = round(built * scale * scale, 1)
+        floor_areas.append(entry)
+        if scale is None or not plot_sqft:
+            continue
+        ratio = built * scale * scale / plot_sqft
+        if scale_source == "labels" and ratio > BUILT_AREA_MAX:
+            severity = "warning" if any(i["check"] == "dimensions" for i in report.issues) else "error"
+            report.add("built_area", severity, f"Rooms on floor {floor + 1} cover {built * scale * scale:,.0f} sq ft, "
+                       f"more than the {plot_sqft:,.0f} sq ft plot", floor)
+        elif ratio < BUILT_AREA_MIN and len(frame):
+            report.add("built_area", "warning", f"Rooms on floor {floor + 1} only cover {ratio:.0%} of the plot", floor)
+
+    errors = sum(1 for issue in report.issues if issue["severity"] == "error")
+    quality_stats["checked"] += 1
+    quality_stats.update(f"{issue['check']}_{issue['severity']}" for issue in report.issues)
+    if errors:
+        quality_stats["failed"] += 1
+    return {
+        "ok": errors == 0,
+        "errors": errors,
+        "warnings": len(report.issues) - errors,
+        "issues": report.issues,
+        "scale_ft_per_unit": round(scale, 5) if scale is not None else None,
+        "scale_source": scale_source,
+        "plot_area_sqft": round(plot_sqft, 1) if plot_sqft else None,
+        "floors": floor_areas,
+        "rooms": [
+            {
+                "name": name,
+                "floor": int(floor),
+                "area_sqft": round(float(area) * scale * scale, 1) if scale is not None else None,
+            }
+            for name, floor, area in zip(names, room_floor, areas)
+        ],
+    }
+
+
+def check_stored_plan(plan_id, num_marla=None):
+    """`check_plan` for a stored plan, or None if there is no such plan."""
+    try:
+        plan = load_floor_plan(plan_id)
+    except ValueError as e:
+        quality_stats["checked"] += 1
+        quality_stats["failed"] += 1
+        issue = {"check": "svg", "severity": "error", "message": str(e), "floor": None, "rooms": []}
+        return {"ok": False, "errors": 1, "warnings": 0, "issues": [issue]}
+    if plan is None:
+        return None
+    return check_plan(plan, num_marla)
+
+
+def rejected(quality):
+    """Whether a plan with this quality report should be neither cached nor rendered."""
+    return QUALITY_REJECT and quality is not None and not quality["ok"]
+
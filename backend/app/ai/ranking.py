@@ -0,0 +1,88 @@
+"""Ranking the alternative plans generated for one request.
+
+Every candidate is measured on four criteria, each turned into a penalty
+between 0 (ideal) and 1:
+
+- utilisation: built area per floor against the plot, ideally
+  `TARGET_UTILISATION`;
+- bedrooms: bedrooms drawn against the `num_bedrooms` asked for;
+- errors: failed quality checks (overlapping rooms, rooms outside the
+  outline...), see `quality`;
+- circulation: share of the built area taken by passages, halls and stairs,
+  ideally within `CIRCULATION_RANGE`.
+
+The penalties of all candidates are computed together as arrays and weighed
+into one score per candidate.
+"""
+import re
+
+import numpy as np
+
+from app.ai.geometry import load_floor_plan
+
+CRITERIA = ("utilisation", "bedrooms", "errors", "circulation")
+WEIGHTS = np.array([0.25, 0.3, 0.3, 0.15])
+TARGET_UTILISATION = 0.8
+CIRCULATION_RANGE = (0.08, 0.2)
+# A candidate with this many errors gets the full errors penalty
+MAX_ERRORS = 3
+
+_BEDROOM_RE = re.compile(r"\bbed\s*room|\bbedroom|\bmaster\s*bed", re.I)
+_CIRCULATION_RE = re.compile(r"passage|corridor|lobby|foyer|entrance|hall\b|stair|\bup\b|\bdn\b", re.I)
+
+
+def measure(plan_id, quality):
+    """Raw criteria of one candidate: utilisation, bedrooms, errors and circulation.
+
+    Unknown measures (no scale, unparseable plan) are NaN.
+    """
+    quality = quality or {}
+    floors = [f["built_area_sqft"] for f in quality.get("floors", []) if f["built_area_sqft"] is not None]
+    plot = quality.get("plot_area_sqft")
+    utilisation = np.mean(floors) / plot if floors and plot else np.nan
+    errors = quality.get("errors", 0)
+
+    try:
+        plan = load_floor_plan(plan_id)
+    except ValueError:
+        plan = None
+    if plan is None:
+        return [utilisation, np.nan, errors, np.nan]
+    rooms = plan.rooms()
+    names = [plan.name(i) or "" for i in rooms]
+    areas = plan.rects["w"][rooms] * plan.rects["h"][rooms]
+    bedrooms = sum(1 for name in names if _BEDROOM_RE.search(name))
+    circulation_area = sum(area for name, area in zip(names, areas) if _CIRCULATION_RE.search(name))
+    circulation = circulation_area / areas.sum() if areas.sum() else np.nan
+    return [utilisation, bedrooms, errors, circulation]
+
+
+def rank_variants(candidates, num_bedrooms):
+    """Score and order candidate plans, best first.
+
+    Args:
+        candidates: `(plan_id, quality report)` pairs.
+        num_bedrooms: Bedrooms asked for.
+
+    Returns:
+        `(order, scores, penalties)`: candidate indices best first, each
+        candidate's score (1 is ideal) and its per-criterion penalties
+        (a `len(candidates) x len(CRITERIA)` array).
+    """
+    raw = np.array([measure(plan_id, quality) for plan_id, quality in candidates], dtype=np.float64).reshape(-1, len(CRITERIA))
+    utilisation, bedrooms, errors, circulation = raw.T
+    low, high = CIRCULATION_RANGE
+    penalties = np.column_stack([
+        np.abs(utilisation - TARGET_UTILISATION) / TARGET_UTILISATION,
+        np.abs(bedrooms - num_bedrooms) / max(num_bedrooms, 1),
+        errors / MAX_ERRORS,
+        (np.maximum(low - circulation, 0) + np.maximum(circulation - high, 0)) / low,
+    ])
+    # Unknown criteria neither help nor hurt: they get the candidates' average
+    penalties = np.clip(penalties, 0, 1)
+    known = (~np.isnan(penalties)).sum(axis=0)
+    means = np.nansum(penalties, axis=0) / np.maximum(known, 1)
+    penalties = np.where(np.isnan(penalties), means, penalties)
+    scores = 1 - penalties @ WEIGHTS
+    order = np.argsort(-scores, kind="stable")
+    return order, scores, penalties
@@ -0,0 +1,257 @@
+import math
+import os
+import re
+import threading
+
+from app.ai.cache import normalize_specs
+from app.ai.floors import use_per_floor
+from app.ai.layout import use_layout
+from app.ai.plan_store import plan_store
+from app.ai.quality import check_stored_plan, rejected
+
+# Largest relative difference in plot area a stored plan may be rescaled across
+RESCALE_TOLERANCE = float(os.getenv("RESCALE_TOLERANCE", "0.1"))
+RESCALE_ENABLED = os.getenv("RESCALE_ENABLED", "true").lower() == "true"
+
+# Attributes holding plain lengths/coordinates
+_LENGTH_ATTRS = {"x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "width", "height", "dx", "dy"}
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_NUMBER_RE = re.compile(_NUMBER)
+_LENGTH_RE = re.compile(rf"^\s*({_NUMBER})\s*(px)?\s*$")
+_TAG_RE = re.compile(r"(<[^>]*>)")
+_ATTR_RE = re.compile(r"""(\s)([\w:-]+)(\s*=\s*)(["'])(.*?)\4""", re.S)
+_PATH_TOKEN_RE = re.compile(rf"([MmZzLlHhVvCcSsQqTtAa])|({_NUMBER})")
+_TRANSFORM_RE = re.compile(r"(\w+)\s*\(([^)]*)\)")
+
+# Numbers in text labels that measure the plan: areas (150 sq ft), the plot
+# size in the title (10 Marlas), feet-inch lengths (12'6") and plain lengths in
+# feet or room dimensions (12' x 14', 10x12)
+_LABEL_RE = re.compile(
+    r"(?P<area>\d+(?:,\d{3})*(?:\.\d+)?)(?=\s*(?:sq\.?\s*ft|sqft|ft²|square\s+feet))"
+    r"|(?P<marla>\d+(?:\.\d+)?)(?=\s*marlas?\b)"
+    r"|(?P<feet>\d+)\s*['′]\s*-?\s*(?P<inches>\d+(?:\.\d+)?)\s*[\"″]"
+    r"|(?P<length>\d+(?:\.\d+)?)(?=\s*(?:['′]|ft\b|feet\b|[xX×]\s*\d))"
+    r"|(?<=[xX×])(?P<space>\s*)(?P<second>\d+(?:\.\d+)?)",
+    re.I,
+)
+
+
+def _fmt(value, like, decimals=2):
+    """Format `value` with at least `decimals` places, or as many as `like` had."""
+    if "." in like and "e" not in like.lower():
+        decimals = max(decimals, min(len(like.split(".")[1]), 3))
+    return f"{value:.{decimals}f}".rstrip("0").rstrip(".")
+
+
+def _scale_number_list(text, scale):
+    return _NUMBER_RE.sub(lambda m: _fmt(float(m.group()) * scale, m.group()), text)
+
+
+def _scale_length(value, scale):
+    match = _LENGTH_RE.match(value)
+    if not match:
+        return value  # Percentages, em and other relative units stay as they are
+    return _fmt(float(match.group(1)) * scale, match.group(1)) + (match.group(2) or "")
+
+
+def _scale_path(d, scale):
+    """Scale path data; arc flags and rotations are left untouched."""
+    out = []
+    command = ""
+    index = 0
+    last = 0
+    for match in _PATH_TOKEN_RE.finditer(d):
+        out.append(d[last:match.start()])
+        last = match.end()
+        if match.group(1):
+            command = match.group(1)
+            index = 0
+            out.append(command)
+            continue
+        token = match.group(2)
+        if command in "Aa" and index % 7 in (2, 3, 4):
+            out.append(token)
+        else:
+            out.append(_fmt(float(token) * scale, token))
+        index += 1
+    out.append(d[last:])
+    return "".join(out)
+
+
+def _scale_transform(value, scale):
+    def replace(match):
+        name, args = match.group(1), match.group(2)
+        numbers = _NUMBER_RE.findall(args)
+        if name == "translate":
+            scaled = [_fmt(float(n) * scale, n) for n in numbers]
+        elif name == "matrix" and len(numbers) == 6:
+            scaled = numbers[:4] + [_fmt(float(n) * scale, n) for n in numbers[4:]]
+        elif name == "rotate" and len(numbers) == 3:
+            scaled = numbers[:1] + [_fmt(float(n) * scale, n) for n in numbers[1:]]
+        else:
+            return match.group()
+        return f"{name}({' '.join(scaled)})"
+    return _TRANSFORM_RE.sub(replace, value)
+
+
+def _scale_attribute(name, value, scale):
+    if name in _LENGTH_ATTRS:
+        return _scale_length(value, scale)
+    if name in ("viewBox", "points"):
+        return _scale_number_list(value, scale)
+    if name == "d":
+        return _scale_path(value, scale)
+    if name == "transform":
+        return _scale_transform(value, scale)
+    return value
+
+
+def _scale_tag(tag, scale):
+    if tag.startswith(("<!", "<?", "</")):
+        return tag
+    return _ATTR_RE.sub(
+        lambda m: m.group(1) + m.group(2) + m.group(3) + m.group(4) + _scale_attribute(m.group(2), m.group(5), scale) + m.group(4),
+        tag,
+    )
+
+
+def _scale_label(text, scale, target_marla):
+    def replace(match):
+        if match.group("area"):
+            return f"{float(match.group('area').replace(',', '')) * scale * scale:,.0f}"
+        if match.group("marla"):
+            return _fmt(float(target_marla), "", 2)
+        if match.group("feet"):
+            inches = round((int(match.group("feet")) * 12 + float(match.group("inches"))) * scale)
+            return f"{inches // 12}'{inches % 12}\""
+        if match.group("length"):
+            return _fmt(float(match.group("length")) * scale, match.group("length"), 1)
+        return match.group("space") + _fmt(float(match.group("second")) * scale, match.group("second"), 1)
+    return _LABEL_RE.sub(replace, text)
+
+
+def rescale_svg(svg_content, source_marla, target_marla):
+    """Rescale a floor plan drawn for `source_marla` to a `target_marla` plot.
+
+    Lengths grow with the square root of the area ratio: coordinates, sizes,
+    path data and translations are scaled, as are the dimension, area and
+    plot-size labels in the text. Stroke widths and font sizes are kept so the
+    drawing reads the same.
+    """
+    scale = math.sqrt(float(target_marla) / float(source_marla))
+    parts = _TAG_RE.split(svg_content)
+    in_raw = False  # Inside <style>/<script>, whose text isn't a label
+    for i, part in enumerate(parts):
+        if i % 2:
+            lowered = part.lower()
+            if lowered.startswith(("<style", "<script")) and not part.endswith("/>"):
+                in_raw = True
+            elif lowered.startswith(("</style", "</script")):
+                in_raw = False
+            parts[i] = _scale_tag(part, scale)
+        elif part and not in_raw:
+            parts[i] = _scale_label(part, scale, target_marla)
+    return "".join(parts)
+
+
+def _program(spec, engine="llm", per_floor=False):
+    """Everything but the plot size must match for a plan to be rescaled, down to how it was drawn."""
+    return (spec["house_type"], spec["num_bedrooms"], spec["num_floors"], tuple(spec["additional_preferences"]), engine, per_floor)
+
+
+class RescaleIndex:
+    """Stored model-generated plans grouped by room program and engine.
+
+    Whenever the store's directory changes, only the metadata of plans not
+    seen before is read, so lookups normally don't touch the disk. A plan's
+    quality is checked the first time it is the nearest match, and plans
+    failing the checks are dropped.
+    """
+
+    def __init__(self, store=plan_store):
+        self.store = store
+        self._by_program = {}
+        self._known = set()
+        self._checked = set()
+        self._version = None
+        self._lock = threading.Lock()
+        self.derived = 0
+
+    def _refresh(self):
+        try:
+            version = os.stat(self.store.directory).st_mtime_ns
+            names = os.listdir(self.store.directory) if version != self._version else []
+        except FileNotFoundError:
+            return
+        for name in names:
+            plan_id, extension = os.path.splitext(name)
+            if extension != ".json" or plan_id in self._known:
+                continue
+            meta = self.store.load_metadata(plan_id)
+            # Metadata is written before the SVG; wait until the plan is complete
+            if not meta or not os.path.exists(os.path.join(self.store.directory, f"{plan_id}.svg")):
+                continue
+            self._known.add(plan_id)
+            spec = meta.get("specs")
+            # Only rescale originals: derived plans would compound the error and
+            # procedural plans are cheaper to draw again at the right size
+            if not spec or meta.get("derived_from") or meta.get("engine") == "procedural":
+                continue
+            program = _program(spec, meta.get("engine", "llm"), bool(meta.get("floor_plan_ids")))
+            self._by_program.setdefault(program, []).append((spec["num_marla"], plan_id))
+        self._version = version
+
+    def nearest(self, specs, tolerance=RESCALE_TOLERANCE):
+        """Return `(plan_id, num_marla)` of the closest rescalable plan, or None."""
+        spec = normalize_specs(specs)
+        program = _program(spec, "layout" if use_layout(specs) else "llm", use_per_floor(specs))
+        with self._lock:
+            self._refresh()
+            candidates = list(self._by_program.get(program, []))
+        target = spec["num_marla"]
+        in_range = [
+            (abs(marla - target) / marla, marla, plan_id) for marla, plan_id in candidates
+            if marla > 0 and abs(marla - target) / marla <= tolerance
+        ]
+        for _, marla, plan_id in sorted(in_range):
+            if plan_id not in self._checked:
+                # A failing plan is stored (but not cached); rescaled, it would fail too
+                if rejected(check_stored_plan(plan_id, marla)):
+                    with self._lock:
+                        if (marla, plan_id) in self._by_program.get(program, []):
+                            self._by_program[program].remove((marla, plan_id))
+                    continue
+                self._checked.add(plan_id)
+            return plan_id, marla
+        return None
+
+    def stats(self):
+        return {
+            "programs": len(self._by_program),
+            "plans": sum(len(plans) for plans in self._by_program.values()),
+            "derived": self.derived,
+        }
+
+
+rescale_index = RescaleIndex()
+
+
+def derive_plan(specs):
+    """Rescale the nearest stored plan to `specs.num_marla`.
+
+    Returns:
+        `(svg_content, source_plan_id)`, or None if no stored plan is close
+        enough.
+    """
+    if not RESCALE_ENABLED:
+        return None
+    found = rescale_index.nearest(specs)
+    if found is None:
+        return None
+    plan_id, marla = found
+    svg_content = plan_store.load_svg(plan_id)
+    if svg_content is None:
+        return None
+    rescale_index.derived += 1
+    return rescale_svg(svg_content, marla, specs.num_marla), plan_id
@@ -0,0 +1,123 @@
+import math
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from app.ai.cache import normalize_specs
+from app.ai.plan_store import plan_store
+
+HOUSE_TYPE_DIMS = 16
+PREFERENCE_DIMS = 32
+
+# Feature weights: how far apart two plans are per unit of each feature.
+# Plot size is compared on a log2 scale, so 5 vs 10 marla counts like 7 vs 14.
+MARLA_WEIGHT = 3.0
+BEDROOM_WEIGHT = 1.0
+FLOOR_WEIGHT = 2.0
+HOUSE_TYPE_WEIGHT = 2.0
+PREFERENCE_WEIGHT = 1.5
+
+DIMS = 3 + HOUSE_TYPE_DIMS + PREFERENCE_DIMS
+
+
+def _bucket(text, size):
+    # crc32 rather than hash(), which is salted differently in every process
+    return zlib.crc32(text.encode("utf-8")) % size
+
+
+def spec_vector(spec):
+    """Encode normalized specs (see `normalize_specs`) as a weighted feature vector."""
+    vector = np.zeros(DIMS, dtype=np.float32)
+    vector[0] = MARLA_WEIGHT * math.log2(max(spec["num_marla"], 0.1))
+    vector[1] = BEDROOM_WEIGHT * spec["num_bedrooms"]
+    vector[2] = FLOOR_WEIGHT * spec["num_floors"]
+    vector[3 + _bucket(spec["house_type"], HOUSE_TYPE_DIMS)] = HOUSE_TYPE_WEIGHT
+    preferences = spec["additional_preferences"]
+    if preferences:
+        offset = 3 + HOUSE_TYPE_DIMS
+        for preference in preferences:
+            vector[offset + _bucket(preference, PREFERENCE_DIMS)] += 1.0
+        vector[offset:] *= PREFERENCE_WEIGHT / np.linalg.norm(vector[offset:])
+    return vector
+
+
+class SimilarPlanIndex:
+    """In-memory nearest-neighbour index over the specs of every stored plan.
+
+    Spec vectors live in one contiguous matrix and a query is a single
+    vectorized distance computation plus `argpartition`, which stays in the
+    low milliseconds up to hundreds of thousands of plans. New plans are
+    picked up incrementally when the plan store's directory changes.
+    """
+
+    def __init__(self, store=plan_store):
+        self.store = store
+        self._vectors = np.zeros((0, DIMS), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)  # Squared length of each row
+        self._plans = []  # Metadata of the plan in each row of `_vectors`
+        self._known = set()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            version = os.stat(self.store.directory).st_mtime_ns
+            names = os.listdir(self.store.directory) if version != self._version else []
+        except FileNotFoundError:
+            return
+        added_plans, added_vectors = [], []
+        for name in names:
+            plan_id, extension = os.path.splitext(name)
+            if extension != ".json" or plan_id in self._known:
+                continue
+            meta = self.store.load_metadata(plan_id)
+            # Metadata is written before the SVG; wait until the plan is complete
+            if not meta or not meta.get("specs") or not os.path.exists(os.path.join(self.store.directory, f"{plan_id}.svg")):
+                continue
+            self._known.add(plan_id)
+            added_plans.append({
+                "plan_id": plan_id,
+                "specs": meta["specs"],
+                "engine": meta.get("engine", "llm"),
+                "derived_from": meta.get("derived_from"),
+            })
+            added_vectors.append(spec_vector(meta["specs"]))
+        if added_vectors:
+            added = np.stack(added_vectors)
+            self._vectors = np.vstack([self._vectors, added])
+            self._norms = np.concatenate([self._norms, (added * added).sum(axis=1)])
+            self._plans.extend(added_plans)
+        self._version = version
+
+    def query(self, specs, k=5):
+        """Return the `k` stored plans whose specs are closest to `specs`.
+
+        Returns:
+            A list of plan summaries (id, specs, engine, derived_from and
+            distance), nearest first.
+        """
+        target = spec_vector(normalize_specs(specs))
+        with self._lock:
+            self._refresh()
+            vectors, norms, plans = self._vectors, self._norms, self._plans
+        count = len(vectors)
+        if not count:
+            return []
+        # |v - t|^2 = |v|^2 - 2 v.t + |t|^2; the last term doesn't change the ranking
+        scores = norms - 2.0 * (vectors @ target)
+        k = min(k, count)
+        nearest = np.argpartition(scores, k - 1)[:k] if k < count else np.arange(count)
+        nearest = nearest[np.argsort(scores[nearest], kind="stable")]
+        target_norm = float(target @ target)
+        return [
+            {**plans[i], "distance": round(math.sqrt(max(0.0, float(scores[i]) + target_norm)), 4)}
+            for i in nearest
+        ]
+
+    def stats(self):
+        return {"plans": len(self._plans)}
+
+
+similar_plans = SimilarPlanIndex()
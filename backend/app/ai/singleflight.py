@@ -0,0 +1,60 @@
+import asyncio
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    await the same task and receive its result or its exception. When every
+    waiter has gone away (e.g. all clients disconnected) the task is cancelled.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"leaders": 0, "followers": 0, "cancelled": 0}
+
+    async def do(self, key, fn):
+        """Run `fn()` for `key`, or join the call already running for it.
+
+        Args:
+            key: Identity of the work, e.g. a spec cache key.
+            fn: Zero-argument coroutine function doing the work.
+
+        Returns:
+            Whatever `fn()` returns.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["followers"] += 1
+
+        call.waiters += 1
+        try:
+            # shield() so one waiter being cancelled doesn't cancel the work
+            # the others are still waiting on.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self.counters["cancelled"] += 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self):
+        return {**self.counters, "in_flight": len(self._calls)}
+
+
+generation_flight = SingleFlight()
@@ -0,0 +1,79 @@
+"""Abort a streamed generation as soon as it can't produce a usable plan.
+
+Without streaming, a reply with no SVG in it or with markup beyond repair is
+only discovered once the whole generation (up to a minute) has arrived. While
+streaming, `StreamGuard` watches the output as it comes in and gives up on it
+within a few seconds when:
+
+- no `<svg` has started within the first `SVG_START_CHARS` characters;
+- the SVG grows past `STREAM_MAX_SVG_CHARS`, which only runaway output
+  (the same shapes over and over) reaches;
+- the SVG received so far can't be repaired (see `svg_repair`), checked every
+  `STRUCTURE_CHECK_CHARS` characters.
+
+`stream_svg` then retries, up to `STREAM_RETRIES` times per request.
+"""
+import os
+from collections import Counter
+
+from langchain.schema.output_parser import OutputParserException
+
+from app.ai.svg_parser import SVGExtractor
+from app.ai.svg_repair import InvalidSVG, check_partial_svg
+
+STREAM_RETRIES = int(os.getenv("STREAM_RETRIES", "2"))
+# About 200 tokens: room for a sentence or two of preamble and a code fence
+SVG_START_CHARS = int(os.getenv("STREAM_SVG_START_CHARS", "800"))
+# Generated plans are 10-30 KB
+STREAM_MAX_SVG_CHARS = int(os.getenv("STREAM_MAX_SVG_CHARS", str(128 * 1024)))
+STRUCTURE_CHECK_CHARS = int(os.getenv("STREAM_STRUCTURE_CHECK_CHARS", "4096"))
+
+stream_stats = Counter()
+
+
+class StreamAborted(OutputParserException):
+    """A streamed generation given up on before it finished."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason  # "no_svg", "too_large" or "invalid"
+
+
+class StreamGuard:
+    """Extract the SVG from streamed output, aborting early on hopeless output."""
+
+    def __init__(self):
+        self.extractor = SVGExtractor(max_chars=STREAM_MAX_SVG_CHARS)
+        self._checked_at = 0  # `extractor.seen` at the last structure check
+
+    def feed(self, text):
+        """Scan the next chunk of output.
+
+        Returns:
+            The complete SVG once its closing tag has been seen, else None.
+
+        Raises:
+            StreamAborted: If the output should be given up on.
+        """
+        extractor = self.extractor
+        try:
+            svg_content = extractor.feed(text)
+        except OutputParserException as e:
+            self._abort("too_large", str(e))
+        if svg_content is not None:
+            return svg_content
+        if not extractor.started:
+            if extractor.seen > SVG_START_CHARS:
+                self._abort("no_svg", f"No SVG in the first {extractor.seen} characters")
+        elif extractor.seen - self._checked_at >= STRUCTURE_CHECK_CHARS:
+            self._checked_at = extractor.seen
+            try:
+                check_partial_svg(extractor.partial())
+            except InvalidSVG as e:
+                self._abort("invalid", str(e))
+        return None
+
+    @staticmethod
+    def _abort(reason, message):
+        stream_stats[f"aborted_{reason}"] += 1
+        raise StreamAborted(reason, message)
@@ -0,0 +1,617 @@
+"""Shrink generated SVG without changing how it renders.
+
+Model output is verbose: every shape repeats its stroke and font attributes,
+coordinates carry six decimals, doors and windows are drawn again and again
+and the markup is padded with comments and indentation. `optimize_svg` runs
+these passes over a (well-formed, see `svg_repair`) document:
+
+- comments, processing instructions and indentation are dropped;
+- attributes that restate a default (`opacity="1"`, `x="0"`, ...) are dropped;
+- numbers are rounded to `SVG_PRECISION` decimals and path data rewritten
+  compactly;
+- runs of sibling lines, or of unfilled paths, drawn with the same attributes
+  are merged into one path;
+- shapes repeated at different positions are defined once in `<defs>` and
+  placed with `<use>`;
+- style attributes repeated across elements are hoisted into CSS classes.
+
+Each rewrite is only applied where it can't change the rendering (e.g.
+nothing that a stylesheet in the document might also style is touched) and
+where it makes the document smaller.
+
+ImageMagick's built-in SVG renderer ignores stylesheets and may not resolve
+`<use>`, so `expand_for_raster` undoes those two passes before a plan is
+rasterized.
+"""
+import os
+import re
+from collections import Counter
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+from app.ai.svg_repair import SVG_NS, XLINK_NS
+
+SVG_OPTIMIZE_ENABLED = os.getenv("SVG_OPTIMIZE_ENABLED", "true").lower() == "true"
+# Decimals kept in coordinates; plans are drawn at ~8px per foot, so 2 is plenty
+SVG_PRECISION = int(os.getenv("SVG_PRECISION", "2"))
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_NUMBER_RE = re.compile(_NUMBER)
+_PLAIN_NUMBER_RE = re.compile(rf"^\s*({_NUMBER})\s*$")
+_PATH_TOKEN_RE = re.compile(rf"\s*,?\s*(?:([MmZzLlHhVvCcSsQqTtAa])|({_NUMBER}))")
+_TRANSLATE_RE = re.compile(rf"^\s*translate\(\s*({_NUMBER})(?:\s*,?\s*({_NUMBER}))?\s*\)\s*$")
+_CSS_PROPERTY_RE = re.compile(r"([\w-]+)\s*:")
+# A stylesheet of nothing but `.class{declarations}` rules, as `_hoist_styles` writes
+_CLASS_RULES_RE = re.compile(r"^(?:\.[\w-]+\{[^{}]*\})+$")
+_CLASS_RULE_RE = re.compile(r"\.([\w-]+)\{([^{}]*)\}")
+
+# Attributes whose value is a number or a list of numbers
+NUMERIC_ATTRS = {
+    "x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "dx", "dy", "width", "height",
+    "stroke-width", "font-size", "points", "viewBox",
+}
+PATH_ARITY = {"m": 2, "l": 2, "h": 1, "v": 1, "c": 6, "s": 4, "q": 4, "t": 2, "a": 7, "z": 0}
+
+# Properties that may be hoisted from presentation attributes into classes
+PRESENTATION_ATTRS = {
+    "fill", "fill-opacity", "fill-rule", "stroke", "stroke-width", "stroke-opacity", "stroke-dasharray",
+    "stroke-dashoffset", "stroke-linecap", "stroke-linejoin", "stroke-miterlimit", "opacity",
+    "font-family", "font-size", "font-weight", "font-style", "text-anchor", "dominant-baseline",
+    "letter-spacing", "text-decoration",
+}
+# CSS (unlike presentation attributes) needs units on these
+_CSS_LENGTH_PROPERTIES = {"font-size", "letter-spacing"}
+
+# Inherited properties at their initial value; dropped where nothing above sets them
+INHERITED_DEFAULTS = {
+    "fill-opacity": "1", "stroke-opacity": "1", "fill-rule": "nonzero", "stroke": "none", "stroke-width": "1",
+    "stroke-dasharray": "none", "stroke-dashoffset": "0", "stroke-linecap": "butt", "stroke-linejoin": "miter",
+    "stroke-miterlimit": "4", "font-style": "normal", "text-anchor": "start",
+}
+# Positions that default to zero, per element
+ZERO_DEFAULTS = {
+    "rect": {"x", "y"}, "use": {"x", "y"}, "image": {"x", "y"},
+    "line": {"x1", "y1", "x2", "y2"}, "circle": {"cx", "cy"}, "ellipse": {"cx", "cy"},
+}
+# Containers whose content is drawn elsewhere (or not at all), and whose
+# children mustn't be moved or merged
+_REFERENCED_CONTAINERS = {"defs", "symbol", "marker", "pattern", "clipPath", "mask", "linearGradient", "radialGradient"}
+_TEXT_CONTAINERS = {"text", "tspan", "textPath", "title", "desc", "style", "script"}
+_MERGE_PARENTS = {"svg", "g", "a"}
+
+optimize_stats = Counter()
+
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children")
+
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []  # _Node or text
+
+
+def _parse(svg_content):
+    """Parse into a tree of `_Node`, dropping comments and processing instructions."""
+    root = None
+    stack = []
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    def start(name, attrs):
+        nonlocal root
+        node = _Node(name, attrs)
+        if stack:
+            stack[-1].children.append(node)
+        else:
+            root = node
+        stack.append(node)
+
+    def end(name):
+        stack.pop()
+
+    def text(data):
+        if stack:
+            stack[-1].children.append(data)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
+    parser.Parse(svg_content.encode("utf-8"), True)
+    return root
+
+
+def _serialize(node, out):
+    out.append("<" + node.tag)
+    for key, value in node.attrs.items():
+        out.append(f' {key}="{escape(value, {chr(34): "&quot;"})}"')
+    if not node.children:
+        out.append("/>")
+        return
+    out.append(">")
+    for child in node.children:
+        if isinstance(child, str):
+            out.append(escape(child))
+        else:
+            _serialize(child, out)
+    out.append(f"</{node.tag}>")
+
+
+def _to_string(node):
+    out = []
+    _serialize(node, out)
+    return "".join(out)
+
+
+def _fmt(value, precision):
+    text = f"{value:.{precision}f}".rstrip("0").rstrip(".") if precision > 0 else f"{value:.0f}"
+    return "0" if text == "-0" else text
+
+
+def _style_declarations(style):
+    """Parse a `style` attribute; None if it holds anything but plain declarations."""
+    if any(c in style for c in "{}<!") or "/*" in style:
+        return None
+    declarations = {}
+    for part in style.split(";"):
+        if not part.strip():
+            continue
+        name, sep, value = part.partition(":")
+        if not sep or not name.strip() or not value.strip():
+            return None
+        declarations[name.strip()] = value.strip()
+    return declarations
+
+
+def _properties(node):
+    """Presentation properties the element sets, by attribute or inline style."""
+    props = {key: value for key, value in node.attrs.items() if key in PRESENTATION_ATTRS}
+    props.update(_style_declarations(node.attrs.get("style", "")) or {})
+    return props
+
+
+def _walk(node, in_referenced=False):
+    """Yield `(node, parent, in_referenced)` for every element below `node`."""
+    for child in node.children:
+        if isinstance(child, _Node):
+            yield child, node, in_referenced
+            yield from _walk(child, in_referenced or child.tag in _REFERENCED_CONTAINERS)
+
+
+def _strip_whitespace(node):
+    if node.tag in _TEXT_CONTAINERS:
+        return
+    node.children = [c for c in node.children if not isinstance(c, str) or c.strip()]
+    for child in node.children:
+        if isinstance(child, _Node):
+            _strip_whitespace(child)
+
+
+def _drop_defaults(node, css_properties, inherited=frozenset(), in_referenced=False):
+    """Drop attributes that restate the initial value of their property."""
+    for key in list(node.attrs):
+        value = node.attrs[key].strip()
+        if key in ("style", "class", "transform") and not value:
+            del node.attrs[key]
+        elif key == "opacity" and value == "1":
+            del node.attrs[key]
+        elif key in ZERO_DEFAULTS.get(node.tag, ()) and _PLAIN_NUMBER_RE.match(value) and float(value) == 0:
+            del node.attrs[key]
+        elif (
+            INHERITED_DEFAULTS.get(key) == value
+            and key not in inherited
+            and key not in css_properties
+            # Content of <defs> inherits from wherever it is used
+            and not in_referenced
+        ):
+            del node.attrs[key]
+    inherited = inherited | _properties(node).keys()
+    for child in node.children:
+        if isinstance(child, _Node):
+            _drop_defaults(child, css_properties, inherited, in_referenced or child.tag in _REFERENCED_CONTAINERS)
+
+
+def parse_path(d):
+    """Parse path data into `[command, [numbers]]` pairs, or None if it isn't well-formed."""
+    commands = []
+    index = 0
+    d = d.strip()
+    while index < len(d):
+        match = _PATH_TOKEN_RE.match(d, index)
+        if not match:
+            return None
+        index = match.end()
+        if match.group(1):
+            commands.append([match.group(1), []])
+        elif not commands:
+            return None
+        else:
+            commands[-1][1].append(float(match.group(2)))
+    for command, args in commands:
+        arity = PATH_ARITY[command.lower()]
+        if (arity == 0 and args) or (arity and (not args or len(args) % arity)):
+            return None
+        if command in "Aa" and any(args[i] not in (0, 1) for i in range(len(args)) if i % 7 in (3, 4)):
+            return None  # Most likely compact arc flags ("011"), which this doesn't parse
+    return commands
+
+
+def _absolute_start(commands):
+    """Spell a path's leading "m" as "M", which it means, so the path can follow another one."""
+    command, args = commands[0]
+    if command == "m":
+        commands = [["M", args[:2]]] + ([["l", args[2:]]] if len(args) > 2 else []) + commands[1:]
+    return commands
+
+
+def _format_path(commands, precision):
+    out = []
+    previous = None
+    last_was_number = False
+    for command, args in commands:
+        # Repeated commands needn't be restated, except moves (more pairs mean lineto)
+        if command != previous or command in "Mm" or not args:
+            out.append(command)
+            last_was_number = False
+        for value in args:
+            text = _fmt(value, precision)
+            if last_was_number and not text.startswith("-"):
+                out.append(" ")
+            out.append(text)
+            last_was_number = True
+        previous = command
+    return "".join(out)
+
+
+def _round_numbers(root, precision):
+    for node, _, _ in _walk(root):
+        for key, value in node.attrs.items():
+            if key == "d":
+                commands = parse_path(value)
+                if commands is not None:
+                    node.attrs[key] = _format_path(commands, precision)
+            elif key in NUMERIC_ATTRS:
+                node.attrs[key] = _NUMBER_RE.sub(lambda m: _fmt(float(m.group()), precision), value)
+
+
+def _line_path(node):
+    """Path data for a `<line>`, or None if its coordinates aren't plain numbers."""
+    coordinates = []
+    for key in ("x1", "y1", "x2", "y2"):
+        match = _PLAIN_NUMBER_RE.match(node.attrs.get(key, "0"))
+        if not match:
+            return None
+        coordinates.append(float(match.group(1)))
+    x1, y1, x2, y2 = coordinates
+    if y1 == y2:
+        return [["M", [x1, y1]], ["H", [x2]]]
+    if x1 == x2:
+        return [["M", [x1, y1]], ["V", [y2]]]
+    return [["M", [x1, y1]], ["L", [x2, y2]]]
+
+
+def _merge_key(node, translucent):
+    """Key under which sibling elements can be merged into one path, or None."""
+    if node.tag not in ("line", "path") or "id" in node.attrs or translucent:
+        return None
+    props = _properties(node)
+    if any(key.startswith("marker") for key in props) or any(props.get(key, "1") != "1" for key in ("opacity", "stroke-opacity")):
+        return None
+    if node.tag == "path":
+        # Overlapping fills of separate paths don't combine like one path's
+        if props.get("fill") != "none" or "class" in node.attrs or parse_path(node.attrs.get("d", "")) is None:
+            return None
+        return tuple(sorted((k, v) for k, v in node.attrs.items() if k != "d"))
+    if _line_path(node) is None:
+        return None
+    geometry = ("x1", "y1", "x2", "y2")
+    return ("line",) + tuple(sorted((k, v) for k, v in node.attrs.items() if k not in geometry))
+
+
+def _merge_paths(node, precision, translucent=False):
+    """Merge runs of siblings with the same merge key into one path."""
+    if node.tag in _TEXT_CONTAINERS or node.tag in _REFERENCED_CONTAINERS:
+        return
+    translucent = translucent or _properties(node).get("stroke-opacity", "1") != "1"
+    if node.tag in _MERGE_PARENTS:
+        merged = []
+        run = []
+        run_key = None
+
+        def flush():
+            if len(run) < 2:
+                merged.extend(run)
+                return
+            commands = []
+            for item in run:
+                item_commands = _line_path(item) if item.tag == "line" else _absolute_start(parse_path(item.attrs["d"]))
+                commands.extend(item_commands)
+            first = run[0]
+            attrs = {k: v for k, v in first.attrs.items() if k not in ("x1", "y1", "x2", "y2", "d")}
+            attrs["d"] = _format_path(commands, precision)
+            merged.append(_Node("path", attrs))
+
+        for child in node.children:
+            key = _merge_key(child, translucent) if isinstance(child, _Node) else None
+            if key is not None and key == run_key:
+                run.append(child)
+                continue
+            flush()
+            run, run_key = ([child], key) if key is not None else ([], None)
+            if key is None:
+                merged.append(child)
+        flush()
+        node.children = merged
+    for child in node.children:
+        if isinstance(child, _Node):
+            _merge_paths(child, precision, translucent)
+
+
+def _placement(node, precision):
+    """Split a shape into (position-free definition, x, y), or None if it can't be placed with `<use>`."""
+    if "id" in node.attrs or any("id" in n.attrs for n, _, _ in _walk(node)):
+        return None
+    if node.tag == "path" and "transform" not in node.attrs:
+        commands = parse_path(node.attrs.get("d", ""))
+        if not commands or commands[0][0] not in "Mm" or (commands[0][0] == "M" and len(commands[0][1]) > 2):
+            return None
+        if any(command not in "Zz" and command.isupper() for command, _ in commands[1:]):
+            return None  # Absolute coordinates move with the origin
+        x, y = commands[0][1][:2]
+        rest = commands[0][1][2:]
+        normalized = [["M", [0, 0]]] + ([["l", rest]] if rest else []) + commands[1:]
+        definition = _Node("path", {**node.attrs, "d": _format_path(normalized, precision)})
+        return definition, x, y
+    if node.tag == "g":
+        match = _TRANSLATE_RE.match(node.attrs.get("transform", ""))
+        if not match:
+            return None
+        definition = _Node("g", {k: v for k, v in node.attrs.items() if k != "transform"})
+        definition.children = node.children
+        return definition, float(match.group(1)), float(match.group(2) or 0)
+    return None
+
+
+def _unique_names(prefix, taken):
+    index = 0
+    while True:
+        name = f"{prefix}{index}"
+        index += 1
+        if name not in taken:
+            yield name
+
+
+def _dedupe_shapes(root, precision, taken_ids):
+    """Define shapes repeated at different positions once and `<use>` them."""
+    occurrences = {}
+
+    def collect(parent):
+        for node in parent.children:
+            if not isinstance(node, _Node) or node.tag in _REFERENCED_CONTAINERS:
+                continue
+            placement = _placement(node, precision) if parent.tag in _MERGE_PARENTS else None
+            if placement is None:
+                collect(node)
+                continue
+            # Shapes inside a placed group are left to the group's definition
+            definition, x, y = placement
+            occurrences.setdefault(_to_string(definition), []).append((node, definition, x, y))
+
+    collect(root)
+
+    names = _unique_names("u", taken_ids)
+    definitions = []
+    replacements = {}
+    for serialized, found in occurrences.items():
+        if len(found) < 2:
+            continue
+        name = next(names)
+        uses = []
+        for node, definition, x, y in found:
+            attrs = {"xlink:href": f"#{name}"}
+            if x:
+                attrs["x"] = _fmt(x, precision)
+            if y:
+                attrs["y"] = _fmt(y, precision)
+            uses.append(_Node("use", attrs))
+        before = sum(len(_to_string(node)) for node, *_ in found)
+        after = len(serialized) + len(f' id="{name}"') + sum(len(_to_string(use)) for use in uses)
+        if after >= before:
+            continue
+        definition = found[0][1]
+        definition.attrs = {"id": name, **definition.attrs}
+        definitions.append(definition)
+        for (node, *_), use in zip(found, uses):
+            replacements[id(node)] = use
+    if not definitions:
+        return
+
+    for node, _, _ in [(root, None, False), *_walk(root)]:
+        if any(id(child) in replacements for child in node.children):
+            node.children = [replacements.get(id(child), child) for child in node.children]
+    defs = next((child for child in root.children if isinstance(child, _Node) and child.tag == "defs"), None)
+    if defs is None:
+        defs = _Node("defs", {})
+        root.children.insert(0, defs)
+    defs.children.extend(definitions)
+    if root.attrs.get("xmlns:xlink") != XLINK_NS:
+        root.attrs["xmlns:xlink"] = XLINK_NS
+
+
+def _hoist_styles(root, css_properties, taken_classes):
+    """Move style properties shared by several elements into CSS classes."""
+    by_signature = {}
+    for node, _, _ in _walk(root):
+        if node.tag in ("style", "use"):
+            continue
+        style = node.attrs.get("style")
+        if style is not None and _style_declarations(style) is None:
+            continue
+        props = _properties(node)
+        if not props or css_properties & props.keys() or any(c in value for value in props.values() for c in ";{}<"):
+            continue
+        signature = tuple(sorted(props.items()))
+        by_signature.setdefault(signature, []).append(node)
+
+    names = _unique_names("s", taken_classes)
+    rules = []
+    for signature, nodes in sorted(by_signature.items(), key=lambda item: -len(item[1])):
+        if len(nodes) < 2:
+            continue
+        name = next(names)
+        declarations = []
+        for key, value in signature:
+            if key in _CSS_LENGTH_PROPERTIES and _PLAIN_NUMBER_RE.match(value):
+                value += "px"
+            declarations.append(f"{key}:{value}")
+        rule = f".{name}{{{';'.join(declarations)}}}"
+        removed = sum(
+            len(f' {key}="{value}"') for node in nodes for key, value in node.attrs.items()
+            if key in PRESENTATION_ATTRS or key == "style"
+        )
+        added = len(rule) + sum(len(f" {name}") if "class" in node.attrs else len(f' class="{name}"') for node in nodes)
+        if added >= removed:
+            continue
+        rules.append(rule)
+        for node in nodes:
+            for key in [key for key in node.attrs if key in PRESENTATION_ATTRS or key == "style"]:
+                del node.attrs[key]
+            node.attrs["class"] = f"{node.attrs['class']} {name}" if node.attrs.get("class") else name
+    if rules:
+        style = _Node("style", {})
+        style.children.append("".join(rules))
+        root.children.insert(0, style)
+
+
+def _inline_classes(root):
+    """Turn the class rules `_hoist_styles` wrote back into presentation attributes."""
+    rules = {}
+    for style in [child for child in root.children if isinstance(child, _Node) and child.tag == "style"]:
+        css = "".join(child for child in style.children if isinstance(child, str)).strip()
+        if not _CLASS_RULES_RE.match(css):
+            continue
+        found = {name: _style_declarations(body) for name, body in _CLASS_RULE_RE.findall(css)}
+        if all(declarations is not None and declarations.keys() <= PRESENTATION_ATTRS for declarations in found.values()):
+            rules.update(found)
+            root.children.remove(style)
+    if not rules:
+        return False
+    for node, _, _ in _walk(root):
+        names = node.attrs.get("class", "").split()
+        if not any(name in rules for name in names):
+            continue
+        for name in names:
+            for key, value in rules.get(name, {}).items():
+                if key in _CSS_LENGTH_PROPERTIES and value.endswith("px"):
+                    value = value[:-2]
+                node.attrs[key] = value
+        kept = [name for name in names if name not in rules]
+        if kept:
+            node.attrs["class"] = " ".join(kept)
+        else:
+            del node.attrs["class"]
+    return True
+
+
+def _expand_uses(root):
+    """Replace `<use>` of a shape `_dedupe_shapes` defined with a translated copy of it."""
+    expanded = False
+    definitions = {}
+    for node, _, in_referenced in _walk(root):
+        if in_referenced and node.tag in ("path", "g") and "id" in node.attrs and "transform" not in node.attrs:
+            definitions[node.attrs["id"]] = node
+    if not definitions:
+        return False
+    for node, _, _ in [(root, None, False), *_walk(root)]:
+        for index, child in enumerate(node.children):
+            if not isinstance(child, _Node) or child.tag != "use":
+                continue
+            href = child.attrs.get("xlink:href", child.attrs.get("href", ""))
+            definition = definitions.get(href[1:]) if href.startswith("#") else None
+            if definition is None or child.attrs.keys() - {"xlink:href", "href", "x", "y"}:
+                continue
+            attrs = {k: v for k, v in definition.attrs.items() if k != "id"}
+            attrs["transform"] = f"translate({child.attrs.get('x', '0')} {child.attrs.get('y', '0')})"
+            copy = _Node(definition.tag, attrs)
+            copy.children = definition.children
+            node.children[index] = copy
+            expanded = True
+    return expanded
+
+
+def expand_for_raster(svg_content):
+    """Return `svg_content` without the CSS classes and `<use>` that optimizing introduced.
+
+    The result renders the same in a browser, and also in rasterizers that
+    only read presentation attributes. Anything the optimizer didn't write
+    (e.g. a stylesheet with other selectors) is left alone.
+
+    Args:
+        svg_content: An SVG document, typically a stored plan.
+
+    Returns:
+        The expanded SVG, or `svg_content` itself if there is nothing to
+        expand or it can't be parsed.
+    """
+    try:
+        root = _parse(svg_content)
+    except expat.ExpatError:
+        return svg_content
+    if root is None:
+        return svg_content
+    inlined = _inline_classes(root)
+    if not _expand_uses(root) and not inlined:
+        return svg_content
+    return _to_string(root)
+
+
+def optimize_svg(svg_content, precision=SVG_PRECISION):
+    """Return a smaller SVG that renders like `svg_content`.
+
+    Args:
+        svg_content: A well-formed SVG document.
+        precision: Decimals to keep in coordinates.
+
+    Returns:
+        The optimized SVG, or `svg_content` itself if it can't be parsed or
+        optimizing doesn't make it smaller.
+    """
+    if not SVG_OPTIMIZE_ENABLED:
+        return svg_content
+    try:
+        root = _parse(svg_content)
+    except expat.ExpatError:
+        optimize_stats["failed"] += 1
+        return svg_content
+    if root is None or root.tag.lower() != "svg":
+        optimize_stats["failed"] += 1
+        return svg_content
+
+    css = " ".join(
+        child for node, _, _ in [(root, None, False), *_walk(root)] if node.tag == "style"
+        for child in node.children if isinstance(child, str)
+    )
+    css_properties = set(_CSS_PROPERTY_RE.findall(css))
+    ids = {node.attrs["id"] for node, _, _ in _walk(root) if "id" in node.attrs}
+    classes = {name for node, _, _ in _walk(root) for name in node.attrs.get("class", "").split()}
+
+    _strip_whitespace(root)
+    _drop_defaults(root, css_properties)
+    _round_numbers(root, precision)
+    if not css:
+        # Selectors in a stylesheet may depend on element names and nesting,
+        # which merging and <use> change
+        _merge_paths(root, precision)
+        _dedupe_shapes(root, precision, ids)
+    _hoist_styles(root, css_properties, classes)
+    if root.attrs.get("xmlns") is None:
+        root.attrs = {"xmlns": SVG_NS, **root.attrs}
+
+    optimized = _to_string(root)
+    optimize_stats["optimized"] += 1
+    optimize_stats["bytes_in"] += len(svg_content)
+    if len(optimized) >= len(svg_content):
+        optimize_stats["bytes_out"] += len(svg_content)
+        return svg_content
+    optimize_stats["bytes_out"] += len(optimized)
+    return optimized
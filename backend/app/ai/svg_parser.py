@@ -1,26 +1,269 @@
 from langchain.schema.output_parser import BaseOutputParser, OutputParserException
+from typing import Optional
 import re
 
+# Largest SVG kept in memory while extracting; anything bigger is not a floor plan
+MAX_SVG_CHARS = 4 * 1024 * 1024
+
+_NAME_RE = re.compile(r"[A-Za-z_][\w:.-]*")
+# A complete start/end tag; quoted attribute values may contain '>'
+_TAG_RE = re.compile(r"""<(/?)([A-Za-z_][\w:.-]*)((?:[^>"'`]|"[^"]*"|'[^']*')*)>""")
+_TAG_SCAN_RE = re.compile(r"[>\"'`]")
+# A run of text and complete tags that can't end the SVG: anything but <svg>
+# and </svg> tags, comments, CDATA, processing instructions and fences
+_INERT_RE = re.compile(
+    r"""(?:[^<`]+|`(?=[^`]|`[^`])|<(?!/?svg\b|!--|!\[CDATA\[|\?)[A-Za-z_/!][^>"'`]*(?:(?:"[^"]*"|'[^']*')[^>"'`]*)*>)*""",
+    re.I,
+)
+# Longest markup prefix needed to tell what starts at a '<' ("<![CDATA[")
+_LOOKAHEAD = 9
+
+_TERMINATORS = {"comment": "-->", "cdata": "]]>", "pi": "?>"}
+
+
+class SVGExtractor:
+    """Incremental extractor for the first complete `<svg>` element in a text.
+
+    Text is fed in chunks as it arrives and scanned once, so extraction is
+    linear in the input. Markup inside the SVG is tracked well enough to
+    find the matching close tag: nested `<svg>` elements, comments, CDATA
+    sections, processing instructions and quoted attribute values containing
+    `>` are all handled. A markdown fence (```) between tags means the SVG
+    was cut off, and the search resumes after it.
+
+    Before the SVG starts only a few characters are buffered, and the SVG
+    itself may not grow past `max_chars`.
+    """
+
+    def __init__(self, max_chars: int = MAX_SVG_CHARS):
+        self.max_chars = max_chars
+        self.svg: Optional[str] = None
+        self.seen = 0  # Characters fed so far
+        self._head = ""  # Start of the input, for error messages
+        self._mode = "search"
+        self._pending = ""  # Unscanned input that needs more lookahead
+        self._parts = []  # Scanned text of the SVG being collected
+        self._size = 0
+        self._depth = 0
+        self._quote = None
+        self._tag = None  # ("open" | "close" | "other", is_svg) while inside a tag
+        self._last = ""  # Last character scanned
+
+    @property
+    def done(self) -> bool:
+        return self.svg is not None
+
+    @property
+    def started(self) -> bool:
+        return self._mode != "search" or self.done
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Scan the next chunk of text.
+
+        Returns:
+            The complete SVG once its closing tag has been seen, else None.
+
+        Raises:
+            OutputParserException: If the SVG grows past `max_chars`.
+        """
+        if self.done or not chunk:
+            return self.svg
+        self.seen += len(chunk)
+        if len(self._head) < 200:
+            self._head += chunk[:200 - len(self._head)]
+
+        data = self._pending + chunk
+        start = 0 if self._mode != "search" else None  # Where the SVG starts in `data`
+        i = 0
+        n = len(data)
+        while i < n:
+            mode = self._mode
+            if mode == "search":
+                j = data.find("<", i)
+                if j == -1:
+                    i = n
+                    break
+                if n - j < 5:
+                    break  # Can't tell yet whether this is "<svg"
+                if data[j + 1:j + 4].lower() == "svg" and (data[j + 4].isspace() or data[j + 4] in "/>"):
+                    start = j
+                    self._mode, self._tag, self._quote = "tag", ("open", True), None
+                    i = j + 4
+                else:
+                    i = j + 1
+            elif mode == "text":
+                i = _INERT_RE.match(data, i).end()
+                if i == n:
+                    break
+                j = data.find("<", i)
+                end = n if j == -1 else j
+                fence = data.find("```", i, end)
+                if fence != -1:
+                    # The code block closed before the SVG did
+                    self._reset()
+                    start = None
+                    i = fence + 3
+                    continue
+                if j == -1:
+                    i = max(i, n - 2)  # A fence may be split across chunks
+                    break
+                match = _TAG_RE.match(data, j)
+                if match:
+                    # Fast path for a tag that has fully arrived
+                    i = match.end()
+                    name = match.group(2)
+                    if len(name) == 3 and name.lower() == "svg":
+                        closing = bool(match.group(1))
+                        self._tag = ("close" if closing else "open", True)
+                        if self._close_tag(self_closing=match.group(3).endswith("/")):
+                            return self._complete(data, start, i)
+                    continue
+                if n - j < _LOOKAHEAD and not data.startswith(("<!--", "<?"), j):
+                    match = _NAME_RE.match(data, j + 2 if data.startswith("</", j) else j + 1)
+                    if not match or match.end() == n:
+                        i = j
+                        break
+                i = self._open_markup(data, j)
+            elif mode == "tag":
+                if self._quote:
+                    k = data.find(self._quote, i)
+                    if k == -1:
+                        i = n
+                        break
+                    self._quote = None
+                    i = k + 1
+                    continue
+                match = _TAG_SCAN_RE.search(data, i)
+                if match is None:
+                    i = n
+                    break
+                k = match.start()
+                if data[k] == "`":
+                    if data.startswith("```", k):
+                        # The code block closed in the middle of a tag
+                        self._reset()
+                        start = None
+                        i = k + 3
+                    elif n - k < 3:
+                        i = k
+                        break
+                    else:
+                        i = k + 1
+                    continue
+                if data[k] != ">":
+                    self._quote = data[k]
+                    i = k + 1
+                    continue
+                i = k + 1
+                previous = data[k - 1] if k > 0 else self._last
+                if self._close_tag(self_closing=previous == "/"):
+                    return self._complete(data, start, i)
+            else:
+                terminator = _TERMINATORS[mode]
+                k = data.find(terminator, i)
+                if k == -1:
+                    i = max(i, n - len(terminator) + 1)
+                    break
+                self._mode = "text"
+                i = k + len(terminator)
+
+        if self._mode == "search":
+            self._pending = data[i:]
+        else:
+            self._collect(data, start, i)
+            self._pending = data[i:]
+            if self._size + len(self._pending) > self.max_chars:
+                raise OutputParserException(f"SVG exceeds {self.max_chars} characters")
+        return None
+
+    def _open_markup(self, data, j):
+        """Enter the state for the markup starting at `data[j]` ('<') and return where scanning resumes."""
+        if data.startswith("<!--", j):
+            self._mode = "comment"
+            return j + 4
+        if data.startswith("<![CDATA[", j):
+            self._mode = "cdata"
+            return j + 9
+        if data.startswith("<?", j):
+            self._mode = "pi"
+            return j + 2
+        if data.startswith("</", j):
+            match = _NAME_RE.match(data, j + 2)
+            self._tag = ("close", bool(match) and match.group().lower() == "svg")
+        elif data.startswith("<!", j):
+            self._tag = ("other", False)
+        else:
+            match = _NAME_RE.match(data, j + 1)
+            if not match:
+                return j + 1  # A stray '<' in text
+            self._tag = ("open", match.group().lower() == "svg")
+        self._mode, self._quote = "tag", None
+        return j + 1
+
+    def _close_tag(self, self_closing):
+        """Account for the tag just closed by '>'; True when the root SVG is complete."""
+        kind, is_svg = self._tag
+        self._mode, self._tag = "text", None
+        if not is_svg:
+            return False
+        if kind == "open" and not self_closing:
+            self._depth += 1
+        elif kind == "close":
+            self._depth -= 1
+        return self._depth <= 0
+
+    def _complete(self, data, start, end):
+        self._collect(data, start, end)
+        self.svg = "".join(self._parts)
+        self._parts = []
+        self._pending = ""
+        return self.svg
+
+    def _collect(self, data, start, end):
+        if start is None or end <= start:
+            return
+        self._parts.append(data[start:end])
+        self._size += end - start
+        self._last = data[end - 1]
+
+    def _reset(self):
+        self._mode, self._parts, self._size, self._depth, self._tag, self._quote = "search", [], 0, 0, None, None
+
+    def partial(self) -> Optional[str]:
+        """Return the SVG collected so far when it was started but never closed."""
+        if self.done or not self.started:
+            return None
+        return "".join(self._parts) + self._pending
+
+    def finish(self) -> str:
+        """Return the extracted SVG once all input has been fed.
+
+        Raises:
+            OutputParserException: If no complete SVG was found.
+        """
+        if self.done:
+            return self.svg
+        if self.started:
+            raise OutputParserException(f"SVG was not closed (cut off after {self.seen} characters)")
+        excerpt = self._head[:200] + ("..." if self.seen > 200 else "")
+        raise OutputParserException(f"Could not extract SVG from {self.seen} characters of text starting with: {excerpt!r}")
+
+
 class SVGOutputParser(BaseOutputParser):
     """Parser for extracting SVG content from LLM responses."""
-    
+
     def parse(self, text: str) -> str:
         """Extract SVG content from the text.
-        
+
         Args:
             text: The text to parse, potentially containing SVG.
-            
+
         Returns:
             The extracted SVG as a string.
-            
+
         Raises:
             OutputParserException: If no SVG content is found.
         """
-        # Look for SVG content between <svg> and </svg> tags (including the tags)
-        svg_pattern = r'(<svg[\s\S]*?<\/svg>)'
-        match = re.search(svg_pattern, text, re.IGNORECASE)
-        
-        if match:
-            return match.group(1)
-        else:
-            raise OutputParserException(f"Could not extract SVG from provided text: {text}")
\ No newline at end of file
+        extractor = SVGExtractor()
+        extractor.feed(text)
+        return extractor.finish()
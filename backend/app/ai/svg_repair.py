@@ -0,0 +1,337 @@
+"""Validate generated SVG with expat and repair the defects models commonly produce.
+
+Repairs, in the order they are tried:
+
+- structure: a document cut off mid-way (truncation) is trimmed to its last
+  complete token and its open elements are closed; mismatched and stray end
+  tags, bare `&`, HTML entities, unquoted and duplicate attributes, and text
+  after the root element are fixed one parser error at a time.
+- root: a missing `xmlns` (or `xmlns:xlink` when `xlink:` is used), and a
+  missing `viewBox`, `width` or `height`, derived from each other or from the
+  drawing's extent.
+- numbers: geometry attributes that aren't valid lengths (`12,5`, `10ft`,
+  `NaN`) are fixed or dropped, and negative sizes made positive.
+"""
+import html.entities
+import re
+from collections import Counter
+from xml.parsers import expat
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+# Each round fixes one parser error; plans needing more are beyond saving
+MAX_ROUNDS = 50
+VIEWBOX_MARGIN = 10
+
+NUMERIC_ATTRS = {"x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "width", "height", "stroke-width", "font-size"}
+NON_NEGATIVE_ATTRS = {"width", "height", "r", "rx", "ry", "stroke-width", "font-size"}
+_LENGTH_RE = re.compile(r"^\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*(?:px|pt|pc|em|ex|%|cm|mm|in)?\s*$")
+_LEADING_NUMBER_RE = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+_BARE_AMP_RE = re.compile(rb"&(?!#\d+;|#x[0-9a-fA-F]+;|[A-Za-z][\w.-]*;)")
+_PARTIAL_ENTITY_RE = re.compile(rb"&[^;]*$")
+_ENTITY_RE = re.compile(rb"&([A-Za-z][\w.-]*);")
+_XML_ENTITIES = {b"amp", b"lt", b"gt", b"quot", b"apos"}
+_TAG_RE = re.compile(rb"<[A-Za-z_][^<>]*>")
+_UNQUOTED_ATTR_RE = re.compile(rb"""(\s[\w:.-]+)\s*=\s*([^\s"'<>=]+)""")
+_ATTR_RE = re.compile(r"""(\s)([\w:.-]+)(\s*=\s*)(["'])(.*?)\4""", re.S)
+_BYTES_ATTR_RE = re.compile(rb"""\s([\w:.-]+)\s*=\s*(["']).*?\2""", re.S)
+_END_TAG_RE = re.compile(rb"</\s*([\w:.-]+)\s*>")
+_ROOT_RE = re.compile(r"<svg\b[^>]*?(/?)>", re.I)
+
+repair_stats = Counter()
+
+
+class InvalidSVG(ValueError):
+    """Raised when a document can't be repaired into a well-formed SVG."""
+
+
+class _Scan:
+    """Result of one expat pass over a document."""
+
+    def __init__(self):
+        self.error = None
+        self.error_index = None
+        self.stack = []
+        self.root = None
+        self.root_attrs = None
+        self.prefixes = set()
+        self.bad_numbers = 0
+        self.extent = [0.0, 0.0]
+
+    def start(self, name, attrs):
+        if self.root is None:
+            self.root, self.root_attrs = name, attrs
+        self.stack.append(name)
+        for key in [name, *attrs]:
+            if ":" in key:
+                self.prefixes.add(key.split(":", 1)[0])
+        for key, value in attrs.items():
+            if key in NUMERIC_ATTRS and not _is_valid_number(key, value):
+                self.bad_numbers += 1
+        self._grow_extent(name, attrs)
+
+    def end(self, name):
+        if self.stack:
+            self.stack.pop()
+
+    def _grow_extent(self, name, attrs):
+        def number(key):
+            match = _LEADING_NUMBER_RE.match(attrs.get(key, ""))
+            return float(match.group(1)) if match else 0.0
+
+        if name in ("rect", "image", "use", "foreignObject"):
+            xs, ys = [number("x") + number("width")], [number("y") + number("height")]
+        elif name == "line":
+            xs, ys = [number("x1"), number("x2")], [number("y1"), number("y2")]
+        elif name in ("circle", "ellipse"):
+            radius = number("r")
+            xs, ys = [number("cx") + max(radius, number("rx"))], [number("cy") + max(radius, number("ry"))]
+        elif name in ("polygon", "polyline"):
+            values = [float(v) for v in _NUMBER_RE.findall(attrs.get("points", ""))]
+            xs, ys = values[0::2], values[1::2]
+        elif name == "text":
+            xs, ys = [number("x")], [number("y")]
+        else:
+            return
+        self.extent[0] = max([self.extent[0], *xs])
+        self.extent[1] = max([self.extent[1], *ys])
+
+
+def _is_valid_number(key, value):
+    if not _LENGTH_RE.match(value):
+        return False
+    return key not in NON_NEGATIVE_ATTRS or not value.strip().startswith("-")
+
+
+def _scan(data):
+    scan = _Scan()
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = scan.start
+    parser.EndElementHandler = scan.end
+    try:
+        parser.Parse(data, True)
+    except expat.ExpatError as e:
+        scan.error = e.code
+        scan.error_index = parser.ErrorByteIndex if parser.ErrorByteIndex >= 0 else len(data)
+    return scan
+
+
+def _fix_structure(data, scan, repairs):
+    """Fix the error `scan` stopped at; returns the new document or None if it can't."""
+    errors = expat.errors
+    message = expat.ErrorString(scan.error)
+    index = scan.error_index
+    rest = data[index:]
+
+    if scan.root is not None and not scan.stack:
+        # The root is closed; anything left is commentary after the SVG
+        repairs.append("junk_after_root")
+        return data[:index]
+    if message in (errors.XML_ERROR_NO_ELEMENTS, errors.XML_ERROR_UNCLOSED_TOKEN, errors.XML_ERROR_PARTIAL_CHAR) or (
+        b">" not in rest and scan.stack
+    ):
+        # Cut off mid-way: drop the incomplete token and close what is open
+        if not scan.stack:
+            return None
+        repairs.append("closed_truncated")
+        # Text cut off mid-way is kept, short of a partial entity
+        tail = _PARTIAL_ENTITY_RE.sub(b"", rest) if b"<" not in rest else b""
+        return data[:index] + tail + b"".join(b"</%s>" % name.encode("utf-8") for name in reversed(scan.stack))
+    if message == errors.XML_ERROR_TAG_MISMATCH:
+        # The error points into the end tag, after "</"
+        index = data.rfind(b"</", 0, index + 1)
+        match = _END_TAG_RE.match(data, index)
+        if not match:
+            return None
+        name = match.group(1).decode("utf-8")
+        if name in scan.stack:
+            # Elements opened inside `name` were never closed
+            depth = len(scan.stack) - 1 - scan.stack[::-1].index(name)
+            repairs.append("mismatched_tag")
+            closes = b"".join(b"</%s>" % n.encode("utf-8") for n in reversed(scan.stack[depth + 1:]))
+            return data[:index] + closes + data[index:]
+        repairs.append("stray_end_tag")
+        return data[:index] + data[match.end():]
+    if message == errors.XML_ERROR_UNDEFINED_ENTITY:
+        def replace(match):
+            name = match.group(1)
+            if name in _XML_ENTITIES:
+                return match.group()
+            codepoint = html.entities.name2codepoint.get(name.decode("utf-8"))
+            return b"&#%d;" % codepoint if codepoint else b"&amp;" + name + b";"
+        repairs.append("html_entity")
+        return _ENTITY_RE.sub(replace, data)
+    if message == errors.XML_ERROR_DUPLICATE_ATTRIBUTE:
+        # The error points at the repeated attribute
+        index = data.rfind(b"<", 0, index)
+        end = data.find(b">", index)
+        tag = data[index:end]
+        seen = set()
+
+        def dedupe(match):
+            if match.group(1) in seen:
+                return b""
+            seen.add(match.group(1))
+            return match.group()
+        repairs.append("duplicate_attribute")
+        return data[:index] + _BYTES_ATTR_RE.sub(dedupe, tag) + data[end:]
+    if message == errors.XML_ERROR_INVALID_TOKEN:
+        fixed = _BARE_AMP_RE.sub(b"&amp;", data)
+        if fixed != data:
+            repairs.append("escaped_ampersand")
+            return fixed
+        fixed = _TAG_RE.sub(lambda m: _UNQUOTED_ATTR_RE.sub(rb'\1="\2"', m.group()), data)
+        if fixed != data:
+            repairs.append("quoted_attribute")
+            return fixed
+    return None
+
+
+def _fix_number(key, value):
+    """Return a valid replacement for a bad numeric attribute value, or None to drop it."""
+    candidate = value.replace(",", ".", 1) if value.count(",") == 1 else value
+    if not _LENGTH_RE.match(candidate):
+        match = _LEADING_NUMBER_RE.match(candidate)
+        if not match:
+            return None
+        candidate = match.group(1)
+    if key in NON_NEGATIVE_ATTRS:
+        candidate = candidate.strip().lstrip("-")
+    return candidate.strip()
+
+
+def _fix_numbers(text, repairs):
+    def fix_attr(match):
+        key, value = match.group(2), match.group(5)
+        if key not in NUMERIC_ATTRS or _is_valid_number(key, value):
+            return match.group()
+        fixed = _fix_number(key, value)
+        if fixed is None:
+            repairs.append("dropped_number")
+            return ""
+        repairs.append("fixed_number")
+        return f"{match.group(1)}{key}{match.group(3)}{match.group(4)}{fixed}{match.group(4)}"
+
+    return re.sub(r"<[A-Za-z_][^<>]*>", lambda m: _ATTR_RE.sub(fix_attr, m.group()), text)
+
+
+def _fix_root(text, scan, repairs):
+    attrs = scan.root_attrs
+    additions = []
+    if "xmlns" not in attrs:
+        additions.append(f'xmlns="{SVG_NS}"')
+        repairs.append("added_xmlns")
+    if "xlink" in scan.prefixes and "xmlns:xlink" not in attrs:
+        additions.append(f'xmlns:xlink="{XLINK_NS}"')
+        repairs.append("added_xlink_ns")
+
+    def size(key):
+        match = re.match(r"^\s*(\d+\.?\d*|\.\d+)\s*(?:px)?\s*$", attrs.get(key, ""))
+        return float(match.group(1)) if match else None
+
+    width, height = size("width"), size("height")
+    view_box = [float(v) for v in _NUMBER_RE.findall(attrs.get("viewBox", ""))]
+    if len(view_box) != 4 or view_box[2] <= 0 or view_box[3] <= 0:
+        if width and height:
+            view_box = [0, 0, width, height]
+        else:
+            view_box = [0, 0, round(scan.extent[0] + VIEWBOX_MARGIN), round(scan.extent[1] + VIEWBOX_MARGIN)]
+        additions.append('viewBox="{:g} {:g} {:g} {:g}"'.format(*view_box))
+        repairs.append("added_viewbox")
+    if "width" not in attrs or "height" not in attrs:
+        if "width" not in attrs:
+            additions.append(f'width="{view_box[2]:g}"')
+        if "height" not in attrs:
+            additions.append(f'height="{view_box[3]:g}"')
+        repairs.append("added_size")
+
+    if not additions:
+        return text
+    match = _ROOT_RE.search(text)
+    insert_at = match.end() - 1 - len(match.group(1))
+    return text[:insert_at] + " " + " ".join(additions) + text[insert_at:]
+
+
+def _repair_structure(data, repairs):
+    """Fix parser errors one at a time; returns the well-formed document and its scan."""
+    for _ in range(MAX_ROUNDS):
+        scan = _scan(data)
+        if scan.error is None:
+            break
+        fixed = _fix_structure(data, scan, repairs)
+        if fixed is None or fixed == data:
+            raise InvalidSVG(f"Unrepairable SVG: {expat.ErrorString(scan.error)} at byte {scan.error_index}")
+        data = fixed
+    else:
+        raise InvalidSVG(f"SVG still malformed after {MAX_ROUNDS} repairs")
+
+    if scan.root is None or scan.root.lower() != "svg":
+        raise InvalidSVG(f"Root element is <{scan.root}>, not <svg>")
+    return data, scan
+
+
+def check_partial_svg(svg_content):
+    """Check the start of an SVG that is still being generated.
+
+    Only complete tags are looked at; the cut-off end is closed as
+    `repair_svg` would close a truncated plan. Not counted in `repair_stats`.
+
+    Raises:
+        InvalidSVG: If what has arrived is already beyond repair, whatever follows.
+    """
+    complete = svg_content[:svg_content.rfind(">") + 1]
+    if complete:
+        _repair_structure(complete.encode("utf-8"), [])
+
+
+def repair_svg(svg_content):
+    """Validate `svg_content` and repair what can be repaired.
+
+    Args:
+        svg_content: An SVG document, typically straight from the model.
+
+    Returns:
+        `(svg_content, repairs)`: the (possibly) repaired document and the
+        list of repairs applied, empty when it was already valid.
+
+    Raises:
+        InvalidSVG: If it can't be made into a well-formed `<svg>` document.
+    """
+    repair_stats["checked"] += 1
+    repairs = []
+    try:
+        data, scan = _repair_structure(svg_content.encode("utf-8"), repairs)
+    except InvalidSVG:
+        repair_stats["failed"] += 1
+        raise
+
+    text = data.decode("utf-8")
+    if scan.bad_numbers:
+        text = _fix_numbers(text, repairs)
+    text = _fix_root(text, scan, repairs)
+
+    if repairs:
+        repair_stats["repaired"] += 1
+        repair_stats.update(repairs)
+    else:
+        repair_stats["valid"] += 1
+    return text, repairs
+
+
+def validate_svg(svg_content):
+    """Return a list of problems in `svg_content`; empty if it is a valid SVG."""
+    scan = _scan(svg_content.encode("utf-8"))
+    if scan.error is not None:
+        return [f"{expat.ErrorString(scan.error)} at byte {scan.error_index}"]
+    problems = []
+    if scan.root is None or scan.root.lower() != "svg":
+        return [f"Root element is <{scan.root}>, not <svg>"]
+    if "xmlns" not in scan.root_attrs:
+        problems.append("Missing xmlns")
+    if "viewBox" not in scan.root_attrs:
+        problems.append("Missing viewBox")
+    if scan.bad_numbers:
+        problems.append(f"{scan.bad_numbers} invalid numeric attributes")
+    return problems
@@ -1,6 +1,10 @@
-from fastapi import APIRouter
-from app.api.routes import generate_image, generate_svg
+from fastapi import APIRouter, Depends
+from app.api.ratelimit import rate_limit
+from app.api.routes import generate_image, generate_svg, jobs, plans
 
-api_router = APIRouter()
+# Per-client token buckets apply to every route under /api/v1
+api_router = APIRouter(dependencies=[Depends(rate_limit)])
 # api_router.include_router(generate_image.router)
-api_router.include_router(generate_svg.router)
\ No newline at end of file
+api_router.include_router(generate_svg.router)
+api_router.include_router(jobs.router)
+api_router.include_router(plans.router)
\ No newline at end of file
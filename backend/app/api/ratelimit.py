@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from fastapi import HTTPException, Request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Every uvicorn worker opens the same file, so buckets are shared across them.
+# /dev/shm keeps it in memory where available.
+RATE_LIMIT_DB = os.getenv(
+    "RATE_LIMIT_DB",
+    "/dev/shm/house-plans-ratelimit.sqlite3" if os.path.isdir("/dev/shm") else os.path.join(BASE_DIR, "generated_images", "ratelimit.sqlite3"),
+)
+# Buckets idle this long are full again and can be dropped
+IDLE_BUCKET_TTL = 3600
+
+TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+# (burst capacity, refill per minute) per budget
+BUDGETS = {
+    "generation": (
+        float(os.getenv("RATE_LIMIT_GENERATION_BURST", "5")),
+        float(os.getenv("RATE_LIMIT_GENERATION_PER_MINUTE", "10")),
+    ),
+    "default": (
+        float(os.getenv("RATE_LIMIT_DEFAULT_BURST", "60")),
+        float(os.getenv("RATE_LIMIT_DEFAULT_PER_MINUTE", "120")),
+    ),
+}
+
+# Routes that trigger (or queue) an LLM generation
+GENERATION_ROUTES = {
+    "generate_house_image",
+    "generate_house_svg",
+    "generate_house_svg_stream",
+    "generate_house_svg_batch",
+    "create_job",
+}
+
+
+class TokenBucketStore:
+    """Token buckets kept in SQLite so every worker process sees the same state."""
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def take(self, key, capacity, per_minute, cost=1.0):
+        """Try to take `cost` tokens from the bucket for `key`.
+
+        Returns:
+            `(allowed, remaining, retry_after)` where `retry_after` is the
+            number of seconds until enough tokens have been refilled.
+        """
+        rate = per_minute / 60.0
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now))
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - IDLE_BUCKET_TTL,))
+            conn.execute("COMMIT")
+        retry_after = 0 if allowed else math.ceil((cost - tokens) / rate) if rate else 60
+        return allowed, tokens, retry_after
+
+
+_store = None
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = TokenBucketStore()
+    return _store
+
+
+def client_identity(request: Request):
+    """Rate-limit key for the caller: its API key if it sent one, else its IP."""
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+    forwarded = request.headers.get("x-forwarded-for")
+    if TRUST_FORWARDED_FOR and forwarded:
+        return "ip:" + forwarded.split(",")[0].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+async def _request_cost(request: Request, route_name):
+    if route_name != "generate_house_svg_batch":
+        return 1.0
+    # A batch spends one generation token per item
+    try:
+        items = await request.json()
+    except ValueError:
+        return 1.0
+    return float(max(1, len(items))) if isinstance(items, list) else 1.0
+
+
+async def rate_limit(request: Request):
+    """Router dependency enforcing per-client token buckets.
+
+    The `X-RateLimit-*` headers are added by `rate_limit_headers`, since
+    routes returning their own `Response` (plans, streams, batches) drop
+    the one injected into dependencies.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = request.scope.get("route")
+    route_name = getattr(route, "name", "")
+    budget = "generation" if route_name in GENERATION_ROUTES else "default"
+    capacity, per_minute = BUDGETS[budget]
+    cost = await _request_cost(request, route_name)
+    if cost > capacity:
+        # More than a full bucket holds, so no amount of waiting would admit it
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {int(capacity)} specifications. Please split it into smaller batches.",
+            headers={"X-RateLimit-Limit": str(int(capacity))},
+        )
+
+    key = f"{budget}:{client_identity(request)}"
+    allowed, remaining, retry_after = await asyncio.to_thread(_get_store().take, key, capacity, per_minute, cost)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded. Please slow down.",
+            headers={"Retry-After": str(retry_after), "X-RateLimit-Limit": str(int(capacity))},
+        )
+    request.state.rate_limit_headers = {
+        "X-RateLimit-Limit": str(int(capacity)),
+        "X-RateLimit-Remaining": str(int(remaining)),
+    }
+
+
+async def rate_limit_headers(request: Request, call_next):
+    """HTTP middleware adding the headers `rate_limit` computed to whatever response the route returns."""
+    response = await call_next(request)
+    response.headers.update(getattr(request.state, "rate_limit_headers", {}))
+    return response
@@ -1,19 +1,64 @@
-from fastapi import APIRouter, HTTPException
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-from app.ai.svg_parser import SVGOutputParser
+from fastapi import APIRouter, Body, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from app.api.routes.helpers import svg_to_png_wand
-from app.ai.model import create_chat_chain
+from typing import List, Literal, Optional
+from app.ai.admission import AdmissionRejected, admission
+from app.ai.cache import generation_cache
+from app.ai.generation import generate_batch, generate_svg, stream_svg, usage_totals
+from app.ai.layout import layout_stats
+from app.ai.singleflight import generation_flight
+from app.ai.stream_guard import stream_stats
+from app.ai.providers import provider_router
+from app.ai.quality import quality_stats, rejected
+from app.ai.rescale import rescale_index
+from app.ai.svg_optimize import optimize_stats
+from app.ai.svg_repair import repair_stats
+from app.ai.budget import token_budget
+from app.ai.plan_store import PlanNotFound, plan_store
 # import cairosvg
 import base64
 import io
+import json
+import os
 
 # FastAPI router
 router = APIRouter(tags=["SVG Generation"])
 
+BATCH_CONCURRENCY_PER_PROVIDER = int(os.getenv("BATCH_CONCURRENCY_PER_PROVIDER", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+
+def _too_busy(e):
+    return HTTPException(
+        status_code=429,
+        detail="Too many plans are being generated right now. Please retry shortly.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+def _variant_links(request, result):
+    """`result.variants` with links to each variant's SVG and PNG, rendered on first view."""
+    return [
+        {
+            **variant,
+            "svg_url": str(request.url_for("read_plan_svg", plan_id=variant["plan_id"])),
+            "png_url": str(request.url_for("read_plan_png", plan_id=variant["plan_id"])),
+        }
+        for variant in result.variants
+    ]
+
+def _result_payload(request, result):
+    """Fields describing `result` that every successful generation response carries."""
+    return {
+        "plan_id": result.plan_id,
+        "engine": result.engine,
+        "derived_from": result.derived_from,
+        "floor_plan_ids": result.floor_plan_ids,
+        "quality": result.quality,
+        "partial": result.partial,
+        "variants": _variant_links(request, result),
+        "cache_hit": result.cache_hit,
+        "usage": result.usage,
+    }
+
 # Pydantic model for request body
 class HouseSpecifications(BaseModel):
     house_type: str
@@ -21,38 +66,46 @@ class HouseSpecifications(BaseModel):
     num_floors: int
     num_bedrooms: int  # Instead of num_rooms
     additional_preferences: List[str] = []  # Additional preferences (e.g., balcony, garden)
+    force_regenerate: bool = False  # Bypass the generation cache (like Cache-Control: no-cache)
+    plan_id: Optional[str] = None  # Serve a previously generated plan instead of generating
+    mode: Literal["procedural", "llm", "auto", "layout"] = "llm"  # "auto" draws common specs procedurally; "layout" has the model write a compact layout the server draws
+    parallel_floors: bool = False  # Generate each floor in its own concurrent model call
+    num_variants: int = 1  # Alternative plans to generate and rank, up to MAX_VARIANTS
 
 
 @router.post("/generate-house-image")
-async def generate_house_image(specs: HouseSpecifications):
+async def generate_house_image(specs: HouseSpecifications, request: Request):
     """
     Generate an image of a house based on user specifications and return it as base64.
+
+    With several `num_variants` only the best one is rendered; the others are
+    rendered when their `png_url` is first fetched.
     """
     # Validate inputs
-    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0:
+    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0 or specs.num_variants <= 0:
         raise HTTPException(status_code=400, detail="Invalid input values. All fields must be positive numbers.")
     try:
-        # Generate prompt
-        system_message, human_message, llm = create_chat_chain(specs.house_type, specs.num_marla, specs.num_bedrooms, specs.num_floors)
-        print("chat prompt -1", human_message.content)
-
-        parser = SVGOutputParser()
-
-        messages = [system_message, human_message]
-        
-        response = llm.invoke(messages).content
-        response = parser.parse(response)
-        print("response\n", response)
+        result = await generate_svg(specs)
+        response = result.svg_content
+        if rejected(result.quality):
+            # Not worth rendering; the plan isn't cached, so a retry generates a new one
+            raise HTTPException(status_code=422, detail={
+                "message": "The generated plan failed quality checks. Please try again.",
+                "plan_id": result.plan_id,
+                "quality": result.quality,
+                "variants": _variant_links(request, result),
+            })
         
         try:
-            # Try to convert SVG to PNG
-            png_binary = svg_to_png_wand(response)
+            # Try to convert SVG to PNG (rendered once per stored plan)
+            png_binary = await plan_store.apng_for(result)
             base64_image = base64.b64encode(png_binary).decode('utf-8')
             
             return {
                 "message": "successfully generated the map",
                 "image_base64": base64_image,
-                "format": "png"
+                "format": "png",
+                **_result_payload(request, result),
             }
         except Exception as e:
             print(f"PNG conversion failed: {e}, falling back to SVG")
@@ -63,29 +116,30 @@ async def generate_house_image(specs: HouseSpecifications):
                 "message": "successfully generated the map (SVG fallback)",
                 "image_base64": svg_base64,
                 "svg_content": response,
-                "format": "svg"
+                "format": "svg",
+                **_result_payload(request, result),
             }
+    except HTTPException:
+        raise
+    except PlanNotFound:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    except AdmissionRejected as e:
+        raise _too_busy(e)
     except Exception as e:
         print(f"Error generating image: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate image. Please try again later.")
 
 @router.post("/generate-house-svg")
-async def generate_house_svg(specs: HouseSpecifications):
+async def generate_house_svg(specs: HouseSpecifications, request: Request):
     """
     Generate an SVG of a house based on user specifications and return it directly.
     """
     # Validate inputs
-    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0:
+    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0 or specs.num_variants <= 0:
         raise HTTPException(status_code=400, detail="Invalid input values. All fields must be positive numbers.")
     try:
-        # Generate prompt
-        system_message, human_message, llm = create_chat_chain(specs.house_type, specs.num_marla, specs.num_bedrooms, specs.num_floors)
-        
-        parser = SVGOutputParser()
-        messages = [system_message, human_message]
-        
-        response = llm.invoke(messages).content
-        svg_content = parser.parse(response)
+        result = await generate_svg(specs)
+        svg_content = result.svg_content
         
         # Also provide base64 encoded version for direct image display
         svg_base64 = base64.b64encode(svg_content.encode('utf-8')).decode('utf-8')
@@ -93,8 +147,140 @@ async def generate_house_svg(specs: HouseSpecifications):
         return {
             "message": "successfully generated the SVG",
             "svg_content": svg_content,
-            "image_base64": svg_base64
+            "image_base64": svg_base64,
+            **_result_payload(request, result),
         }
+    except PlanNotFound:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    except AdmissionRejected as e:
+        raise _too_busy(e)
     except Exception as e:
         print(f"Error generating SVG: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate SVG. Please try again later.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to generate SVG. Please try again later.")
+
+
+def _sse_event(event, data):
+    """Format a Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/generate-house-svg/stream")
+async def generate_house_svg_stream(specs: HouseSpecifications, request: Request):
+    """
+    Stream the SVG of a house as Server-Sent Events while the model generates it.
+
+    Emits `token` events with each chunk of model output as it arrives, then a
+    final `svg` event with the extracted SVG (or an `error` event). Output
+    that can't become a plan is cut short and generated again: a `retry`
+    event means the tokens received so far should be discarded.
+    """
+    # Validate inputs
+    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0 or specs.num_variants <= 0:
+        raise HTTPException(status_code=400, detail="Invalid input values. All fields must be positive numbers.")
+    # Reject before the 200 and event stream start if the provider is saturated
+    try:
+        admission.for_provider(provider_router.pick()).check()
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+
+    async def event_stream():
+        try:
+            async for event, payload in stream_svg(specs):
+                if event == "token":
+                    yield _sse_event("token", {"text": payload})
+                    continue
+                if event == "retry":
+                    yield _sse_event("retry", payload)
+                    continue
+                svg_base64 = base64.b64encode(payload.svg_content.encode('utf-8')).decode('utf-8')
+                yield _sse_event("svg", {
+                    "message": "successfully generated the SVG",
+                    "svg_content": payload.svg_content,
+                    "image_base64": svg_base64,
+                    **_result_payload(request, payload),
+                })
+        except AdmissionRejected as e:
+            yield _sse_event("error", {"detail": "Too many plans are being generated right now. Please retry shortly.", "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error streaming SVG: {e}")
+            yield _sse_event("error", {"detail": "Failed to generate SVG. Please try again later."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser as they arrive
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/generate-house-svg/batch")
+async def generate_house_svg_batch(
+    request: Request,
+    specs_list: List[HouseSpecifications] = Body(max_length=BATCH_MAX_ITEMS),
+    concurrency: int = BATCH_CONCURRENCY_PER_PROVIDER,
+):
+    """
+    Generate SVGs for a list of house specifications concurrently.
+
+    Results are streamed as NDJSON, one line per input item in completion
+    order, each tagged with the item's `index` in the request. A batch holds
+    at most `BATCH_MAX_ITEMS` specifications, and each one is charged to the
+    client's rate limit.
+    """
+    if not specs_list:
+        raise HTTPException(status_code=400, detail="At least one specification is required.")
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY_PER_PROVIDER))
+
+    valid = []
+    invalid = []
+    for index, specs in enumerate(specs_list):
+        if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0 or specs.num_variants <= 0:
+            invalid.append(index)
+        else:
+            valid.append((index, specs))
+
+    async def ndjson_stream():
+        for index in invalid:
+            yield json.dumps({"index": index, "status": "error", "detail": "Invalid input values. All fields must be positive numbers."}) + "\n"
+
+        async for indices, result in generate_batch([specs for _, specs in valid], concurrency):
+            for i in indices:
+                index = valid[i][0]
+                if isinstance(result, AdmissionRejected):
+                    line = {"index": index, "status": "error", "detail": "Provider at capacity.", "retry_after": result.retry_after}
+                elif isinstance(result, Exception):
+                    print(f"Error generating SVG for batch item {index}: {result}")
+                    line = {"index": index, "status": "error", "detail": "Failed to generate SVG. Please try again later."}
+                else:
+                    line = {
+                        "index": index,
+                        "status": "ok",
+                        "svg_content": result.svg_content,
+                        **_result_payload(request, result),
+                    }
+                yield json.dumps(line) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+@router.get("/generation-stats")
+async def generation_stats():
+    """
+    Report generation cache, request coalescing, provider routing, token usage,
+    admission queue, streaming retries, SVG repair, SVG optimization, layout
+    parsing and plan quality counters.
+    """
+    return {
+        "cache": generation_cache.stats(),
+        "singleflight": generation_flight.stats(),
+        "providers": provider_router.stats(),
+        "usage": dict(usage_totals),
+        "token_budget": token_budget.stats(),
+        "admission": admission.stats(),
+        "stream": dict(stream_stats),
+        "rescale": rescale_index.stats(),
+        "svg_repair": dict(repair_stats),
+        "svg_optimize": dict(optimize_stats),
+        "layout": dict(layout_stats),
+        "quality": dict(quality_stats),
+    }
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from app.api.routes.generate_svg import HouseSpecifications
+from app.jobs.queue import get_job_queue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+class JobRequest(BaseModel):
+    specs: HouseSpecifications
+    priority: Literal["interactive", "batch"] = "interactive"
+
+
+def _job_public(job):
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+@router.post("", status_code=202)
+async def create_job(job_in: JobRequest):
+    """
+    Queue a floor-plan generation and return its job id.
+    """
+    specs = job_in.specs
+    if specs.num_marla <= 0 or specs.num_floors <= 0 or specs.num_bedrooms <= 0 or specs.num_variants <= 0:
+        raise HTTPException(status_code=400, detail="Invalid input values. All fields must be positive numbers.")
+    job_id = await asyncio.to_thread(get_job_queue().enqueue, {"specs": specs.model_dump()}, job_in.priority)
+    return {"id": job_id, "status": "queued"}
+
+
+@router.get("/{job_id}")
+async def read_job(job_id: str):
+    """
+    Get the status of a job, and its result once it has succeeded.
+    """
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_public(job)
@@ -0,0 +1,106 @@
+import asyncio
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from app.ai.geometry import load_floor_plan
+from app.ai.plan_store import plan_store
+from app.ai.quality import check_stored_plan, rejected
+from app.ai.similar import similar_plans
+from app.api.routes.generate_svg import HouseSpecifications
+
+router = APIRouter(prefix="/plans", tags=["Plans"])
+
+# Plan ids are content hashes, so a given URL always serves the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/similar")
+async def read_similar_plans(
+    request: Request,
+    house_type: str,
+    num_marla: float,
+    num_bedrooms: int,
+    num_floors: int,
+    additional_preferences: List[str] = Query([]),
+    k: int = Query(5, ge=1, le=50),
+):
+    """
+    Get the stored plans whose specs are closest to the given ones, so they can
+    be shown while a fresh plan is generated.
+    """
+    specs = HouseSpecifications(
+        house_type=house_type,
+        num_marla=num_marla,
+        num_bedrooms=num_bedrooms,
+        num_floors=num_floors,
+        additional_preferences=additional_preferences,
+    )
+    plans = await asyncio.to_thread(similar_plans.query, specs, k)
+    for plan in plans:
+        plan["svg_url"] = str(request.url_for("read_plan_svg", plan_id=plan["plan_id"]))
+        plan["png_url"] = str(request.url_for("read_plan_png", plan_id=plan["plan_id"]))
+    return {"plans": plans}
+
+
+@router.get("/{plan_id}.svg")
+async def read_plan_svg(plan_id: str):
+    """
+    Get a generated plan as SVG.
+    """
+    svg_content = await plan_store.aload_svg(plan_id)
+    if svg_content is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return Response(content=svg_content, media_type="image/svg+xml", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+
+@router.get("/{plan_id}/geometry")
+async def read_plan_geometry(plan_id: str):
+    """
+    Get the rooms (with their areas) and other shapes of a generated plan, as
+    recovered from its SVG.
+    """
+    try:
+        plan = await asyncio.to_thread(load_floor_plan, plan_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return plan.to_dict()
+
+
+@router.get("/{plan_id}/layout")
+async def read_plan_layout(plan_id: str):
+    """
+    Get the layout the model wrote for a plan generated with `mode="layout"`.
+    """
+    meta = await asyncio.to_thread(plan_store.load_metadata, plan_id)
+    if meta is None or meta.get("layout") is None:
+        raise HTTPException(status_code=404, detail="Layout not found")
+    return meta["layout"]
+
+
+@router.get("/{plan_id}.png")
+async def read_plan_png(plan_id: str):
+    """
+    Get a generated plan rendered as PNG.
+
+    Plans that failed the quality checks aren't rendered.
+    """
+    meta = await asyncio.to_thread(plan_store.load_metadata, plan_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    quality = await asyncio.to_thread(check_stored_plan, plan_id, (meta.get("specs") or {}).get("num_marla"))
+    if rejected(quality):
+        raise HTTPException(status_code=422, detail={
+            "message": "This plan failed quality checks and isn't rendered. Use the SVG instead.",
+            "quality": quality,
+        })
+    try:
+        png_binary = await plan_store.aload_png(plan_id)
+    except Exception as e:
+        print(f"PNG conversion failed for plan {plan_id}: {e}")
+        raise HTTPException(status_code=422, detail="This plan could not be rendered as PNG. Use the SVG instead.")
+    if png_binary is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return Response(content=png_binary, media_type="image/png", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
@@ -0,0 +1,297 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///" + os.path.join(BASE_DIR, "generated_images", "jobs.sqlite3"))
+VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "180"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_BASE = float(os.getenv("JOB_RETRY_BACKOFF_BASE", "5"))
+RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "300"))
+
+# Lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 10}
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter before retrying a failed job."""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class BaseJobQueue(ABC):
+    """Interface every job queue backend implements.
+
+    A claimed job stays invisible to other workers until its visibility
+    timeout expires; a worker that dies mid-job therefore hands it back to the
+    queue automatically. Workers extend the timeout with `heartbeat` while
+    they are still busy.
+    """
+
+    @abstractmethod
+    def enqueue(self, payload, priority="interactive", max_attempts=MAX_ATTEMPTS):
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        """Take the next available job, or return None if there is none."""
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        ...
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, result):
+        ...
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """Schedule a retry with backoff, or mark the job failed when out of attempts."""
+
+    @abstractmethod
+    def get(self, job_id):
+        ...
+
+    @abstractmethod
+    def stats(self):
+        ...
+
+
+class InMemoryJobQueue(BaseJobQueue):
+    """Process-local queue for running the API and its workers in one process.
+
+    Jobs live in this process only, so it works with a single API worker:
+    under `fastapi run --workers N` a job can be polled on a worker that never
+    saw it and come back as 404. Use the SQLite queue with several workers.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, payload, priority="interactive", max_attempts=MAX_ATTEMPTS):
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": PRIORITIES[priority],
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "worker_id": None,
+            "available_at": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return job["id"]
+
+    def claim(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._lock:
+            ready = [job for job in self._jobs.values() if job["status"] in ("queued", "running") and job["available_at"] <= now]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: (j["priority"], j["available_at"]))
+            job.update(status="running", worker_id=worker_id, available_at=now + visibility_timeout, updated_at=now)
+            job["attempts"] += 1
+            return dict(job)
+
+    def heartbeat(self, job_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["status"] == "running" and job["worker_id"] == worker_id:
+                job["available_at"] = time.time() + visibility_timeout
+                return True
+            return False
+
+    def complete(self, job_id, worker_id, result):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["worker_id"] == worker_id:
+                job.update(status="succeeded", result=result, error=None, updated_at=time.time())
+
+    def fail(self, job_id, worker_id, error):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["worker_id"] != worker_id:
+                return
+            if job["attempts"] >= job["max_attempts"]:
+                job.update(status="failed", error=error, updated_at=now)
+            else:
+                job.update(status="queued", error=error, available_at=now + retry_delay(job["attempts"]), updated_at=now)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+
+class SQLiteJobQueue(BaseJobQueue):
+    """Job queue stored in SQLite, shared by every process that opens the file.
+
+    Claims run inside `BEGIN IMMEDIATE` transactions so two workers can never
+    take the same job.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, available_at)")
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        """Open a connection, optionally holding the write lock for the whole block."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if immediate:
+                conn.execute("COMMIT")
+        except Exception:
+            if immediate:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, payload, priority="interactive", max_attempts=MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, payload, max_attempts, available_at, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, PRIORITIES[priority], json.dumps(payload), max_attempts, now, now, now),
+            )
+        return job_id
+
+    def claim(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            # 'running' rows whose visibility timeout passed belong to a dead worker
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND available_at <= ?"
+                " ORDER BY priority, available_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,"
+                " available_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + visibility_timeout, now, row["id"]),
+            )
+        job = self._to_dict(row)
+        job.update(status="running", worker_id=worker_id, attempts=job["attempts"] + 1)
+        return job
+
+    def heartbeat(self, job_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET available_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + visibility_timeout, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, updated_at = ?"
+                " WHERE id = ? AND worker_id = ?",
+                (json.dumps(result), time.time(), job_id, worker_id),
+            )
+
+    def fail(self, job_id, worker_id, error):
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker_id = ?", (job_id, worker_id)).fetchone()
+            if row is None:
+                return
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", (error, now, job_id))
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, updated_at = ? WHERE id = ?",
+                    (error, now + retry_delay(row["attempts"]), now, job_id),
+                )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def create_job_queue(url=JOB_QUEUE_URL):
+    """Build the queue backend named by `url` (`sqlite:///path` or `memory://`).
+
+    `memory://` is only for a single API worker, see `InMemoryJobQueue`.
+    """
+    if url.startswith("memory://"):
+        return InMemoryJobQueue()
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported job queue URL: {url}")
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """Return this process's queue backend, created on first use."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = create_job_queue()
+    return _job_queue
@@ -0,0 +1,163 @@
+"""Cache warmer.
+
+Generates the most requested specs ahead of time, so daytime requests for
+them are cache hits. Run it from cron during off-peak hours:
+
+    python -m app.jobs.warmer --top 50 --token-budget 400000
+
+or set CACHE_WARMER_ENABLED=true to have the API run it once a day within
+CACHE_WARMER_HOURS.
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import time
+from datetime import datetime
+
+from app.ai.budget import token_budget
+from app.ai.cache import BASE_DIR, generation_cache
+from app.ai.demand import popular_specs
+from app.ai.floors import use_per_floor
+from app.ai.generation import cache_key_for, generate_svg
+from app.ai.layout import use_layout
+from app.ai.model import LAYOUT_SYSTEM_PROMPT, SYSTEM_PROMPT, close_llms, init_llms
+from app.ai.plan_store import plan_store
+from app.ai.procedural import use_procedural
+from app.api.routes.generate_svg import HouseSpecifications
+
+WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() == "true"
+# Local hours [start, end) to warm in; "22-4" wraps past midnight
+WARMER_HOURS = os.getenv("CACHE_WARMER_HOURS", "2-6")
+WARMER_TOP_N = int(os.getenv("CACHE_WARMER_TOP_N", "50"))
+# Input + output tokens one warming pass may spend
+WARMER_TOKEN_BUDGET = int(os.getenv("CACHE_WARMER_TOKEN_BUDGET", "400000"))
+WARMER_WINDOW_DAYS = float(os.getenv("CACHE_WARMER_WINDOW_DAYS", "7"))
+CHECK_INTERVAL = 300
+# Rough prompt size of one model call, for the budget check before it is made
+CHARS_PER_TOKEN = 4
+HUMAN_MESSAGE_TOKENS = 100
+
+# Shared by every API worker so only one of them warms each day
+STATE_PATH = os.path.join(BASE_DIR, "generated_images", "warmer.json")
+LOCK_PATH = os.path.join(BASE_DIR, "generated_images", "warmer.lock")
+
+
+def prompt_tokens(specs):
+    """Estimated input tokens of one model call generating `specs`."""
+    system_prompt = LAYOUT_SYSTEM_PROMPT if use_layout(specs) else SYSTEM_PROMPT
+    return len(system_prompt) // CHARS_PER_TOKEN + HUMAN_MESSAGE_TOKENS
+
+
+async def warm_cache(top_n=WARMER_TOP_N, budget=WARMER_TOKEN_BUDGET, window_days=WARMER_WINDOW_DAYS):
+    """Generate and render the `top_n` most requested specs that aren't cached.
+
+    Stops before a generation whose prompt and worst-case output (its
+    `max_tokens`) would take the tokens spent past `budget`. Only generations
+    that filled the cache count as warmed: a plan rescaled from a stored one
+    or failing the quality checks isn't cached.
+
+    Returns:
+        A summary dict of what was warmed, skipped and spent.
+    """
+    summary = {"warmed": 0, "already_cached": 0, "not_cached": 0, "failed": 0, "tokens_spent": 0, "stopped_by_budget": False}
+    for spec, parallel_floors, mode, count in await asyncio.to_thread(popular_specs, top_n, window_days):
+        specs = HouseSpecifications(**spec, parallel_floors=parallel_floors, mode=mode)
+        if use_procedural(specs):
+            continue  # Drawn on request, nothing to warm
+        key = cache_key_for(specs)
+        if await generation_cache.aget(key) is not None:
+            summary["already_cached"] += 1
+            continue
+        calls = specs.num_floors if use_per_floor(specs) else 1
+        if summary["tokens_spent"] + (prompt_tokens(specs) + token_budget.max_tokens(specs)) * calls > budget:
+            summary["stopped_by_budget"] = True
+            break
+        try:
+            result = await generate_svg(specs, track_demand=False)
+        except Exception as e:
+            print(f"Cache warmer failed for {spec} ({count} requests): {e}")
+            summary["failed"] += 1
+            continue
+        summary["tokens_spent"] += result.usage.get("input_tokens", 0) + result.usage.get("output_tokens", 0)
+        if await generation_cache.aget(key) is None:
+            # Rescaled from a stored plan or failed the quality checks
+            summary["not_cached"] += 1
+            continue
+        summary["warmed"] += 1
+        try:
+            # Pre-render too, so /generate-house-image is warm as well
+            await plan_store.aload_png(result.plan_id)
+        except Exception as e:
+            print(f"Cache warmer could not render plan {result.plan_id}: {e}")
+    return summary
+
+
+def in_off_peak(hour, hours=WARMER_HOURS):
+    start, end = (int(h) for h in hours.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+async def _warm_once_today():
+    """Run a warming pass unless one already ran today (in any worker process)."""
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    with open(LOCK_PATH, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # Another worker is warming right now
+        today = datetime.now().date().isoformat()
+        try:
+            with open(STATE_PATH, "r", encoding="utf-8") as f:
+                if json.load(f).get("date") == today:
+                    return
+        except (FileNotFoundError, ValueError):
+            pass
+        started = time.monotonic()
+        summary = await warm_cache()
+        summary["seconds"] = round(time.monotonic() - started, 1)
+        print(f"Cache warmer: {summary}")
+        with open(STATE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"date": today, **summary}, f)
+
+
+async def warmer_loop(stop_event):
+    while not stop_event.is_set():
+        if in_off_peak(datetime.now().hour):
+            try:
+                await _warm_once_today()
+            except Exception as e:
+                print(f"Cache warmer pass failed: {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=CHECK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_cache_warmer(stop_event):
+    """Start the daily warming task on the running loop if it is enabled."""
+    if not WARMER_ENABLED:
+        return None
+    return asyncio.create_task(warmer_loop(stop_event))
+
+
+async def run_warmer(top_n, budget, window_days):
+    init_llms()
+    try:
+        print(await warm_cache(top_n, budget, window_days))
+    finally:
+        await close_llms()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate the most requested floor plans into the cache.")
+    parser.add_argument("--top", type=int, default=WARMER_TOP_N, help="How many of the most requested specs to warm")
+    parser.add_argument("--token-budget", type=int, default=WARMER_TOKEN_BUDGET, help="Input + output tokens to spend at most")
+    parser.add_argument("--window-days", type=float, default=WARMER_WINDOW_DAYS, help="How far back to count requests")
+    args = parser.parse_args()
+    asyncio.run(run_warmer(args.top, args.token_budget, args.window_days))
+
+
+if __name__ == "__main__":
+    main()
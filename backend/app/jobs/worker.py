@@ -0,0 +1,116 @@
+"""Plan generation worker.
+
+Run one or more of these per node, pointed at the same queue:
+
+    python -m app.jobs.worker --concurrency 8
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+
+from app.ai.generation import generate_svg
+from app.ai.model import close_llms, init_llms
+from app.ai.plan_store import plan_store
+from app.ai.quality import rejected
+from app.api.routes.generate_svg import HouseSpecifications
+from app.jobs.queue import JOB_QUEUE_URL, VISIBILITY_TIMEOUT, get_job_queue
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Workers run inside the API process as well; required for the memory:// queue,
+# which also limits the API to a single worker process (see `InMemoryJobQueue`)
+INPROCESS_WORKERS = int(os.getenv("JOB_INPROCESS_WORKERS", "2" if JOB_QUEUE_URL.startswith("memory://") else "0"))
+
+
+async def process_job(job):
+    """Run the generation + PNG rendering pipeline for one job payload."""
+    specs = HouseSpecifications(**job["payload"]["specs"])
+    result = await generate_svg(specs)
+    if rejected(result.quality):
+        # Failing the job retries it; the plan isn't cached, so the retry generates a new one
+        raise ValueError(f"Plan {result.plan_id} failed quality checks")
+
+    try:
+        png_binary = await plan_store.apng_for(result)
+        image_base64 = base64.b64encode(png_binary).decode('utf-8')
+        image_format = "png"
+    except Exception as e:
+        print(f"PNG conversion failed for job {job['id']}: {e}, falling back to SVG")
+        image_base64 = base64.b64encode(result.svg_content.encode('utf-8')).decode('utf-8')
+        image_format = "svg"
+
+    return {
+        "svg_content": result.svg_content,
+        "image_base64": image_base64,
+        "format": image_format,
+        "plan_id": result.plan_id,
+        "quality": result.quality,
+        "partial": result.partial,
+        "variants": result.variants,
+        "cache_hit": result.cache_hit,
+        "usage": result.usage,
+    }
+
+
+async def _keep_alive(queue, job_id, worker_id):
+    # Extend the visibility timeout well before it lapses so a long
+    # generation isn't handed to another worker while still running.
+    while True:
+        await asyncio.sleep(VISIBILITY_TIMEOUT / 3)
+        await asyncio.to_thread(queue.heartbeat, job_id, worker_id)
+
+
+async def worker_loop(queue, worker_id, stop_event):
+    """Claim and process jobs until `stop_event` is set."""
+    while not stop_event.is_set():
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        keep_alive = asyncio.create_task(_keep_alive(queue, job["id"], worker_id))
+        try:
+            result = await process_job(job)
+        except Exception as e:
+            print(f"Job {job['id']} attempt {job['attempts']} failed: {e}")
+            await asyncio.to_thread(queue.fail, job["id"], worker_id, str(e))
+        else:
+            await asyncio.to_thread(queue.complete, job["id"], worker_id, result)
+        finally:
+            keep_alive.cancel()
+
+
+def start_workers(concurrency, stop_event, queue=None):
+    """Start `concurrency` worker loops on the running event loop."""
+    if concurrency <= 0:
+        return []
+    queue = queue or get_job_queue()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    return [
+        asyncio.create_task(worker_loop(queue, f"{prefix}-{i}", stop_event))
+        for i in range(concurrency)
+    ]
+
+
+async def run_workers(concurrency):
+    stop_event = asyncio.Event()
+    init_llms()
+    try:
+        await asyncio.gather(*start_workers(concurrency, stop_event))
+    finally:
+        await close_llms()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued floor-plan generation jobs.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", "4")))
+    args = parser.parse_args()
+    asyncio.run(run_workers(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,17 @@ from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse,HTMLResponse
 from app.api.main import api_router
+from app.api.ratelimit import rate_limit_headers
 # from app.core.config 
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from app.ai.model import init_llms, close_llms
+from app.jobs.warmer import start_cache_warmer
+from app.jobs.worker import INPROCESS_WORKERS, start_workers
+import asyncio
 import os
 
 load_dotenv()
@@ -16,7 +22,24 @@ def custom_generate_unique_id(route: APIRoute) -> str:
     tag = route.tags[0] if route.tags else "default"
     return f"{tag}-{route.name}"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the LLM provider clients once per worker and reuse their
+    # keep-alive connection pools for every request.
+    init_llms()
+    stop_workers = asyncio.Event()
+    workers = start_workers(INPROCESS_WORKERS, stop_workers)
+    warmer = start_cache_warmer(stop_workers)
+    yield
+    stop_workers.set()
+    for worker in workers:
+        worker.cancel()
+    if warmer is not None:
+        warmer.cancel()
+    await close_llms()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="AI HOME DESIGN GENERATOR",
     openapi_url="/api/v1/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
@@ -29,6 +52,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(rate_limit_headers)
 
 # Get the base directory of the project
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
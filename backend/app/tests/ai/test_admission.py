@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.ai.admission import AdmissionRejected, ProviderAdmission, admission
+from app.ai.providers import provider_router
+
+
+class RateLimited(Exception):
+    """Provider SDK error for an HTTP 429, optionally carrying Retry-After."""
+
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {"retry-after": retry_after} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+def test_slots_bound_concurrency() -> None:
+    gate = ProviderAdmission("claude", concurrency=2, max_queue=10)
+    active = []
+
+    async def call():
+        async with gate.slot():
+            active.append(gate.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert max(active) == 2
+    stats = gate.stats()
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0 and stats["rejected"] == 0
+    assert stats["wait_p95"] >= stats["wait_p50"] >= 0
+
+
+def test_full_queue_is_rejected_with_retry_after() -> None:
+    gate = ProviderAdmission("claude", concurrency=1, max_queue=1)
+    gate._service_times.append(10.0)
+
+    async def hold(release):
+        async with gate.slot():
+            await release.wait()
+
+    async def scenario():
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert (gate.in_flight, gate.waiting) == (1, 1)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with gate.slot():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    # One call queued ahead plus the newcomer, one slot, 10s per call
+    assert rejected.retry_after == 20 and rejected.provider == "claude"
+    assert gate.rejected == 1
+
+
+def test_retry_after_is_at_least_a_second() -> None:
+    gate = ProviderAdmission("claude", concurrency=8, max_queue=0)
+    gate._service_times.append(0.01)
+    assert gate.retry_after() == 1
+
+
+def test_limits_come_from_the_environment(monkeypatch) -> None:
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY_DEEPSEEK", "3")
+    monkeypatch.setenv("LLM_MAX_QUEUE_DEEPSEEK", "7")
+    gate = admission.for_provider("deepseek")
+    assert (gate.concurrency, gate.max_queue) == (3, 7)
+    assert admission.for_provider("deepseek") is gate
+    assert set(admission.stats()) == {"deepseek"}
+
+
+@pytest.mark.parametrize("retry_after,expected", [("12", 12), (None, 3)])
+def test_provider_429_becomes_admission_rejected(fake_llm, monkeypatch, retry_after, expected) -> None:
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY_CLAUDE", "16")
+    monkeypatch.setattr(provider_router, "providers", ["claude"])
+    fake_llm.error = RateLimited(retry_after)
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(provider_router.invoke(lambda name: ["prompt"], lambda response: response))
+    # Without a header, the estimate assumes the default 40s per call
+    # Without a header: one call over 16 slots at the default 40s per call
+    assert rejected.value.retry_after == expected
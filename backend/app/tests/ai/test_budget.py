@@ -0,0 +1,117 @@
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from app.ai import budget
+from app.ai.budget import TokenBudget, token_budget
+from app.ai.cache import generation_cache
+from app.ai.generation import _restore_stop_sequence, cache_key_for, generate_svg, stream_svg
+from app.ai.model import is_truncated
+from app.ai.plan_store import plan_store
+from app.api.routes.generate_svg import HouseSpecifications
+
+
+def specs(floors=1, bedrooms=2):
+    return HouseSpecifications(house_type="modern", num_marla=5, num_floors=floors, num_bedrooms=bedrooms)
+
+
+def test_estimate_grows_with_rooms() -> None:
+    small, large = TokenBudget.estimate(specs(1, 2)), TokenBudget.estimate(specs(2, 4))
+    assert small == budget.BASE_TOKENS + budget.TOKENS_PER_ROOM * 5
+    assert large > small
+    assert TokenBudget().max_tokens(specs(10, 30)) == budget.MAX_TOKENS
+
+
+def test_budget_is_learned_after_enough_samples() -> None:
+    tokens = TokenBudget()
+    estimate = tokens.max_tokens(specs())
+    for _ in range(budget.MIN_SAMPLES - 1):
+        tokens.record(specs(), 1700, estimate)
+    assert tokens.max_tokens(specs()) == estimate
+    tokens.record(specs(), 2000, estimate)
+    assert tokens.max_tokens(specs()) == int(2000 * budget.HEADROOM)
+    # Other buckets keep their estimate
+    assert tokens.max_tokens(specs(2, 2)) == TokenBudget.estimate(specs(2, 2))
+
+
+def test_truncated_output_raises_the_ceiling() -> None:
+    tokens = TokenBudget()
+    for _ in range(budget.MIN_SAMPLES):
+        tokens.record(specs(), 2000, 2500)
+    tokens.record(specs(), 2500, 2500, truncated=True)
+    assert tokens.max_tokens(specs()) == int(2500 * budget.HEADROOM ** 2)
+    stats = tokens.stats()
+    assert stats["truncated"] == 1
+    assert stats["buckets"]["1f-2b"]["samples"] == budget.MIN_SAMPLES + 1
+
+
+def test_truncation_raises_the_ceiling_before_enough_samples() -> None:
+    tokens = TokenBudget()
+    estimate = tokens.max_tokens(specs())
+    tokens.record(specs(), estimate, estimate, truncated=True)
+    assert tokens.max_tokens(specs()) == int(estimate * budget.HEADROOM ** 2)
+    # A smaller later truncation doesn't lower it
+    tokens.record(specs(), 2000, 2000, truncated=True)
+    assert tokens.max_tokens(specs()) == int(estimate * budget.HEADROOM ** 2)
+    assert tokens.max_tokens(specs(2, 2)) == TokenBudget.estimate(specs(2, 2))
+
+
+def test_truncation_is_read_from_either_provider() -> None:
+    assert is_truncated(AIMessage(content="", response_metadata={"stop_reason": "max_tokens"}))
+    assert is_truncated(AIMessage(content="", response_metadata={"finish_reason": "length"}))
+    assert not is_truncated(AIMessage(content="", response_metadata={"stop_reason": "stop_sequence"}))
+    assert not is_truncated(None)
+
+
+def test_stop_sequence_is_restored() -> None:
+    assert _restore_stop_sequence("<svg><rect/>", False) == "<svg><rect/></svg>"
+    assert _restore_stop_sequence("<svg><rect/></svg>", False) == "<svg><rect/></svg>"
+    assert _restore_stop_sequence("<svg><rect/>", True) == "<svg><rect/>"
+
+
+def test_generation_is_stopped_and_budgeted(fake_llm) -> None:
+    fake_llm.reply = fake_llm.reply.replace("</svg>", "")
+    result = asyncio.run(generate_svg(specs()))
+    assert result.svg_content.endswith("</svg>")
+    [(_, kwargs)] = fake_llm.calls
+    assert kwargs == {"stop": ["</svg>"], "max_tokens": TokenBudget.estimate(specs())}
+    assert token_budget.stats()["output_tokens"] == 400
+
+
+def test_stream_is_stopped_and_budgeted(fake_llm) -> None:
+    fake_llm.reply = fake_llm.reply.replace("</svg>", "")
+
+    async def collect():
+        return [event async for event in stream_svg(specs())]
+
+    kind, result = asyncio.run(collect())[-1]
+    assert kind == "svg" and result.svg_content.endswith("</svg>")
+    [(_, kwargs)] = fake_llm.calls
+    assert kwargs["stop"] == ["</svg>"] and kwargs["max_tokens"] == TokenBudget.estimate(specs())
+    assert token_budget.stats()["buckets"]["1f-2b"]["samples"] == 1
+
+
+def test_truncated_generation_is_neither_stored_nor_cached(fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(fake_llm, "metadata", {"stop_reason": "max_tokens"})
+    fake_llm.reply = fake_llm.reply[:fake_llm.reply.index("Kitchen")]
+    first = asyncio.run(generate_svg(specs()))
+    assert first.partial and first.plan_id is None and first.svg_content.endswith("</svg>")
+    assert list(plan_store.iter_metadata()) == []
+    second = asyncio.run(generate_svg(specs()))
+    assert not second.cache_hit and len(fake_llm.calls) == 2
+    # The second call already got the raised budget
+    [(_, first_call), (_, second_call)] = fake_llm.calls
+    assert second_call["max_tokens"] == int(first_call["max_tokens"] * budget.HEADROOM ** 2)
+
+
+def test_truncated_stream_is_neither_stored_nor_cached(fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(fake_llm, "metadata", {"stop_reason": "max_tokens"})
+    fake_llm.reply = fake_llm.reply[:fake_llm.reply.index("Kitchen")]
+
+    async def collect():
+        return [event async for event in stream_svg(specs())]
+
+    kind, result = asyncio.run(collect())[-1]
+    assert kind == "svg" and result.partial and result.plan_id is None
+    assert asyncio.run(generation_cache.aget(cache_key_for(specs()))) is None
+    assert list(plan_store.iter_metadata()) == []
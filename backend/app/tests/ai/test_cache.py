@@ -0,0 +1,78 @@
+import os
+from types import SimpleNamespace
+
+from app.ai import cache
+from app.ai.cache import GenerationCache, normalize_specs, spec_cache_key
+
+
+def make_specs(**overrides):
+    fields = {"house_type": "Modern", "num_marla": 5, "num_bedrooms": 3, "num_floors": 1, "additional_preferences": []}
+    return SimpleNamespace(**{**fields, **overrides})
+
+
+def test_cosmetic_differences_share_a_key() -> None:
+    first = make_specs(house_type="Modern  Villa", additional_preferences=["Garden", "lawn ", "garden"])
+    second = make_specs(house_type=" modern villa", num_marla=5.0, additional_preferences=["Lawn", "  ", "GARDEN"])
+    assert normalize_specs(first) == normalize_specs(second)
+    assert spec_cache_key(first) == spec_cache_key(second)
+
+
+def test_key_depends_on_spec_and_prompt_version() -> None:
+    specs = make_specs()
+    assert spec_cache_key(specs) != spec_cache_key(make_specs(num_bedrooms=4))
+    assert spec_cache_key(specs) != spec_cache_key(specs, "another-prompt")
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path) -> None:
+    store = GenerationCache(str(tmp_path), memory_max_bytes=10)
+    store.set("a", "aaaa")
+    store.set("b", "bbbb")
+    # Touch "a" so "b" is the least recently used
+    assert store._memory_get("a") == "aaaa"
+    store.set("c", "cccc")
+    assert store._memory_get("b") is None
+    assert store._memory_get("a") == "aaaa" and store._memory_get("c") == "cccc"
+    assert store.counters["memory_evictions"] == 1
+    # Evicted from memory only: the disk tier still has it
+    assert store.get("b") == "bbbb"
+    assert store.counters["disk_hits"] == 1
+
+
+def test_disk_tier_is_shared_and_promoted_to_memory(tmp_path) -> None:
+    GenerationCache(str(tmp_path)).set("key", "<svg/>")
+    other = GenerationCache(str(tmp_path))
+    assert other.get("key") == "<svg/>"
+    assert other.get("key") == "<svg/>"
+    assert (other.counters["disk_hits"], other.counters["memory_hits"]) == (1, 1)
+
+
+def test_entries_expire(tmp_path, monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    store = GenerationCache(str(tmp_path), ttl=60)
+    store.set("key", "<svg/>")
+    now[0] += 59
+    assert store.get("key") == "<svg/>"
+    now[0] += 2
+    assert GenerationCache(str(tmp_path), ttl=60).get("key") is None
+    assert store.get("key") is None
+    assert not os.path.exists(store._path("key"))
+
+
+def test_disk_tier_evicts_oldest_entries(tmp_path) -> None:
+    store = GenerationCache(str(tmp_path / "disk"), disk_max_bytes=200)
+    for i, key in enumerate(("old", "middle", "new")):
+        store.set(key, "x" * 40)
+        os.utime(store._path(key), (i, i))
+    assert sorted(os.listdir(store.directory)) == ["middle.json", "new.json"]
+    assert store.counters["disk_evictions"] == 1
+
+
+def test_stats_report_the_hit_rate(tmp_path) -> None:
+    store = GenerationCache(str(tmp_path))
+    store.set("key", "<svg/>")
+    store.get("key")
+    store.get("missing")
+    stats = store.stats()
+    assert stats["hit_rate"] == 0.5
+    assert (stats["memory_entries"], stats["memory_bytes"], stats["stores"]) == (1, 6, 1)
@@ -0,0 +1,70 @@
+import json
+import os
+
+from app.ai import demand
+from app.ai.demand import popular_specs, record_demand
+from app.ai.plan_store import plan_store
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import PLAN_SVG
+
+
+def specs(**overrides):
+    return HouseSpecifications(**{"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2, **overrides})
+
+
+def test_specs_are_ranked_by_requests() -> None:
+    for bedrooms in (2, 3, 3, 4, 3, 4):
+        record_demand(specs(num_bedrooms=bedrooms))
+    record_demand(specs(num_bedrooms=2, num_floors=2), parallel_floors=True)
+    ranked = popular_specs(top_n=3)
+    assert [(spec["num_bedrooms"], count) for spec, _, _, count in ranked] == [(3, 3), (4, 2), (2, 1)]
+    # Cosmetic differences count as the same spec
+    record_demand(specs(house_type="  MODERN", num_bedrooms=2))
+    assert popular_specs(top_n=1)[0][0]["num_bedrooms"] == 3
+    assert [count for spec, _, _, count in popular_specs(top_n=5) if spec["num_bedrooms"] == 2] == [2, 1]
+
+
+def test_parallel_floors_are_ranked_separately() -> None:
+    record_demand(specs(num_floors=2), parallel_floors=True)
+    record_demand(specs(num_floors=2), parallel_floors=False)
+    assert sorted(parallel for _, parallel, _, _ in popular_specs(top_n=5)) == [False, True]
+
+
+def test_modes_are_ranked_separately() -> None:
+    record_demand(specs(mode="layout"))
+    record_demand(specs(mode="layout"))
+    record_demand(specs())
+    assert [(mode, count) for _, _, mode, count in popular_specs(top_n=5)] == [("layout", 2), ("llm", 1)]
+
+
+def test_old_and_broken_lines_are_ignored(monkeypatch) -> None:
+    record_demand(specs(num_bedrooms=2))
+    with open(demand.DEMAND_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"t": 0, "spec": {"num_bedrooms": 9}}) + "\n")
+        f.write('{"t": 17000')
+    assert [spec["num_bedrooms"] for spec, _, _, _ in popular_specs(top_n=5)] == [2]
+
+
+def test_log_is_rotated(monkeypatch) -> None:
+    monkeypatch.setattr(demand, "DEMAND_LOG_MAX_BYTES", 100)
+    for bedrooms in (1, 2, 3):
+        record_demand(specs(num_bedrooms=bedrooms))
+    assert os.path.exists(demand.DEMAND_LOG + ".1")
+    # Both generations of the log are read; the oldest one rotated away
+    assert sorted(spec["num_bedrooms"] for spec, _, _, _ in popular_specs(top_n=5)) == [2, 3]
+
+
+def test_disabled_log_records_nothing(monkeypatch) -> None:
+    monkeypatch.setattr(demand, "DEMAND_LOG_ENABLED", False)
+    record_demand(specs())
+    assert not os.path.exists(demand.DEMAND_LOG)
+
+
+def test_stored_plans_are_the_fallback() -> None:
+    original = plan_store.save(PLAN_SVG, specs(num_bedrooms=3))
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Dining"), specs(num_bedrooms=4), engine="procedural")
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Lounge"), specs(num_bedrooms=5), derived_from=original)
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Store"), specs(num_bedrooms=2, num_floors=2), floor_plan_ids=[original])
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Study"), specs(num_bedrooms=6), engine="layout")
+    ranked = sorted((spec["num_bedrooms"], parallel, mode) for spec, parallel, mode, _ in popular_specs(top_n=5))
+    assert ranked == [(2, True, "llm"), (3, False, "llm"), (6, False, "layout")]
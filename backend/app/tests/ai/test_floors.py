@@ -0,0 +1,123 @@
+import asyncio
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from app.ai import model, rescale
+from app.ai.floors import floor_prompts, stitch_floors, use_per_floor
+from app.ai.generation import generate_svg
+from app.ai.plan_store import plan_store
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import PLAN_SVG, STORED_SVG, FakeLLM
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def specs(**overrides):
+    fields = {"house_type": "modern", "num_marla": 10, "num_floors": 2, "num_bedrooms": 5, "parallel_floors": True}
+    return HouseSpecifications(**{**fields, **overrides})
+
+
+class FloorFailingLLM(FakeLLM):
+    """Fails the call for one floor, after `delay`, and answers the others slowly."""
+
+    def __init__(self, failing_floor):
+        super().__init__(delay=0.5)
+        self.failing_floor = failing_floor
+
+    async def ainvoke(self, messages, **kwargs):
+        if self.failing_floor in messages[-1].content:
+            self.calls.append((messages, kwargs))
+            raise RuntimeError("floor failed")
+        return await super().ainvoke(messages, **kwargs)
+
+
+def test_only_multi_floor_houses_are_split() -> None:
+    assert use_per_floor(specs())
+    assert not use_per_floor(specs(num_floors=1))
+    assert not use_per_floor(specs(parallel_floors=False))
+
+
+def test_floors_share_the_plot_and_staircase() -> None:
+    ground, first = floor_prompts(specs())
+    shared = ["plot_width", "plot_depth", "view_width", "view_height", "stairs_x", "stairs_y", "stairs_width", "stairs_height"]
+    assert [ground[k] for k in shared] == [first[k] for k in shared]
+    assert (ground["floor_name"], ground["num_bedrooms"]) == ("Ground Floor", 2)
+    assert (first["floor_name"], first["num_bedrooms"]) == ("First Floor", 3)
+    assert "car porch" in ground["floor_program"] and "lounge" in first["floor_program"]
+
+
+def test_stitched_sheet_keeps_each_floor_apart() -> None:
+    floor = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="300">'
+        '<defs><pattern id="hatch"/></defs><rect fill="url(#hatch)"/><use href="#hatch"/><use href="#elsewhere"/>'
+        "</svg>"
+    )
+    root = ET.fromstring(stitch_floors([PLAN_SVG, floor], specs()))
+    ground, first = root.findall(f"{SVG}svg")
+    assert (ground.get("id"), first.get("id")) == ("floor-0", "floor-1")
+    assert ground.get("viewBox") == "0 0 200 150"
+    # Without a viewBox, the floor's own width and height set it
+    assert first.get("viewBox") == "0 0 400 300"
+    assert float(first.get("x")) > float(ground.get("x")) + float(ground.get("width"))
+    assert first.find(f"{SVG}defs/{SVG}pattern").get("id") == "f1-hatch"
+    assert first.find(f"{SVG}rect").get("fill") == "url(#f1-hatch)"
+    assert [use.get("href") for use in first.findall(f"{SVG}use")] == ["#f1-hatch", "#elsewhere"]
+    titles = [text.text for text in root.findall(f"{SVG}text")]
+    assert titles[0] == "Modern House - 10 Marla" and titles[-2:] == ["Ground Floor", "First Floor"]
+
+
+def test_floors_are_generated_concurrently(fake_llm) -> None:
+    fake_llm.delay = 0.1
+    result = asyncio.run(generate_svg(specs(num_floors=3, num_bedrooms=6)))
+    assert len(fake_llm.calls) == 3 and fake_llm.max_active == 3
+    prompts = [messages[-1].content for messages, _ in fake_llm.calls]
+    assert ["Ground Floor" in prompts[0], "First Floor" in prompts[1], "Second Floor" in prompts[2]] == [True] * 3
+    assert result.usage["output_tokens"] == 3 * fake_llm.usage["output_tokens"]
+    # The floors are all the same reply, so they share one stored plan
+    assert result.floor_plan_ids == [plan_store.save(STORED_SVG)] * 3
+    assert result.svg_content.count("<svg") == 4
+    assert plan_store.load_metadata(result.plan_id)["floor_plan_ids"] == result.floor_plan_ids
+
+    cached = asyncio.run(generate_svg(specs(num_floors=3, num_bedrooms=6)))
+    assert cached.cache_hit and cached.floor_plan_ids == result.floor_plan_ids
+    assert len(fake_llm.calls) == 3
+
+
+def test_single_call_plans_are_cached_separately(fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(rescale, "RESCALE_ENABLED", False)
+    asyncio.run(generate_svg(specs(parallel_floors=False)))
+    assert not asyncio.run(generate_svg(specs())).cache_hit
+    assert len(fake_llm.calls) == 3
+
+
+def test_failed_floor_cancels_the_others(monkeypatch) -> None:
+    llm = FloorFailingLLM("First Floor")
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    with pytest.raises(Exception):
+        asyncio.run(generate_svg(specs()))
+    assert llm.cancelled >= 1
+    assert list(plan_store.iter_metadata()) == []
+
+
+class FloorTruncatingLLM(FakeLLM):
+    """Cuts off the reply for one floor at the token limit."""
+
+    def __init__(self, truncated_floor):
+        super().__init__()
+        self.truncated_floor = truncated_floor
+
+    async def ainvoke(self, messages, **kwargs):
+        message = await super().ainvoke(messages, **kwargs)
+        if self.truncated_floor in messages[-1].content:
+            message.content = message.content[:message.content.index("Kitchen")]
+            message.response_metadata = {"stop_reason": "max_tokens"}
+        return message
+
+
+def test_sheet_with_a_truncated_floor_is_not_stored(monkeypatch) -> None:
+    llm = FloorTruncatingLLM("First Floor")
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    result = asyncio.run(generate_svg(specs()))
+    assert result.partial and result.plan_id is None and result.floor_plan_ids == []
+    assert list(plan_store.iter_metadata()) == []
@@ -0,0 +1,112 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.ai import geometry
+from app.ai.geometry import KIND, FloorPlan, load_floor_plan
+from app.ai.procedural import render_procedural
+
+SAMPLE_PLAN = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "image.svg")
+
+PLAN = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 500 400">
+  <defs><path id="swing" d="M0 0 A30 30 0 0 1 30 30" fill="none" stroke="#000"/></defs>
+  <rect width="500" height="400" fill="#fff"/>
+  <g transform="translate(50 50)">
+    <rect x="0" y="0" width="400" height="300" fill="none" stroke="#000" stroke-width="4"/>
+    <rect x="0" y="0" width="200" height="150" fill="none" stroke="#000" stroke-width="2"/>
+    <text x="100" y="75">Bedroom 1</text>
+    <rect x="200" y="0" width="200" height="150" fill="none" stroke="#000" stroke-width="2"/>
+    <text x="300" y="75">Kitchen</text>
+    <rect x="0" y="150" width="100" height="150" fill="none" stroke="#000" stroke-width="2"/>
+    <text x="50" y="225">Stairs</text>
+    <line x1="0" y1="200" x2="100" y2="200" stroke="#000"/>
+    <line x1="250" y1="0" x2="320" y2="0" stroke="#4a90d9" stroke-width="2"/>
+    <line x1="300" y1="150" x2="300" y2="300" stroke="#000" stroke-width="6"/>
+    <use href="#swing" x="160" y="150"/>
+  </g>
+</svg>"""
+
+
+def plans():
+    specs = SimpleNamespace(house_type="modern", num_marla=10, num_bedrooms=4, num_floors=2, additional_preferences=[])
+    yield "handwritten", PLAN
+    yield "procedural", render_procedural(specs)
+    if os.path.exists(SAMPLE_PLAN):
+        with open(SAMPLE_PLAN, "r", encoding="utf-8") as f:
+            yield "sample", f.read()
+
+
+@pytest.mark.parametrize("name,svg", list(plans()), ids=lambda value: value if len(value) < 20 else "")
+def test_svg_round_trip(name, svg) -> None:
+    plan = FloorPlan.from_svg(svg)
+    again = FloorPlan.from_svg(plan.to_svg())
+    assert again.view_box == pytest.approx(plan.view_box)
+    for array in ("rects", "segments", "doors", "labels"):
+        first, second = getattr(plan, array), getattr(again, array)
+        assert len(first) == len(second), array
+        for field in first.dtype.names:
+            np.testing.assert_allclose(first[field], second[field], atol=1e-3, err_msg=f"{array}.{field}")
+    assert again.texts == plan.texts
+    assert again.to_dict() == plan.to_dict()
+
+
+def test_shapes_are_classified() -> None:
+    plan = FloorPlan.from_svg(PLAN)
+    names = {plan.name(i): plan.rects[i] for i in plan.rooms()}
+    assert set(names) == {"Bedroom 1", "Kitchen", "Stairs"}
+    assert names["Stairs"]["kind"] == KIND["stairs"]
+    # Transforms are applied
+    assert (names["Kitchen"]["x"], names["Kitchen"]["y"]) == (250, 50)
+    kinds = list(plan.rects["kind"])
+    assert kinds.count(KIND["background"]) == 1 and kinds.count(KIND["outline"]) == 1
+
+    segments = {(float(s["x1"]), float(s["y1"])): s["kind"] for s in plan.segments}
+    assert segments[(50, 250)] == KIND["stairs"]
+    assert segments[(300, 50)] == KIND["window"]
+    assert segments[(350, 200)] == KIND["wall"]
+
+
+def test_door_arc_from_use() -> None:
+    plan = FloorPlan.from_svg(PLAN)
+    assert len(plan.doors) == 1
+    door = plan.doors[0]
+    assert door["r"] == pytest.approx(30)
+    # Hinged at the arc's centre, below its start
+    assert (door["cx"], door["cy"]) == pytest.approx((210, 230))
+    assert door["a1"] - door["a0"] == pytest.approx(90)
+
+
+def test_floors_follow_outlines_and_ids() -> None:
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 500 200">'
+        '<g id="floor-1"><rect x="260" y="0" width="200" height="100" stroke="#000"/></g>'
+        '<rect x="0" y="0" width="200" height="100" stroke="#000"/>'
+        '<rect x="0" y="0" width="100" height="100" stroke="#000"/><text x="50" y="50">Lounge</text>'
+        '<rect x="100" y="0" width="100" height="100" stroke="#000"/><text x="150" y="50">Dining</text>'
+        "</svg>"
+    )
+    plan = FloorPlan.from_svg(svg)
+    assert plan.floors == 2
+    assert plan.rects["floor"][0] == 1
+    assert all(plan.rects["floor"][i] == 0 for i in plan.rooms())
+
+
+def test_malformed_svg_raises() -> None:
+    with pytest.raises(ValueError, match="well-formed"):
+        FloorPlan.from_svg("<svg><rect></svg>")
+
+
+def test_missing_plans_are_not_cached(monkeypatch) -> None:
+    stored = {}
+    monkeypatch.setattr(geometry.plan_store, "load_svg", stored.get)
+    geometry._load_floor_plan.cache_clear()
+    try:
+        assert load_floor_plan("late") is None
+        stored["late"] = PLAN
+        plan = load_floor_plan("late")
+        assert plan is not None and len(plan.rooms()) == 3
+        assert load_floor_plan("late") is plan
+    finally:
+        geometry._load_floor_plan.cache_clear()
@@ -0,0 +1,73 @@
+import pytest
+
+from app.ai.layout import InvalidLayout, parse_layout
+from app.ai.model import LAYOUT_SYSTEM_PROMPT
+
+PLOT = (25, 45)
+
+
+def test_prompt_example_parses() -> None:
+    example = LAYOUT_SYSTEM_PROMPT.split("Example", 1)[1].split("\n", 1)[1]
+    layout = parse_layout(example, PLOT)
+    assert layout["plot"] == {"width": 25, "depth": 45}
+    [floor] = layout["floors"]
+    assert floor["name"] == "Ground Floor"
+    assert len(floor["rooms"]) == 8 and len(floor["doors"]) == 7 and len(floor["windows"]) == 5
+    assert floor["rooms"][6] == {"name": "Drawing Room", "x": 10, "y": 26, "w": 15, "h": 11}
+    assert floor["doors"][0] == {"room": 0, "wall": "S", "offset": 2}
+
+
+def test_fences_chatter_and_trailing_text_are_ignored() -> None:
+    text = "Here is the layout:\n```\nR 0 0 10 12 Bedroom\nd 1 s 2\n```\nEND\nR 0 0 5 5 Ignored"
+    layout = parse_layout(text, PLOT)
+    [floor] = layout["floors"]
+    assert [room["name"] for room in floor["rooms"]] == ["Bedroom"]
+    assert floor["name"] == "Ground Floor"
+    assert floor["doors"] == [{"room": 0, "wall": "S", "offset": 2}]
+
+
+def test_unnamed_rooms_and_floors_get_defaults() -> None:
+    layout = parse_layout("F\nR 0 0 10 10\nF\nS 0 0 4 10\nR 4 0 10 10", PLOT)
+    assert [floor["name"] for floor in layout["floors"]] == ["Ground Floor", "First Floor"]
+    assert layout["floors"][0]["rooms"][0]["name"] == "Room 1"
+
+
+def test_small_overshoot_is_clipped() -> None:
+    [floor] = parse_layout("R -1 40 26 6 Lawn", PLOT)["floors"]
+    assert floor["rooms"] == [{"name": "Lawn", "x": 0, "y": 40, "w": 25, "h": 5}]
+
+
+def test_opening_offset_is_kept_on_its_wall() -> None:
+    [floor] = parse_layout("R 0 0 10 12 Bedroom\nD 1 N 9\nW 1 E -2", PLOT)["floors"]
+    assert floor["doors"][0]["offset"] == 10 - 3
+    assert floor["windows"][0]["offset"] == 0
+
+
+def test_truncated_last_line_is_dropped() -> None:
+    [floor] = parse_layout("R 0 0 10 12 Bedroom\nR 10 0 1", PLOT, truncated=True)["floors"]
+    assert len(floor["rooms"]) == 1
+    with pytest.raises(InvalidLayout, match="Line 2: expected 4 numbers"):
+        parse_layout("R 0 0 10 12 Bedroom\nR 10 0 1", PLOT)
+
+
+@pytest.mark.parametrize("text,error", [
+    ("", "no rooms"),
+    ("P 25 45\nF Ground Floor\nS 0 0 4 10\nEND", "no rooms"),
+    ("R 0 0 ten 12 Bedroom", r"Line 1: expected 4 numbers, got '0 0 ten 12'"),
+    ("R 0 0 nan 12 Bedroom", "Line 1: expected 4 finite numbers"),
+    ("R 0 0 inf 12 Bedroom", "Line 1: expected 4 finite numbers"),
+    ("P inf 45\nR 0 0 10 12", "Line 1: expected 2 finite numbers"),
+    ("P 0 45\nR 0 0 10 12", "positive size"),
+    ("R 0 0 0 12 Bedroom", "width and height must be positive"),
+    ("R 20 0 10 12 Bedroom", r"outside the 25 x 45 ft plot"),
+    ("R 0 0 10 12\nD 1 Q 2", "wall must be one of N, S, E, W, got 'Q'"),
+    ("R 0 0 10 12\nD 1 N", "expected a room number, a wall and an offset"),
+    ("R 0 0 10 12\nD 1.5 N 2", "room number must be a whole number, got '1.5'"),
+    ("R 0 0 10 12\nD nan N 2", "Line 2: expected 2 finite numbers"),
+    ("R 0 0 10 12\nD 1 N inf", "Line 2: expected 2 finite numbers"),
+    ("F Ground Floor\nR 0 0 10 12\nD 2 N 2", "Line 3: Ground Floor has no room 2"),
+    ("R 0 0 10 12\nD 0 N 2", "has no room 0"),
+])
+def test_parse_errors(text, error) -> None:
+    with pytest.raises(InvalidLayout, match=error):
+        parse_layout(text, PLOT)
@@ -0,0 +1,50 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.ai import model
+
+
+def test_provider_clients_are_built_once(monkeypatch) -> None:
+    monkeypatch.setattr(model, "_llms", {})
+    monkeypatch.setattr(model, "_http_clients", [])
+    claude = model.get_llm("claude")
+    assert model.get_llm() is claude
+    assert model.get_llm("deepseek") is model.get_llm("deepseek")
+    assert len(model._http_clients) == 2
+
+
+def test_close_llms_releases_the_pools(monkeypatch) -> None:
+    monkeypatch.setattr(model, "_llms", {})
+    monkeypatch.setattr(model, "_http_clients", [])
+    model.init_llms()
+    clients = list(model._http_clients)
+    asyncio.run(model.close_llms())
+    assert all(client.is_closed for client in clients)
+    assert model._llms == {} and model._http_clients == []
+    # The next call builds fresh clients
+    assert model.get_llm("claude") is not None
+
+
+def test_system_messages_are_built_once() -> None:
+    human = HumanMessage(content="Design a house")
+    system, message = model.build_messages(human)
+    assert message is human
+    assert system.content == model.SYSTEM_PROMPT
+    assert model.build_messages(human)[0] is system
+    assert model.build_messages(human, layout=True)[0].content == model.LAYOUT_SYSTEM_PROMPT
+
+
+def test_usage_includes_prompt_cache_tokens() -> None:
+    message = AIMessage(content="", usage_metadata={
+        "input_tokens": 1200, "output_tokens": 300, "total_tokens": 1500,
+        "input_token_details": {"cache_read": 1100, "cache_creation": 0},
+    })
+    assert model.usage_from_response(message) == {
+        "input_tokens": 1200, "output_tokens": 300, "cache_read_input_tokens": 1100, "cache_creation_input_tokens": 0,
+    }
+    raw = AIMessage(content="", response_metadata={"usage": {"cache_creation_input_tokens": 1100}})
+    assert model.usage_from_response(raw)["cache_creation_input_tokens"] == 1100
+    assert model.usage_from_response(None) == {
+        "input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+    }
@@ -0,0 +1,64 @@
+import pytest
+
+from app.ai import plan_store as plan_store_module
+from app.ai.plan_store import PlanStore, plan_id_for
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import PLAN_SVG
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PlanStore(str(tmp_path / "plans"))
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Record every SVG rasterized, answering with fake PNG bytes."""
+    renders = []
+
+    def render(svg_content):
+        renders.append(svg_content)
+        return b"\x89PNG fake"
+
+    monkeypatch.setattr(plan_store_module, "svg_to_png_wand", render)
+    return renders
+
+
+def test_plans_are_content_addressed(store) -> None:
+    specs = HouseSpecifications(house_type=" Modern ", num_marla=5, num_floors=1, num_bedrooms=2)
+    plan_id = store.save(PLAN_SVG, specs, engine="llm")
+    assert plan_id == plan_id_for(PLAN_SVG) and len(plan_id) == 24
+    assert store.save(PLAN_SVG) == plan_id
+    assert store.load_svg(plan_id) == PLAN_SVG
+    meta = store.load_metadata(plan_id)
+    assert meta["engine"] == "llm" and meta["specs"]["house_type"] == "modern"
+    assert [meta["id"] for meta in store.iter_metadata()] == [plan_id]
+
+
+def test_unknown_and_malformed_ids_are_missing(store, renders) -> None:
+    assert store.load_svg("0" * 24) is None
+    assert store.load_svg("../../etc/passwd") is None
+    assert store.load_metadata("nope") is None
+    assert store.load_png("0" * 24) is None
+    assert store.load_png("../x") is None
+    assert list(store.iter_metadata()) == []
+    assert renders == []
+
+
+def test_png_is_rendered_once(store, renders) -> None:
+    plan_id = store.save(PLAN_SVG)
+    assert store.load_png(plan_id) == b"\x89PNG fake"
+    assert store.load_png(plan_id) == b"\x89PNG fake"
+    assert renders == [PLAN_SVG]
+
+
+def test_failed_render_is_not_stored(store, monkeypatch) -> None:
+    def fail(svg_content):
+        raise RuntimeError("no delegate")
+
+    monkeypatch.setattr(plan_store_module, "svg_to_png_wand", fail)
+    plan_id = store.save(PLAN_SVG)
+    with pytest.raises(RuntimeError):
+        store.load_png(plan_id)
+    with pytest.raises(RuntimeError):
+        store.load_png(plan_id)
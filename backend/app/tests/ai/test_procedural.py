@@ -0,0 +1,85 @@
+import asyncio
+import itertools
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from app.ai.generation import generate_svg
+from app.ai.procedural import (
+    SQFT_PER_MARLA,
+    layout_floor,
+    plot_dimensions,
+    render_procedural,
+    room_program,
+    use_procedural,
+)
+from app.api.routes.generate_svg import HouseSpecifications
+
+
+def specs(**overrides):
+    fields = {"house_type": "modern", "num_marla": 5, "num_floors": 2, "num_bedrooms": 3, **overrides}
+    return HouseSpecifications(**fields)
+
+
+@pytest.mark.parametrize("overrides,expected", [
+    ({"mode": "llm"}, False),
+    ({"mode": "procedural", "num_marla": 13}, True),
+    ({"mode": "auto"}, True),
+    ({"mode": "auto", "num_marla": 6}, False),
+    ({"mode": "auto", "num_floors": 4, "num_bedrooms": 4}, False),
+    ({"mode": "auto", "num_bedrooms": 7}, False),
+    ({"mode": "auto", "additional_preferences": ["balcony"]}, False),
+])
+def test_engine_selection(overrides, expected) -> None:
+    assert use_procedural(specs(**overrides)) is expected
+
+
+def test_plot_has_the_marla_area() -> None:
+    width, depth = plot_dimensions(10)
+    assert width * depth == pytest.approx(10 * SQFT_PER_MARLA)
+    assert depth > width
+
+
+def test_bedrooms_go_upstairs_first() -> None:
+    floors = room_program(num_bedrooms=5, num_floors=2)
+    bedrooms = [[name for name, _ in rooms if name.startswith("Bedroom")] for rooms in floors]
+    assert bedrooms == [["Bedroom 1", "Bedroom 2"], ["Bedroom 3", "Bedroom 4", "Bedroom 5"]]
+    assert ("Kitchen", 0.8) in floors[0] and ("Lounge", 1.2) in floors[1]
+
+
+@pytest.mark.parametrize("level,num_floors", [(0, 1), (0, 2), (1, 2)])
+def test_rooms_tile_the_plot(level, num_floors) -> None:
+    width, depth = plot_dimensions(7)
+    rooms = room_program(4, num_floors)[level]
+    placed = layout_floor(width, depth, rooms, level, num_floors)
+    names = [name for name, *_ in placed]
+    assert ("Stairs" in names) == (num_floors > 1)
+    assert set(name for name, _ in rooms) <= set(names)
+    for name, x, y, w, h in placed:
+        assert w > 0 and h > 0 and x >= -1e-9 and y >= -1e-9
+        assert x + w <= width + 1e-6 and y + h <= depth + 1e-6, name
+    for (_, ax, ay, aw, ah), (_, bx, by, bw, bh) in itertools.combinations(placed, 2):
+        overlap_w = min(ax + aw, bx + bw) - max(ax, bx)
+        overlap_h = min(ay + ah, by + bh) - max(ay, by)
+        assert overlap_w <= 1e-6 or overlap_h <= 1e-6
+    covered = sum(w * h for _, _, _, w, h in placed)
+    built = width * depth if level == 0 else width * depth * (1 - 0.18)
+    assert covered == pytest.approx(built)
+
+
+def test_rendered_plan_is_well_formed() -> None:
+    svg = render_procedural(specs(house_type="  modern <villa> "))
+    root = ET.fromstring(svg)
+    texts = [element.text for element in root.iter("{http://www.w3.org/2000/svg}text")]
+    assert texts[0] == "Modern <Villa> House - 5 Marla"
+    assert {"Ground Floor", "First Floor", "Bedroom 3", "UP", "DN"} <= set(texts)
+    assert [g.get("id") for g in root.iter("{http://www.w3.org/2000/svg}g") if g.get("id")] == ["floor-0", "floor-1"]
+    # Deterministic, so the same spec always maps to the same plan id
+    assert render_procedural(specs(house_type="  modern <villa> ")) == svg
+
+
+def test_procedural_generation_skips_the_model(fake_llm) -> None:
+    result = asyncio.run(generate_svg(specs(mode="procedural")))
+    assert result.engine == "procedural" and result.plan_id
+    assert result.usage == {} and not result.cache_hit
+    assert fake_llm.calls == []
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.ai import model, providers
+from app.ai.providers import MIN_SAMPLES, ProviderRouter, ProviderStats
+from app.tests.conftest import FakeLLM
+
+
+@pytest.fixture
+def llms(monkeypatch):
+    """A fake client per provider."""
+    fakes = {"claude": FakeLLM(reply="claude"), "deepseek": FakeLLM(reply="deepseek")}
+    monkeypatch.setattr(model, "_llms", fakes)
+    return fakes
+
+
+def content(response):
+    return response.content
+
+
+def prompt(name):
+    return [f"prompt for {name}"]
+
+
+def test_stats_percentiles_and_error_rate() -> None:
+    stats = ProviderStats()
+    for latency in (5, 1, 4, 2, 3):
+        stats.record(latency, True)
+    stats.record(9, False)
+    assert (stats.percentile(50), stats.percentile(99)) == (3, 5)
+    assert stats.error_rate == pytest.approx(1 / 6)
+    assert stats.healthy
+
+
+def test_consecutive_failures_cool_a_provider_down() -> None:
+    stats = ProviderStats()
+    for _ in range(2):
+        stats.record(1, False)
+    assert stats.healthy
+    stats.record(1, False)
+    assert not stats.healthy
+
+
+def test_ranking_by_median_latency() -> None:
+    router = ProviderRouter(["claude", "deepseek"])
+    # Unmeasured providers keep their configured order
+    assert router.ranked() == ["claude", "deepseek"]
+    for _ in range(MIN_SAMPLES):
+        router.record("claude", 2.0, True)
+    # Measured ones go after unmeasured ones, so those get measured too
+    assert router.ranked() == ["deepseek", "claude"]
+    for _ in range(MIN_SAMPLES):
+        router.record("deepseek", 3.0, True)
+    assert router.ranked() == ["claude", "deepseek"]
+    for _ in range(3):
+        router.record("claude", 1.0, False)
+    assert router.pick() == "deepseek"
+
+
+def test_invoke_fails_over_to_the_next_provider(llms) -> None:
+    llms["claude"].error = RuntimeError("overloaded")
+    router = ProviderRouter(["claude", "deepseek"])
+    assert asyncio.run(router.invoke(prompt, content, max_tokens=10)) == "deepseek"
+    assert llms["deepseek"].calls == [(["prompt for deepseek"], {"max_tokens": 10})]
+    assert router.counters["failovers"] == 1
+    assert router.stats()["providers"]["claude"]["error_rate"] == 1.0
+
+
+def test_invalid_output_counts_as_a_failure(llms) -> None:
+    def parse(response):
+        if response.content == "claude":
+            raise ValueError("no svg")
+        return response.content
+
+    router = ProviderRouter(["claude", "deepseek"])
+    assert asyncio.run(router.invoke(prompt, parse)) == "deepseek"
+    assert router._stats["claude"].outcomes[-1] is False
+
+
+def test_invoke_raises_when_every_provider_fails(llms) -> None:
+    llms["claude"].error = RuntimeError("overloaded")
+    llms["deepseek"].error = RuntimeError("down")
+    with pytest.raises(RuntimeError, match="down"):
+        asyncio.run(ProviderRouter(["claude", "deepseek"]).invoke(prompt, content))
+
+
+def test_slow_primary_is_hedged(llms) -> None:
+    llms["claude"].delay = 1.0
+    router = ProviderRouter(["claude", "deepseek"], hedge=True)
+    for _ in range(MIN_SAMPLES):
+        router.record("claude", 0.01, True)
+        router.record("deepseek", 0.02, True)
+    assert asyncio.run(router.invoke(prompt, content)) == "deepseek"
+    assert (router.counters["hedges"], router.counters["hedge_wins"]) == (1, 1)
+    # The loser is cancelled rather than left running
+    assert llms["claude"].cancelled == 1
+
+
+def test_unmeasured_primary_waits_for_the_default_hedge_delay(llms, monkeypatch) -> None:
+    monkeypatch.setattr(providers, "HEDGE_DEFAULT_DELAY", 5.0)
+    llms["claude"].delay = 0.05
+    router = ProviderRouter(["claude", "deepseek"], hedge=True)
+    assert asyncio.run(router.invoke(prompt, content)) == "claude"
+    assert router.counters["hedges"] == 0
+    assert llms["deepseek"].calls == []
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from app.ai.geometry import FloorPlan
+from app.ai.quality import box_pairs, check_plan, cross_pairs
+
+
+def make_plan(rooms, doors=(), outline=(0, 0, 400, 300)):
+    """A one-floor plan: `rooms` maps names to `(x, y, w, h)`, `doors` are hinge points."""
+    x, y, w, h = outline
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="-100 -100 700 600">',
+        f'<rect data-kind="outline" x="{x}" y="{y}" width="{w}" height="{h}" fill="none" stroke="#000" stroke-width="4"/>',
+    ]
+    for name, (x, y, w, h) in rooms.items():
+        parts.append(f'<rect data-kind="room" x="{x}" y="{y}" width="{w}" height="{h}" fill="none" stroke="#000" stroke-width="2"/>')
+        parts.append(f'<text x="{x + w / 2}" y="{y + h / 2}">{name}</text>')
+    for hx, hy in doors:
+        parts.append(f'<path d="M{hx} {hy - 30} A30 30 0 0 1 {hx + 30} {hy}" fill="none" stroke="#000"/>')
+    parts.append("</svg>")
+    return FloorPlan.from_svg("".join(parts))
+
+
+def issues(quality, check):
+    return [issue for issue in quality["issues"] if issue["check"] == check]
+
+
+def test_clean_plan_passes() -> None:
+    plan = make_plan({"Bedroom": (0, 0, 200, 150), "Kitchen": (200, 0, 200, 150)}, doors=[(100, 150), (300, 150)])
+    quality = check_plan(plan)
+    assert quality["ok"] and quality["issues"] == []
+    assert [room["name"] for room in quality["rooms"]] == ["Bedroom", "Kitchen"]
+
+
+def test_partial_overlap_is_an_error() -> None:
+    plan = make_plan({"Bedroom": (0, 0, 200, 150), "Kitchen": (150, 0, 200, 150)}, doors=[(100, 150), (300, 150)])
+    quality = check_plan(plan)
+    assert not quality["ok"]
+    [overlap] = issues(quality, "overlap")
+    assert overlap["severity"] == "error"
+    assert overlap["rooms"] == ["Bedroom", "Kitchen"]
+    assert "25%" in overlap["message"]
+
+
+def test_overlap_within_tolerance_is_ignored() -> None:
+    plan = make_plan({"Bedroom": (0, 0, 200, 150), "Kitchen": (195, 0, 200, 150)}, doors=[(100, 150), (300, 150)])
+    assert issues(check_plan(plan), "overlap") == []
+
+
+def test_room_inside_room_is_a_warning() -> None:
+    plan = make_plan({"Bedroom": (0, 0, 200, 150), "Wardrobe": (10, 10, 40, 30)}, doors=[(100, 150), (10, 40)])
+    quality = check_plan(plan)
+    assert quality["ok"]
+    [overlap] = issues(quality, "overlap")
+    assert overlap["severity"] == "warning"
+    assert overlap["message"] == "Wardrobe is drawn inside Bedroom"
+
+
+def test_plan_without_doors_is_warned_about() -> None:
+    quality = check_plan(make_plan({"Bedroom": (0, 0, 200, 150)}))
+    assert quality["ok"]
+    assert [issue["message"] for issue in issues(quality, "doors")] == ["The plan has no doors drawn"]
+
+
+def test_room_without_door_is_warned_about() -> None:
+    rooms = {"Bedroom": (0, 0, 200, 150), "Kitchen": (200, 0, 200, 150), "Lawn": (0, 150, 400, 150)}
+    # Hinges on the bedroom's edge and in the middle of the kitchen; the lawn needs none
+    quality = check_plan(make_plan(rooms, doors=[(100, 150), (300, 75)]))
+    [door] = issues(quality, "doors")
+    assert door["severity"] == "warning"
+    assert door["rooms"] == ["Kitchen"]
+
+
+def test_room_outside_outline_is_an_error() -> None:
+    rooms = {"Bedroom": (0, 0, 200, 150), "Garage": (400, 0, 100, 150), "Store": (350, 150, 100, 100)}
+    quality = check_plan(make_plan(rooms, doors=[(100, 150), (400, 200)]))
+    assert not quality["ok"]
+    [outside] = issues(quality, "outside")
+    assert outside["severity"] == "error"
+    assert outside["message"] == "50% of Store lies outside the house outline"
+
+
+def test_no_rooms_is_a_warning() -> None:
+    quality = check_plan(make_plan({}))
+    assert quality["ok"]
+    assert [issue["check"] for issue in quality["issues"]] == ["rooms"]
+
+
+def brute_force_pairs(x0, y0, x1, y1):
+    return {
+        (min(a, b), max(a, b))
+        for a in range(len(x0)) for b in range(a + 1, len(x0))
+        if x0[a] < x1[b] and x0[b] < x1[a] and y0[a] < y1[b] and y0[b] < y1[a]
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_box_pairs_matches_brute_force(seed) -> None:
+    rng = np.random.default_rng(seed)
+    # Integer corners, so boxes often share an edge without overlapping
+    x0, y0 = rng.integers(0, 100, 60).astype(np.float32), rng.integers(0, 100, 60).astype(np.float32)
+    x1, y1 = x0 + rng.integers(1, 30, 60), y0 + rng.integers(1, 30, 60)
+    a, b = box_pairs(x0, y0, x1, y1)
+    found = {(min(i, j), max(i, j)) for i, j in zip(a.tolist(), b.tolist())}
+    assert len(found) == len(a)
+    assert found == brute_force_pairs(x0, y0, x1, y1)
+
+
+def test_cross_pairs_only_pairs_across_sets() -> None:
+    first = tuple(np.array(v, np.float32) for v in ([0, 0], [0, 50], [10, 10], [10, 60]))
+    second = tuple(np.array(v, np.float32) for v in ([5, 100], [5, 0], [8, 110], [55, 10]))
+    i, j = cross_pairs(first, second)
+    assert sorted(zip(i.tolist(), j.tolist())) == [(0, 0), (1, 0)]
@@ -0,0 +1,95 @@
+import asyncio
+
+from app.ai import generation, model, rescale
+from app.ai.generation import generate_svg
+from app.ai.geometry import FloorPlan
+from app.ai.plan_store import plan_store
+from app.ai.quality import check_plan
+from app.ai.ranking import CRITERIA, rank_variants
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import FakeLLM, PLAN_SVG
+
+SPECS = HouseSpecifications(house_type="modern", num_marla=5, num_floors=1, num_bedrooms=2)
+TWO_BEDROOMS = PLAN_SVG.replace("Kitchen", "Bedroom 2")
+OVERLAPPING = PLAN_SVG.replace('<rect x="100" y="0"', '<rect x="40" y="0"').replace('<text x="150"', '<text x="120"')
+
+
+def candidate(svg):
+    return plan_store.save(svg, SPECS), check_plan(FloorPlan.from_svg(svg))
+
+
+def test_candidates_are_ranked_best_first() -> None:
+    order, scores, penalties = rank_variants([candidate(PLAN_SVG), candidate(OVERLAPPING), candidate(TWO_BEDROOMS)], 2)
+    assert order.tolist() == [2, 0, 1]
+    assert scores[2] > scores[0] > scores[1]
+    assert penalties.shape == (3, len(CRITERIA))
+    bedrooms, errors = CRITERIA.index("bedrooms"), CRITERIA.index("errors")
+    assert penalties[0, bedrooms] == 0.5 and penalties[2, bedrooms] == 0
+    assert penalties[1, errors] > 0 and penalties[2, errors] == 0
+
+
+def test_unknown_measures_neither_help_nor_hurt() -> None:
+    # Without a plot scale, utilisation is unknown for every candidate
+    order, scores, penalties = rank_variants([candidate(TWO_BEDROOMS), ("0" * 24, None)], 2)
+    utilisation = CRITERIA.index("utilisation")
+    assert penalties[0, utilisation] == penalties[1, utilisation]
+    assert order.tolist() == [0, 1]
+
+
+class VariantLLM(FakeLLM):
+    """Draws the kitchen as a second bedroom for every alternative variant."""
+
+    async def ainvoke(self, messages, **kwargs):
+        message = await super().ainvoke(messages, **kwargs)
+        if "alternative design" in messages[-1].content:
+            message.content = message.content.replace("Kitchen", "Bedroom 2")
+        return message
+
+
+def test_variants_are_generated_and_ranked(monkeypatch) -> None:
+    # Otherwise a variant may be rescaled from another that was stored first
+    monkeypatch.setattr(rescale, "RESCALE_ENABLED", False)
+    llm = VariantLLM()
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    specs = SPECS.model_copy(update={"num_variants": 3})
+    result = asyncio.run(generate_svg(specs))
+    assert len(llm.calls) == 3
+    # Both alternatives drew the same plan, listed once, and it matches the brief best
+    assert [variant["rank"] for variant in result.variants] == [1, 2]
+    assert result.plan_id == result.variants[0]["plan_id"]
+    assert "Bedroom 2" in result.svg_content
+    assert result.usage["input_tokens"] == 3 * FakeLLM.usage["input_tokens"]
+    again = asyncio.run(generate_svg(specs))
+    assert len(llm.calls) == 3 and again.cache_hit
+    assert [variant["plan_id"] for variant in again.variants] == [variant["plan_id"] for variant in result.variants]
+
+
+def test_failed_variants_are_left_out(monkeypatch) -> None:
+    llm = VariantLLM()
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+
+    async def fail(*args):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(generation, "_generate_variant", fail)
+    result = asyncio.run(generate_svg(SPECS.model_copy(update={"num_variants": 3})))
+    assert [variant["plan_id"] for variant in result.variants] == [result.plan_id]
+
+
+def test_partial_variants_are_left_out(monkeypatch) -> None:
+    monkeypatch.setattr(rescale, "RESCALE_ENABLED", False)
+
+    class TruncatingLLM(VariantLLM):
+        async def ainvoke(self, messages, **kwargs):
+            message = await super().ainvoke(messages, **kwargs)
+            if "alternative design 3" in messages[-1].content:
+                message.content = message.content[:message.content.index("Bedroom 2")]
+                message.response_metadata = {"stop_reason": "max_tokens"}
+            return message
+
+    llm = TruncatingLLM()
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    result = asyncio.run(generate_svg(SPECS.model_copy(update={"num_variants": 3})))
+    assert len(llm.calls) == 3 and not result.partial
+    assert len(result.variants) == 2 and None not in [variant["plan_id"] for variant in result.variants]
+    assert result.usage["input_tokens"] == 3 * FakeLLM.usage["input_tokens"]
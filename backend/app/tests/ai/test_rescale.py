@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from app.ai.generation import generate_svg
+from app.ai.plan_store import plan_store
+from app.ai.rescale import RescaleIndex, rescale_index, rescale_svg
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import PLAN_SVG
+
+
+def specs(**overrides):
+    return HouseSpecifications(**{"house_type": "modern", "num_marla": 10, "num_floors": 1, "num_bedrooms": 2, **overrides})
+
+
+def test_geometry_scales_with_the_square_root_of_the_area() -> None:
+    svg = (
+        '<svg viewBox="0 0 100 50" width="100px" height="50%"><style>.a { stroke-width: 2 }</style>'
+        '<g transform="translate(10, 20) rotate(90 5 5) scale(2)">'
+        '<rect x="1.5" y="2" width="10" height="4" stroke-width="2" font-size="12"/>'
+        '<path d="M0 0 L10 0 A5 5 0 0 1 20 10 z"/>'
+        '<polygon points="0,0 10,0 10,10"/></g></svg>'
+    )
+    scaled = rescale_svg(svg, 10, 40)
+    assert 'viewBox="0 0 200 100"' in scaled
+    assert 'width="200px" height="50%"' in scaled
+    assert 'transform="translate(20 40) rotate(90 10 10) scale(2)"' in scaled
+    assert 'x="3" y="4" width="20" height="8" stroke-width="2" font-size="12"' in scaled
+    # Arc radii scale; the rotation and flags don't
+    assert 'd="M0 0 L20 0 A10 10 0 0 1 40 20 z"' in scaled
+    assert 'points="0,0 20,0 20,20"' in scaled
+    assert "<style>.a { stroke-width: 2 }</style>" in scaled
+
+
+@pytest.mark.parametrize("label,expected", [
+    ("Bedroom 12' x 10'", "Bedroom 24' x 20'"),
+    ("Lounge 12x10", "Lounge 24x20"),
+    ("Kitchen 10'6\"", "Kitchen 21'0\""),
+    ("Area 1,200 sq ft", "Area 4,800 sq ft"),
+    ("Modern House - 10 Marla", "Modern House - 40 Marla"),
+    ("Bedroom 2", "Bedroom 2"),
+])
+def test_labels_are_rescaled(label, expected) -> None:
+    assert rescale_svg(f"<text>{label}</text>", 10, 40) == f"<text>{expected}</text>"
+
+
+def test_nearest_plan_within_tolerance(tmp_path) -> None:
+    plan_store.save(PLAN_SVG, specs(num_marla=10))
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Dining"), specs(num_marla=11))
+    procedural = plan_store.save(PLAN_SVG.replace("Kitchen", "Lounge"), specs(num_marla=10.4), engine="procedural")
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Store"), specs(num_marla=10.3), derived_from=procedural)
+    index = RescaleIndex(plan_store)
+    assert index.nearest(specs(num_marla=10.5))[1] == 11
+    assert index.nearest(specs(num_marla=10.2))[1] == 10
+    assert index.nearest(specs(num_marla=12.5)) is None
+    assert index.nearest(specs(num_marla=10, num_bedrooms=3)) is None
+    assert index.nearest(specs(num_marla=10, additional_preferences=["garden"])) is None
+    assert index.stats() == {"programs": 1, "plans": 2, "derived": 0}
+
+
+def test_plans_are_only_rescaled_for_the_same_engine() -> None:
+    plan_store.save(PLAN_SVG, specs(num_marla=10), engine="layout")
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Dining"), specs(num_marla=10, num_floors=2), floor_plan_ids=["a", "b"])
+    index = RescaleIndex(plan_store)
+    assert index.nearest(specs(num_marla=10.5)) is None
+    assert index.nearest(specs(num_marla=10.5, mode="layout"))[1] == 10
+    assert index.nearest(specs(num_marla=10.5, num_floors=2)) is None
+    assert index.nearest(specs(num_marla=10.5, num_floors=2, parallel_floors=True))[1] == 10
+
+
+def test_plans_failing_quality_checks_are_not_rescaled() -> None:
+    overlapping = PLAN_SVG.replace('<rect x="100" y="0"', '<rect x="40" y="0"').replace('<text x="150"', '<text x="120"')
+    plan_store.save(overlapping, specs(num_marla=10.4))
+    plan_store.save(PLAN_SVG, specs(num_marla=11))
+    index = RescaleIndex(plan_store)
+    # The overlapping plan is the closer one, but is dropped once checked
+    assert index.nearest(specs(num_marla=10.5))[1] == 11
+    assert index.nearest(specs(num_marla=9.6)) is None
+    assert index.stats()["plans"] == 1
+
+
+def test_index_sees_plans_stored_later() -> None:
+    index = RescaleIndex(plan_store)
+    assert index.nearest(specs(num_marla=10.5)) is None
+    plan_store.save(PLAN_SVG, specs(num_marla=10))
+    assert index.nearest(specs(num_marla=10.5))[1] == 10
+
+
+def test_index_reads_only_new_metadata(monkeypatch) -> None:
+    plan_store.save(PLAN_SVG, specs(num_marla=10))
+    index = RescaleIndex(plan_store)
+    index.nearest(specs(num_marla=10.5))
+    read = []
+    load_metadata = plan_store.load_metadata
+    monkeypatch.setattr(plan_store, "load_metadata", lambda plan_id: read.append(plan_id) or load_metadata(plan_id))
+    later = plan_store.save(PLAN_SVG.replace("Kitchen", "Dining"), specs(num_marla=11))
+    assert index.nearest(specs(num_marla=10.8))[1] == 11
+    assert read == [later]
+
+
+def test_nearby_plot_is_rescaled_instead_of_generated(fake_llm) -> None:
+    original = asyncio.run(generate_svg(specs(num_marla=10)))
+    derived = asyncio.run(generate_svg(specs(num_marla=10.5)))
+    assert len(fake_llm.calls) == 1
+    assert derived.derived_from == original.plan_id and not derived.cache_hit
+    # sqrt(10.5 / 10) = 1.0247
+    assert 'viewBox="0 0 204.94 153.7"' in derived.svg_content
+    assert derived.plan_id == plan_store.save(derived.svg_content)
+    assert rescale_index.stats()["derived"] == 1
+    # Forcing a generation asks the model again
+    forced = asyncio.run(generate_svg(specs(num_marla=10.5, force_regenerate=True)))
+    assert forced.derived_from is None and len(fake_llm.calls) == 2
@@ -0,0 +1,75 @@
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+from app.ai.cache import normalize_specs
+from app.ai.plan_store import plan_store
+from app.ai.similar import MARLA_WEIGHT, SimilarPlanIndex, spec_vector
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import PLAN_SVG
+
+
+def specs(**overrides):
+    return HouseSpecifications(**{"house_type": "modern", "num_marla": 10, "num_floors": 2, "num_bedrooms": 4, **overrides})
+
+
+def store(spec, label):
+    return plan_store.save(PLAN_SVG.replace("Kitchen", label), spec)
+
+
+def test_plot_size_is_compared_on_a_log_scale() -> None:
+    def vector(marla):
+        return spec_vector(normalize_specs(specs(num_marla=marla)))
+
+    assert np.linalg.norm(vector(5) - vector(10)) == pytest.approx(MARLA_WEIGHT)
+    assert np.linalg.norm(vector(7) - vector(14)) == pytest.approx(MARLA_WEIGHT)
+
+
+def test_preferences_are_order_and_case_insensitive() -> None:
+    a = spec_vector(normalize_specs(specs(additional_preferences=["Garden", "balcony"])))
+    b = spec_vector(normalize_specs(specs(additional_preferences=["balcony", " garden "])))
+    np.testing.assert_array_equal(a, b)
+
+
+def test_query_matches_brute_force() -> None:
+    rng = random.Random(7)
+    house_types = ["modern", "classic", "spanish", "farmhouse"]
+    for i in range(60):
+        spec = specs(
+            house_type=rng.choice(house_types),
+            num_marla=rng.choice([3, 5, 7, 10, 12, 20]),
+            num_floors=rng.randint(1, 3),
+            num_bedrooms=rng.randint(1, 6),
+            additional_preferences=rng.sample(["garden", "basement", "balcony", "study"], rng.randint(0, 2)),
+        )
+        store(spec, f"Room {i}")
+    index = SimilarPlanIndex(plan_store)
+    query = specs(house_type="classic", num_marla=8, num_bedrooms=3)
+    found = index.query(query, k=5)
+
+    target = spec_vector(normalize_specs(query))
+    distances = sorted(
+        math.dist(spec_vector(meta["specs"]), target) for meta in plan_store.iter_metadata()
+    )
+    assert [plan["distance"] for plan in found] == pytest.approx(distances[:5], abs=1e-3)
+    assert index.stats() == {"plans": 60}
+
+
+def test_new_and_incomplete_plans() -> None:
+    index = SimilarPlanIndex(plan_store)
+    assert index.query(specs()) == []
+    exact = store(specs(), "Exact")
+    store(specs(num_bedrooms=5), "Bigger")
+    # Metadata without its SVG is a plan still being written
+    os.remove(os.path.join(plan_store.directory, f"{exact}.svg"))
+    assert [plan["specs"]["num_bedrooms"] for plan in index.query(specs())] == [5]
+    plan_store.save(PLAN_SVG.replace("Kitchen", "Exact"), specs())
+    # The directory's mtime may not have ticked since the last query
+    os.utime(plan_store.directory, ns=(0, os.stat(plan_store.directory).st_mtime_ns + 1))
+    nearest, bigger = index.query(specs())
+    assert nearest["plan_id"] == exact and nearest["distance"] == 0
+    assert nearest["engine"] == "llm" and nearest["derived_from"] is None
+    assert bigger["distance"] == pytest.approx(1.0)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.ai.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run() -> None:
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "plan"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), flight.do("other", work))
+
+    assert asyncio.run(main()) == ["plan"] * 4
+    assert len(runs) == 2
+    assert flight.stats() == {"leaders": 2, "followers": 2, "cancelled": 0, "in_flight": 0}
+
+
+def test_later_calls_run_again() -> None:
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        return len(runs)
+
+    async def main():
+        return [await flight.do("key", work), await flight.do("key", work)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_errors_reach_every_waiter() -> None:
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("no svg")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(2)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [type(error) for error in errors] == [ValueError, ValueError]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_one_waiter_leaving_does_not_cancel_the_work() -> None:
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    async def main():
+        leaving = asyncio.ensure_future(flight.do("key", work))
+        staying = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(main()) == "plan"
+    assert flight.counters["cancelled"] == 0
+
+
+def test_work_is_cancelled_when_every_waiter_leaves() -> None:
+    flight = SingleFlight()
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiters[0]
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+    assert flight.stats() == {"leaders": 1, "followers": 1, "cancelled": 1, "in_flight": 0}
@@ -0,0 +1,50 @@
+import pytest
+
+from app.ai import stream_guard
+from app.ai.stream_guard import StreamAborted, StreamGuard, stream_stats
+from app.tests.conftest import PLAN_SVG
+
+
+def feed_all(guard, text, chunk_size=16):
+    for i in range(0, len(text), chunk_size):
+        svg_content = guard.feed(text[i:i + chunk_size])
+        if svg_content is not None:
+            return svg_content
+    return None
+
+
+def test_complete_svg_passes() -> None:
+    assert feed_all(StreamGuard(), "Here is the plan:\n```svg\n" + PLAN_SVG + "\n```") == PLAN_SVG
+    assert not stream_stats
+
+
+def test_output_without_svg_is_aborted_early(monkeypatch) -> None:
+    monkeypatch.setattr(stream_guard, "SVG_START_CHARS", 100)
+    guard = StreamGuard()
+    with pytest.raises(StreamAborted) as aborted:
+        feed_all(guard, "I am sorry, but " * 50)
+    assert aborted.value.reason == "no_svg"
+    assert guard.extractor.seen <= 100 + 16
+    assert stream_stats["aborted_no_svg"] == 1
+
+
+def test_runaway_svg_is_aborted(monkeypatch) -> None:
+    monkeypatch.setattr(stream_guard, "STREAM_MAX_SVG_CHARS", 1000)
+    with pytest.raises(StreamAborted) as aborted:
+        feed_all(StreamGuard(), PLAN_SVG[:-6] + '<rect x="0" y="0" width="1" height="1"/>' * 100)
+    assert aborted.value.reason == "too_large"
+
+
+def test_unrepairable_svg_is_aborted(monkeypatch) -> None:
+    monkeypatch.setattr(stream_guard, "STRUCTURE_CHECK_CHARS", 64)
+    broken = PLAN_SVG[:-6] + '<rect x="1" <<< <rect/>' + '<line x1="0" y1="0" x2="1" y2="1"/>' * 10
+    with pytest.raises(StreamAborted) as aborted:
+        feed_all(StreamGuard(), broken)
+    assert aborted.value.reason == "invalid"
+    assert stream_stats["aborted_invalid"] == 1
+
+
+def test_repairable_partial_svg_is_not_aborted(monkeypatch) -> None:
+    monkeypatch.setattr(stream_guard, "STRUCTURE_CHECK_CHARS", 16)
+    # Unclosed groups and a half-written tag are fixed once the rest arrives
+    assert feed_all(StreamGuard(), PLAN_SVG[:-6] + "<g><g>" + '<text x="1">Bed &amp; Bath</text>' * 5) is None
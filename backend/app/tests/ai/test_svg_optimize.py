@@ -0,0 +1,160 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.ai import svg_optimize
+from app.ai.generation import generate_svg
+from app.ai.geometry import FloorPlan
+from app.ai.plan_store import PlanStore, plan_store
+from app.ai.procedural import render_procedural
+from app.ai.svg_optimize import expand_for_raster, optimize_svg
+from app.ai.svg_repair import validate_svg
+from app.api.routes.generate_svg import HouseSpecifications
+from app.api.routes.helpers import svg_to_png_wand
+from app.tests.conftest import PLAN_SVG
+
+SAMPLE_PLAN = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "image.svg")
+
+VERBOSE = """<?xml version="1.0"?>
+<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 300" width="400" height="300">
+  <!-- Ground floor -->
+  <rect x="0" y="0" width="400" height="300" fill="#ffffff" opacity="1"/>
+  <g transform="translate(10.000001, 10)">
+    <rect x="0.000000" y="0.000000" width="190.123456" height="140" fill="none" stroke="black" stroke-width="2" stroke-linecap="butt"/>
+    <text x="60" y="60" font-family="Arial" font-size="12" text-anchor="start">Bedroom 1</text>
+    <rect x="190.123456" y="0" width="189.876544" height="140" fill="none" stroke="black" stroke-width="2"/>
+    <text x="250" y="60" font-family="Arial" font-size="12">Bedroom 2</text>
+    <line x1="20" y1="140" x2="50" y2="140" stroke="#4a90d9" stroke-width="3"/>
+    <line x1="220" y1="140" x2="250" y2="140" stroke="#4a90d9" stroke-width="3"/>
+    <line x1="20" y1="280" x2="50" y2="280" stroke="#4a90d9" stroke-width="3"/>
+    <path d="M 40.0000 140.0000 A 20 20 0 0 1 20 120" fill="none" stroke="black" stroke-width="1"/>
+    <path d="M 240.0000 140.0000 A 20 20 0 0 1 220 120" fill="none" stroke="black" stroke-width="1"/>
+    <rect x="0" y="140" width="380" height="140" fill="none" stroke="black" stroke-width="2"/>
+    <text x="100" y="200" font-family="Arial" font-size="12">Living Room</text>
+  </g>
+</svg>
+"""
+
+DOOR = (
+    '<g transform="translate({x}, {y})"><path d="M 0 0 L 30 0" stroke="#8b4513" stroke-width="3"/>'
+    '<path d="M 0 0 A 30 30 0 0 1 30 30" fill="none" stroke="#8b4513" stroke-width="1"/></g>'
+)
+# Repeated doors and walls, so the optimized plan uses both <use> and classes
+REPEATED = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 300" width="400" height="300">'
+    + "".join(DOOR.format(x=x, y=y) for x, y in [(20, 140), (220, 140), (120, 280), (300, 40)])
+    + "".join(f'<rect x="{x}" y="0" width="100" height="140" fill="none" stroke="black" stroke-width="2"/>' for x in (0, 100, 200))
+    + "</svg>"
+)
+
+
+def sorted_rows(array):
+    """Rows of a structured array as a float matrix, in a canonical order."""
+    if not len(array):
+        return np.zeros((0, 0))
+    fields = [name for name in array.dtype.names if name not in ("text", "label", "rect")]
+    rows = np.column_stack([array[name].astype(np.float64) for name in fields])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def assert_same_geometry(before, after):
+    a, b = FloorPlan.from_svg(before), FloorPlan.from_svg(after)
+    assert a.view_box == pytest.approx(b.view_box)
+    for name in ("rects", "segments", "doors", "labels"):
+        first, second = sorted_rows(getattr(a, name)), sorted_rows(getattr(b, name))
+        assert first.shape == second.shape, name
+        np.testing.assert_allclose(first, second, atol=0.01, err_msg=name)
+    assert sorted(a.texts) == sorted(b.texts)
+    assert [a.name(i) for i in a.rooms()] == [b.name(i) for i in b.rooms()]
+
+
+def plans():
+    specs = SimpleNamespace(house_type="modern", num_marla=10, num_bedrooms=4, num_floors=2, additional_preferences=[])
+    yield "verbose", VERBOSE
+    yield "procedural", render_procedural(specs)
+    if os.path.exists(SAMPLE_PLAN):
+        with open(SAMPLE_PLAN, "r", encoding="utf-8") as f:
+            yield "sample", f.read()
+
+
+@pytest.mark.parametrize("name,svg", list(plans()), ids=lambda value: value if len(value) < 20 else "")
+def test_optimized_plan_is_equivalent(name, svg) -> None:
+    optimized = optimize_svg(svg)
+    assert validate_svg(optimized) == []
+    assert_same_geometry(svg, optimized)
+
+
+def test_verbose_plan_shrinks() -> None:
+    optimized = optimize_svg(VERBOSE)
+    assert len(optimized) < len(VERBOSE) * 0.8
+    assert "<!--" not in optimized and "<?xml" not in optimized
+    assert "190.123456" not in optimized
+    assert 'opacity="1"' not in optimized
+
+
+def test_optimizing_is_idempotent() -> None:
+    once = optimize_svg(VERBOSE)
+    assert optimize_svg(once) == once
+
+
+def test_stylesheet_plans_keep_their_structure() -> None:
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><style>g > line { stroke: red }</style>'
+        '<g><line x1="0" y1="0" x2="10" y2="0" stroke-width="2"/><line x1="0" y1="5" x2="10" y2="5" stroke-width="2"/></g></svg>'
+    )
+    optimized = optimize_svg(svg)
+    assert optimized.count("<line") == 2
+    # The selector depends on the <g>, so it isn't merged away
+    assert "<g><line" in optimized and "line { stroke: red }" in optimized
+    assert_same_geometry(svg, optimized)
+
+
+def test_malformed_input_is_returned_unchanged() -> None:
+    svg = "<svg><rect></svg>"
+    assert optimize_svg(svg) == svg
+
+
+def test_generated_plans_are_stored_optimized(fake_llm) -> None:
+    specs = HouseSpecifications(house_type="modern", num_marla=5, num_floors=1, num_bedrooms=2)
+    result = asyncio.run(generate_svg(specs))
+    assert result.svg_content == optimize_svg(PLAN_SVG)
+    assert plan_store.load_svg(result.plan_id) == result.svg_content
+
+
+def test_optimizing_can_be_disabled(monkeypatch) -> None:
+    monkeypatch.setattr(svg_optimize, "SVG_OPTIMIZE_ENABLED", False)
+    assert optimize_svg(VERBOSE) == VERBOSE
+
+
+def test_rasterized_plans_have_no_classes_or_uses() -> None:
+    optimized = optimize_svg(REPEATED)
+    assert "<use" in optimized and "class=" in optimized
+    expanded = expand_for_raster(optimized)
+    assert "<use" not in expanded and "class=" not in expanded and "<style" not in expanded
+    assert validate_svg(expanded) == []
+    assert_same_geometry(REPEATED, expanded)
+    # Stylesheets the optimizer didn't write are left to the renderer
+    styled = '<svg xmlns="http://www.w3.org/2000/svg"><style>g > .wall{stroke:red}</style><g><rect class="wall"/></g></svg>'
+    assert expand_for_raster(styled) == styled
+
+
+def _pixels(png):
+    from wand.image import Image as WandImage
+
+    with WandImage(blob=png) as image:
+        return np.asarray(image, dtype=np.float64)
+
+
+@pytest.mark.parametrize("svg", [VERBOSE, REPEATED], ids=["verbose", "repeated"])
+def test_optimized_plan_renders_like_the_original(svg) -> None:
+    try:
+        original = _pixels(svg_to_png_wand(svg))
+    except ImportError:
+        pytest.skip("ImageMagick is not installed")
+    optimized = _pixels(PlanStore.render_png(optimize_svg(svg)))
+    assert optimized.shape == original.shape
+    # Rounding coordinates may move an edge by a fraction of a pixel
+    assert np.abs(optimized - original).mean() < 1
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from langchain.schema.output_parser import OutputParserException
+
+from app.ai import model
+from app.ai.generation import stream_svg
+from app.ai.svg_parser import SVGExtractor, SVGOutputParser
+from app.api.routes.generate_svg import HouseSpecifications
+from app.tests.conftest import STORED_SVG, FakeLLM
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><rect x="1" y="1" width="5" height="5"/></svg>'
+
+
+def extract(text):
+    extractor = SVGExtractor()
+    extractor.feed(text)
+    return extractor.finish()
+
+
+def extract_in_chunks(text, size):
+    extractor = SVGExtractor()
+    for i in range(0, len(text), size):
+        extractor.feed(text[i:i + size])
+    return extractor.finish()
+
+
+def test_extracts_svg_from_surrounding_text() -> None:
+    assert extract(f"Here is the plan:\n{SVG}\nHope it helps!") == SVG
+
+
+def test_extracts_svg_from_code_fence() -> None:
+    assert extract(f"```svg\n{SVG}\n```\nMore text</svg>") == SVG
+
+
+def test_fence_closing_before_svg_restarts_search() -> None:
+    truncated = '```svg\n<svg viewBox="0 0 5 5"><rect x="1"/>\n```\n'
+    assert extract(truncated + SVG) == SVG
+
+
+def test_nested_svg_is_kept_whole() -> None:
+    svg = '<svg><svg x="10"><rect/></svg><text>after nested</text></svg>'
+    assert extract(f"prefix {svg} suffix") == svg
+
+
+def test_markup_lookalikes_do_not_close_svg() -> None:
+    svg = (
+        "<svg><!-- </svg> in a comment --><style><![CDATA[ .a::after { content: '</svg>' } ]]></style>"
+        '<?pi </svg> ?><text data-note="a > b </svg>">Bed</text></svg>'
+    )
+    assert extract(svg + "</svg>") == svg
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunked_input_matches_whole_input(size) -> None:
+    text = (
+        "Sure! ```svg\n<svg><!-- </svg> --><![CDATA[</svg>]]>"
+        '<svg x="1"><rect title="a>b"/></svg><text>Bed 10x12</text></svg>\n``` trailing </svg>'
+    )
+    assert extract_in_chunks(text, size) == extract(text)
+
+
+def test_feed_returns_svg_once_complete() -> None:
+    extractor = SVGExtractor()
+    assert extractor.feed("<svg><rect/>") is None
+    assert not extractor.done
+    assert extractor.feed("</svg> and more") == "<svg><rect/></svg>"
+    assert extractor.done
+
+
+def test_svg_prefix_needs_a_tag_boundary() -> None:
+    with pytest.raises(OutputParserException):
+        extract("<svgfoo>not a plan</svgfoo>")
+
+
+def test_missing_svg_raises() -> None:
+    with pytest.raises(OutputParserException, match="Could not extract SVG"):
+        extract("I can't draw that.")
+
+
+def test_unclosed_svg_raises_and_partial_returns_it() -> None:
+    extractor = SVGExtractor()
+    extractor.feed('text <svg><rect x="1"/><text>Be')
+    with pytest.raises(OutputParserException, match="not closed"):
+        extractor.finish()
+    assert extractor.partial() == '<svg><rect x="1"/><text>Be'
+
+
+def test_svg_past_max_chars_raises() -> None:
+    extractor = SVGExtractor(max_chars=100)
+    extractor.feed("<svg>")
+    with pytest.raises(OutputParserException, match="exceeds"):
+        extractor.feed("<rect/>" * 50)
+
+
+def test_output_parser_uses_extractor() -> None:
+    assert SVGOutputParser().parse(f"```\n{SVG}\n```") == SVG
+
+
+class StopIgnoringLLM(FakeLLM):
+    """A provider that keeps writing after the plan, ignoring the stop sequence."""
+
+    def _text(self, stop=None):
+        return self.reply + "\nThis plan has two rooms." * 50
+
+
+def test_stream_stops_reading_once_the_plan_is_complete(monkeypatch) -> None:
+    llm = StopIgnoringLLM()
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    specs = HouseSpecifications(house_type="modern", num_marla=5, num_floors=1, num_bedrooms=2)
+
+    async def collect():
+        return [event async for event in stream_svg(specs)]
+
+    events = asyncio.run(collect())
+    tokens = "".join(text for kind, text in events if kind == "token")
+    assert tokens.startswith(llm.reply) and len(tokens) < len(llm.reply) + 16
+    assert events[-1][1].svg_content == STORED_SVG
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.ai.generation import _extract_svg, generate_svg
+from app.ai.svg_parser import SVGExtractor
+from app.ai.svg_repair import InvalidSVG, check_partial_svg, repair_svg, validate_svg
+from app.api.routes.generate_svg import HouseSpecifications
+
+ROOT = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 50" width="100" height="50">'
+
+
+def test_valid_svg_is_unchanged() -> None:
+    svg = ROOT + '<rect x="1" y="1" width="5" height="5"/></svg>'
+    assert repair_svg(svg) == (svg, [])
+
+
+def test_truncated_svg_is_closed() -> None:
+    fixed, repairs = repair_svg(ROOT + '<g><rect x="1" y="1" width="5" height="5"/><text x="2">Bed')
+    assert "closed_truncated" in repairs
+    assert fixed.endswith("<text x=\"2\">Bed</text></g></svg>")
+    assert validate_svg(fixed) == []
+
+
+def test_truncated_tag_is_dropped() -> None:
+    fixed, repairs = repair_svg(ROOT + '<rect x="1" y="1" width="5" height="5"/><rect x="2" wid')
+    assert repairs == ["closed_truncated"]
+    assert fixed == ROOT + '<rect x="1" y="1" width="5" height="5"/></svg>'
+
+
+def test_mismatched_end_tag_closes_inner_elements() -> None:
+    fixed, repairs = repair_svg(ROOT + "<g><text>Bed</g></svg>")
+    assert "mismatched_tag" in repairs
+    assert fixed == ROOT + "<g><text>Bed</text></g></svg>"
+
+
+def test_stray_end_tag_is_removed() -> None:
+    fixed, repairs = repair_svg(ROOT + "<rect/></text></svg>")
+    assert repairs == ["stray_end_tag"]
+    assert fixed == ROOT + "<rect/></svg>"
+
+
+def test_entities_are_fixed() -> None:
+    fixed, repairs = repair_svg(ROOT + "<text>Bed &amp; Bath &nbsp;2 &copy; & Co &bogus;</text></svg>")
+    assert {"html_entity", "escaped_ampersand"} <= set(repairs)
+    assert "<text>Bed &amp; Bath &#160;2 &#169; &amp; Co &amp;bogus;</text>" in fixed
+    assert validate_svg(fixed) == []
+
+
+def test_attributes_are_fixed() -> None:
+    fixed, repairs = repair_svg(ROOT + '<rect x=1 y="2" y="3" width="5" height="5"/></svg>')
+    assert {"quoted_attribute", "duplicate_attribute"} <= set(repairs)
+    assert '<rect x="1" y="2" width="5" height="5"/>' in fixed
+
+
+def test_bad_numbers_are_fixed_or_dropped() -> None:
+    fixed, repairs = repair_svg(ROOT + '<rect x="12,5" y="10ft" width="-5" height="NaN"/></svg>')
+    assert '<rect x="12.5" y="10" width="5"/>' in fixed
+    assert {"fixed_number", "dropped_number"} <= set(repairs)
+
+
+def test_missing_root_attributes_are_added() -> None:
+    fixed, repairs = repair_svg('<svg><rect x="0" y="0" width="40" height="20"/></svg>')
+    assert {"added_xmlns", "added_viewbox", "added_size"} <= set(repairs)
+    assert validate_svg(fixed) == []
+
+
+def test_text_after_root_is_dropped() -> None:
+    fixed, repairs = repair_svg(ROOT + "<rect/></svg> Let me know if you need changes.")
+    assert repairs == ["junk_after_root"]
+    assert fixed.rstrip() == ROOT + "<rect/></svg>"
+
+
+@pytest.mark.parametrize("svg", ["<html><body/></html>", "not markup at all", '<svg><rect x="1" <text></svg>'])
+def test_unrepairable_documents_raise(svg) -> None:
+    with pytest.raises(InvalidSVG):
+        repair_svg(svg)
+
+
+
+def test_truncated_generation_is_closed(fake_llm) -> None:
+    fake_llm.reply = ROOT + '<g><rect x="1" y="1" width="5" height="5"/><text x="2">Bed'
+    fake_llm.metadata = {"stop_reason": "max_tokens"}
+    specs = HouseSpecifications(house_type="modern", num_marla=5, num_floors=1, num_bedrooms=2)
+    result = asyncio.run(generate_svg(specs))
+    assert result.svg_content == ROOT + '<g><rect x="1" y="1" width="5" height="5"/><text x="2">Bed</text></g></svg>'
+    assert result.partial and result.plan_id is None
+
+
+def test_only_cut_off_svg_is_partial() -> None:
+    # A closing tag the model left out is repaired, but the plan is complete
+    extractor = SVGExtractor()
+    extractor.feed(ROOT + '<rect x="1" y="1" width="5" height="5"/><text x="2">Bed</svg>')
+    assert _extract_svg(extractor) == (ROOT + '<rect x="1" y="1" width="5" height="5"/><text x="2">Bed</text></svg>', False)
+    extractor = SVGExtractor()
+    extractor.feed(ROOT + '<rect x="1" y="1" width="5" height="5"/><text x="2">Bed')
+    svg_content, partial = _extract_svg(extractor)
+    assert partial and validate_svg(svg_content) == []
+
+
+def test_partial_svg_check() -> None:
+    # Cut off mid-tag or mid-entity: repairable once the rest arrives or not
+    check_partial_svg(ROOT + '<g><rect x="1"/><text>Bed &am')
+    check_partial_svg(ROOT + '<rect x="1" y')
+    with pytest.raises(InvalidSVG):
+        check_partial_svg(ROOT + '<rect x="1" <<< <rect/>')
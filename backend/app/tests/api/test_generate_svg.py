@@ -0,0 +1,238 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+from app.ai.admission import ProviderAdmission, admission
+from app.ai.providers import provider_router
+from app.api import ratelimit
+from app.api.routes import generate_svg
+from app.main import app
+from app.tests.conftest import PLAN_SVG, STORED_SVG
+
+SPECS = {"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2}
+
+
+def sse_events(body):
+    """`(event, data)` pairs of a Server-Sent Events response body."""
+    events = []
+    for message in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+async def _send(requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.request(method, path, json=body) for method, path, body in requests))
+
+
+def ndjson(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def post(path, *bodies):
+    """POST each body to `path` concurrently and return the responses."""
+    return asyncio.run(_send([("POST", path, body) for body in bodies]))
+
+
+def get(path):
+    return asyncio.run(_send([("GET", path, None)]))[0]
+
+
+def test_generations_do_not_block_each_other(fake_llm) -> None:
+    fake_llm.delay = 0.3
+    responses = post("/api/v1/generate-house-svg", *({**SPECS, "num_bedrooms": n} for n in (1, 2, 3)))
+    assert fake_llm.max_active == 3
+    assert [response.status_code for response in responses] == [200] * 3
+    assert responses[0].json()["svg_content"] == STORED_SVG
+    assert len(fake_llm.calls) == 3
+
+
+def test_invalid_specs_are_rejected(fake_llm) -> None:
+    [response] = post("/api/v1/generate-house-svg", {**SPECS, "num_marla": 0})
+    assert response.status_code == 400
+    assert fake_llm.calls == []
+
+
+def test_stream_sends_tokens_then_the_svg(fake_llm) -> None:
+    [response] = post("/api/v1/generate-house-svg/stream", SPECS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    tokens = [data["text"] for event, data in events if event == "token"]
+    assert len(tokens) > 1
+    # The stop sequence isn't part of the streamed output
+    assert "".join(tokens) + "</svg>" == fake_llm.reply
+    event, data = events[-1]
+    assert event == "svg"
+    assert data["svg_content"] == STORED_SVG
+    assert base64.b64decode(data["image_base64"]).decode("utf-8") == STORED_SVG
+    assert data["cache_hit"] is False
+
+
+def test_stream_reports_output_without_svg_as_an_error(fake_llm) -> None:
+    fake_llm.reply = "Sorry, I can't draw that."
+    [response] = post("/api/v1/generate-house-svg/stream", SPECS)
+    event, data = sse_events(response.text)[-1]
+    assert event == "error"
+    assert "Failed to generate SVG" in data["detail"]
+
+
+
+def test_hopeless_stream_is_retried(fake_llm, monkeypatch) -> None:
+    replies = iter(["I am sorry, but " * 100, PLAN_SVG])
+    astream = fake_llm.astream
+
+    def next_reply(messages, **kwargs):
+        fake_llm.reply = next(replies)
+        return astream(messages, **kwargs)
+
+    monkeypatch.setattr(fake_llm, "astream", next_reply)
+    [response] = post("/api/v1/generate-house-svg/stream", SPECS)
+    events = sse_events(response.text)
+    retries = [data for event, data in events if event == "retry"]
+    assert retries == [{"attempt": 2, "reason": "no_svg"}]
+    # The first attempt was given up on before its output ended
+    first = "".join(data["text"] for event, data in events[:events.index(("retry", retries[0]))] if event == "token")
+    assert len(first) < 1000
+    event, data = events[-1]
+    assert event == "svg" and data["svg_content"] == STORED_SVG
+    stats = get("/api/v1/generation-stats").json()["stream"]
+    assert stats == {"aborted_no_svg": 1, "retries": 1}
+
+
+def test_stream_gives_up_after_the_last_retry(fake_llm) -> None:
+    fake_llm.reply = "I am sorry, but " * 100
+    [response] = post("/api/v1/generate-house-svg/stream", SPECS)
+    events = sse_events(response.text)
+    assert [event for event, data in events if event == "retry"] == ["retry"] * 2
+    assert events[-1][0] == "error"
+    assert len(fake_llm.calls) == 3
+
+def test_repeated_specs_are_served_from_the_cache(fake_llm) -> None:
+    [first] = post("/api/v1/generate-house-svg", SPECS)
+    [second] = post("/api/v1/generate-house-svg", {**SPECS, "house_type": " Modern "})
+    assert first.json()["cache_hit"] is False
+    assert second.json()["cache_hit"] is True
+    assert second.json()["svg_content"] == first.json()["svg_content"]
+    assert len(fake_llm.calls) == 1
+
+    [forced] = post("/api/v1/generate-house-svg", {**SPECS, "force_regenerate": True})
+    assert forced.json()["cache_hit"] is False
+    assert len(fake_llm.calls) == 2
+
+
+def test_concurrent_identical_requests_share_one_model_call(fake_llm) -> None:
+    fake_llm.delay = 0.1
+    responses = post("/api/v1/generate-house-svg", SPECS, {**SPECS, "house_type": "MODERN"}, SPECS)
+    assert [response.json()["svg_content"] for response in responses] == [STORED_SVG] * 3
+    assert len(fake_llm.calls) == 1
+    stats = get("/api/v1/generation-stats").json()["singleflight"]
+    assert stats["in_flight"] == 0
+
+
+def test_stream_serves_cache_hits_without_tokens(fake_llm) -> None:
+    post("/api/v1/generate-house-svg", SPECS)
+    [response] = post("/api/v1/generate-house-svg/stream", SPECS)
+    [(event, data)] = sse_events(response.text)
+    assert event == "svg" and data["cache_hit"] is True
+    assert len(fake_llm.calls) == 1
+
+
+def test_generation_stats_count_cache_lookups(fake_llm) -> None:
+    post("/api/v1/generate-house-svg", SPECS)
+    post("/api/v1/generate-house-svg", SPECS)
+    stats = get("/api/v1/generation-stats").json()
+    assert stats["cache"]["stores"] == 1
+    assert stats["cache"]["hit_rate"] == 0.5
+
+
+def test_token_usage_is_reported(fake_llm) -> None:
+    [response] = post("/api/v1/generate-house-svg", SPECS)
+    assert response.json()["usage"] == {
+        "input_tokens": 1500, "output_tokens": 400, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+    }
+    [stream] = post("/api/v1/generate-house-svg/stream", {**SPECS, "num_bedrooms": 3})
+    assert sse_events(stream.text)[-1][1]["usage"]["output_tokens"] == 400
+
+
+def test_every_route_describes_the_result_alike(fake_llm) -> None:
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            svg = await client.post("/api/v1/generate-house-svg", json=SPECS)
+            image = await client.post("/api/v1/generate-house-image", json=SPECS)
+            stream = await client.post("/api/v1/generate-house-svg/stream", json=SPECS)
+            batch = await client.post("/api/v1/generate-house-svg/batch", json=[SPECS])
+            return svg.json(), image.json(), sse_events(stream.text)[-1][1], ndjson(batch.text)[0]
+
+    svg, *others = asyncio.run(scenario())
+    fields = ["plan_id", "engine", "derived_from", "floor_plan_ids", "quality", "partial", "variants", "cache_hit"]
+    for response in others:
+        assert {field: response[field] for field in fields} == {**{field: svg[field] for field in fields}, "cache_hit": True}
+    assert not svg["cache_hit"] and svg["plan_id"] is not None
+
+
+def test_batch_streams_one_line_per_item(fake_llm) -> None:
+    batch = [SPECS, {**SPECS, "num_marla": -1}, {**SPECS, "num_bedrooms": 3}, {**SPECS, "house_type": "Modern"}]
+    [response] = post("/api/v1/generate-house-svg/batch", batch)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = sorted(ndjson(response.text), key=lambda line: line["index"])
+    assert [line["status"] for line in lines] == ["ok", "error", "ok", "ok"]
+    assert lines[3]["svg_content"] == lines[0]["svg_content"] == STORED_SVG
+    # Items with the same normalized specs are generated once
+    assert len(fake_llm.calls) == 2
+
+
+def test_batch_bounds_concurrency_per_provider(fake_llm) -> None:
+    fake_llm.delay = 0.05
+    batch = [{**SPECS, "num_bedrooms": n} for n in range(1, 6)]
+    [response] = post("/api/v1/generate-house-svg/batch?concurrency=2", batch)
+    assert len(ndjson(response.text)) == 5
+    assert fake_llm.max_active == 2
+
+
+def test_batch_reports_failed_items(fake_llm) -> None:
+    fake_llm.reply = "no plan here"
+    [response] = post("/api/v1/generate-house-svg/batch", [SPECS])
+    [line] = ndjson(response.text)
+    assert line == {"index": 0, "status": "error", "detail": "Failed to generate SVG. Please try again later."}
+
+
+@pytest.mark.parametrize("size,status", [(0, 400), (generate_svg.BATCH_MAX_ITEMS + 1, 422)])
+def test_batch_size_is_bounded(fake_llm, monkeypatch, size, status) -> None:
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", False)
+    [response] = post("/api/v1/generate-house-svg/batch", [SPECS] * size)
+    assert response.status_code == status
+    assert fake_llm.calls == []
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """Leave claude with no free slot and no room in its wait queue."""
+    gate = ProviderAdmission("claude", concurrency=1, max_queue=0)
+    gate.in_flight = 1
+    gate._service_times.append(30.0)
+    monkeypatch.setattr(provider_router, "providers", ["claude"])
+    monkeypatch.setattr(admission, "_providers", {"claude": gate})
+    return gate
+
+
+@pytest.mark.parametrize("path", ["/api/v1/generate-house-svg", "/api/v1/generate-house-svg/stream"])
+def test_saturated_provider_replies_429(fake_llm, saturated, path) -> None:
+    [response] = post(path, SPECS)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
+    assert fake_llm.calls == []
+    assert saturated.rejected == 1
+
+
+def test_saturated_provider_fails_batch_items(fake_llm, saturated) -> None:
+    [response] = post("/api/v1/generate-house-svg/batch", [SPECS])
+    assert ndjson(response.text) == [
+        {"index": 0, "status": "error", "detail": "Provider at capacity.", "retry_after": 30},
+    ]
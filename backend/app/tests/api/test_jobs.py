@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.api.routes import jobs
+from app.jobs import worker
+from app.jobs.queue import InMemoryJobQueue
+from app.main import app
+
+SPECS = {"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2}
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = InMemoryJobQueue()
+    monkeypatch.setattr(jobs, "get_job_queue", lambda: queue)
+    return queue
+
+
+async def _request(method, path, json=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path, json=json)
+
+
+async def _run_worker(queue, job_id):
+    stop = asyncio.Event()
+    [task] = worker.start_workers(1, stop, queue=queue)
+    while queue.get(job_id)["status"] in ("queued", "running"):
+        await asyncio.sleep(0.01)
+    stop.set()
+    await task
+
+
+def test_job_runs_on_a_worker(queue, fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(worker, "POLL_INTERVAL", 0.01)
+
+    async def scenario():
+        created = await _request("POST", "/api/v1/jobs", {"specs": SPECS})
+        assert created.status_code == 202
+        job_id = created.json()["id"]
+        assert (await _request("GET", f"/api/v1/jobs/{job_id}")).json()["status"] == "queued"
+        await _run_worker(queue, job_id)
+        return (await _request("GET", f"/api/v1/jobs/{job_id}")).json()
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "succeeded" and job["attempts"] == 1
+    assert job["result"]["svg_content"].startswith("<svg")
+    assert job["result"]["format"] in ("png", "svg")
+
+
+def test_failing_job_is_retried_then_failed(queue, fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(worker, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr("app.jobs.queue.RETRY_BACKOFF_BASE", 0)
+    fake_llm.error = RuntimeError("provider down")
+    job_id = queue.enqueue({"specs": SPECS}, max_attempts=2)
+
+    asyncio.run(_run_worker(queue, job_id))
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+
+
+@pytest.mark.parametrize("field", ["num_floors", "num_variants"])
+def test_invalid_job_is_rejected(queue, field) -> None:
+    response = asyncio.run(_request("POST", "/api/v1/jobs", {"specs": {**SPECS, field: 0}}))
+    assert response.status_code == 400
+    assert queue.stats() == {}
+
+
+def test_unknown_job_is_404(queue) -> None:
+    assert asyncio.run(_request("GET", "/api/v1/jobs/missing")).status_code == 404
@@ -0,0 +1,171 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.ai import plan_store as plan_store_module, rescale
+from app.ai.plan_store import plan_id_for, plan_store
+from app.api.routes.generate_svg import HouseSpecifications
+from app.main import app
+from app.tests.conftest import PLAN_SVG, STORED_SVG
+
+SPECS = {"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2}
+
+
+@pytest.fixture(autouse=True)
+def renderer(monkeypatch):
+    monkeypatch.setattr(plan_store_module, "svg_to_png_wand", lambda svg_content: b"\x89PNG fake")
+
+
+async def _request(method, path, json=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path, json=json)
+
+
+def test_generated_plan_is_served_in_every_format(fake_llm) -> None:
+    async def scenario():
+        generated = (await _request("POST", "/api/v1/generate-house-svg", SPECS)).json()
+        plan_id = generated["plan_id"]
+        svg = await _request("GET", f"/api/v1/plans/{plan_id}.svg")
+        png = await _request("GET", f"/api/v1/plans/{plan_id}.png")
+        image = await _request("POST", "/api/v1/generate-house-image", {**SPECS, "plan_id": plan_id})
+        return plan_id, svg, png, image.json()
+
+    plan_id, svg, png, image = asyncio.run(scenario())
+    assert plan_id == plan_id_for(STORED_SVG)
+    assert svg.text == STORED_SVG and svg.headers["content-type"] == "image/svg+xml"
+    assert "immutable" in svg.headers["cache-control"]
+    assert png.content == b"\x89PNG fake" and png.headers["content-type"] == "image/png"
+    assert image["format"] == "png" and image["plan_id"] == plan_id and image["cache_hit"]
+    # Only the first request reached the model
+    assert len(fake_llm.calls) == 1
+
+
+@pytest.mark.parametrize("path", ["/api/v1/plans/{}.svg", "/api/v1/plans/{}.png"])
+def test_unknown_plan_is_404(path) -> None:
+    assert asyncio.run(_request("GET", path.format("0" * 24))).status_code == 404
+
+
+def test_unknown_plan_id_in_request_is_404(fake_llm) -> None:
+    response = asyncio.run(_request("POST", "/api/v1/generate-house-svg", {**SPECS, "plan_id": "0" * 24}))
+    assert response.status_code == 404
+    assert fake_llm.calls == []
+
+
+def test_unrenderable_plan_is_422(fake_llm, monkeypatch) -> None:
+    def fail(svg_content):
+        raise RuntimeError("no delegate")
+
+    monkeypatch.setattr(plan_store_module, "svg_to_png_wand", fail)
+
+    async def scenario():
+        plan_id = (await _request("POST", "/api/v1/generate-house-svg", SPECS)).json()["plan_id"]
+        return await _request("GET", f"/api/v1/plans/{plan_id}.png")
+
+    assert asyncio.run(scenario()).status_code == 422
+
+
+def test_similar_plans_link_to_both_formats() -> None:
+    plan_id = plan_store.save(PLAN_SVG, HouseSpecifications(**SPECS))
+    query = "house_type=modern&num_marla=6&num_bedrooms=2&num_floors=1&additional_preferences=garden&k=3"
+    response = asyncio.run(_request("GET", f"/api/v1/plans/similar?{query}"))
+    [plan] = response.json()["plans"]
+    assert plan["plan_id"] == plan_id
+    assert plan["svg_url"] == f"http://test/api/v1/plans/{plan_id}.svg"
+    assert plan["png_url"] == f"http://test/api/v1/plans/{plan_id}.png"
+
+
+@pytest.mark.parametrize("query", ["house_type=modern&num_marla=5&num_bedrooms=2", "house_type=modern&num_marla=5&num_bedrooms=2&num_floors=1&k=0"])
+def test_similar_plans_validate_the_query(query) -> None:
+    assert asyncio.run(_request("GET", f"/api/v1/plans/similar?{query}")).status_code == 422
+
+
+def test_plan_geometry_lists_its_rooms() -> None:
+    plan_id = plan_store.save(PLAN_SVG)
+    response = asyncio.run(_request("GET", f"/api/v1/plans/{plan_id}/geometry"))
+    assert response.status_code == 200
+    rooms = response.json()["rooms"]
+    assert [room["name"] for room in rooms] == ["Bedroom", "Kitchen"]
+
+
+@pytest.mark.parametrize("svg,status", [(None, 404), ("<svg><rect></svg>", 422)])
+def test_plan_geometry_errors(svg, status) -> None:
+    plan_id = plan_store.save(svg) if svg else "0" * 24
+    assert asyncio.run(_request("GET", f"/api/v1/plans/{plan_id}/geometry")).status_code == status
+
+
+OVERLAPPING_SVG = PLAN_SVG.replace('<rect x="100" y="0"', '<rect x="40" y="0"').replace('<text x="150"', '<text x="120"')
+
+
+def test_plan_failing_quality_checks_is_422_and_not_cached(fake_llm) -> None:
+    fake_llm.reply = OVERLAPPING_SVG
+
+    async def scenario():
+        image = await _request("POST", "/api/v1/generate-house-image", SPECS)
+        svg = await _request("POST", "/api/v1/generate-house-svg", SPECS)
+        png = await _request("GET", f"/api/v1/plans/{image.json()['detail']['plan_id']}.png")
+        return image, svg, png
+
+    image, svg, png = asyncio.run(scenario())
+    assert image.status_code == 422
+    quality = image.json()["detail"]["quality"]
+    assert not quality["ok"] and quality["issues"][0]["check"] == "overlap"
+    assert svg.status_code == 200 and svg.json()["quality"] == quality
+    assert png.status_code == 422
+    # Each request generated a new plan
+    assert len(fake_llm.calls) == 2
+
+
+def test_variants_link_to_their_plans(fake_llm, monkeypatch) -> None:
+    # Otherwise a variant may be rescaled from another that was stored first
+    monkeypatch.setattr(rescale, "RESCALE_ENABLED", False)
+
+    async def scenario():
+        image = (await _request("POST", "/api/v1/generate-house-image", {**SPECS, "num_variants": 2})).json()
+        svg = await _request("GET", image["variants"][0]["svg_url"])
+        return image, svg
+
+    image, svg = asyncio.run(scenario())
+    [variant] = image["variants"]  # Both calls drew the same plan
+    assert variant["rank"] == 1 and variant["plan_id"] == image["plan_id"]
+    assert variant["png_url"].endswith(f"/api/v1/plans/{image['plan_id']}.png")
+    assert svg.text == STORED_SVG
+    assert len(fake_llm.calls) == 2
+
+
+def test_layout_mode_draws_and_serves_the_layout(fake_llm) -> None:
+    fake_llm.reply = "R 0 0 12 15 Bedroom\nR 12 0 13 15 Kitchen\nD 1 S 4\nW 2 N 3\nEND"
+
+    async def scenario():
+        generated = (await _request("POST", "/api/v1/generate-house-svg", {**SPECS, "mode": "layout"})).json()
+        layout = await _request("GET", f"/api/v1/plans/{generated['plan_id']}/layout")
+        missing = await _request("GET", f"/api/v1/plans/{plan_store.save(PLAN_SVG, HouseSpecifications(**SPECS))}/layout")
+        return generated, layout, missing
+
+    generated, layout, missing = asyncio.run(scenario())
+    assert generated["engine"] == "layout"
+    assert "Bedroom" in generated["svg_content"] and "Kitchen" in generated["svg_content"]
+    [floor] = layout.json()["floors"]
+    assert [room["name"] for room in floor["rooms"]] == ["Bedroom", "Kitchen"]
+    assert floor["doors"] == [{"room": 0, "wall": "S", "offset": 4}]
+    assert missing.status_code == 404
+
+
+def test_partial_plan_is_flagged_and_not_stored(fake_llm, renderer, monkeypatch) -> None:
+    fake_llm.reply = PLAN_SVG[:PLAN_SVG.index("Kitchen")]
+    monkeypatch.setattr(fake_llm, "metadata", {"stop_reason": "max_tokens"})
+
+    async def scenario():
+        svg = (await _request("POST", "/api/v1/generate-house-svg", SPECS)).json()
+        image = (await _request("POST", "/api/v1/generate-house-image", SPECS)).json()
+        similar = (await _request("GET", "/api/v1/plans/similar?house_type=modern&num_marla=5&num_floors=1&num_bedrooms=2")).json()["plans"]
+        return svg, image, similar
+
+    svg, image, similar = asyncio.run(scenario())
+    assert svg["partial"] and svg["plan_id"] is None and svg["svg_content"].endswith("<text x=\"150\" y=\"75\"/></svg>")
+    # Rendered for the response all the same
+    assert image["partial"] and image["format"] == "png" and image["plan_id"] is None
+    assert similar == []
+    assert list(plan_store.iter_metadata()) == []
+    assert len(fake_llm.calls) == 2
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.api import ratelimit
+from app.api.ratelimit import TokenBucketStore, client_identity
+from app.main import app
+
+SPECS = {"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+async def _send(requests, headers=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+        return [await client.request(method, path, json=body) for method, path, body in requests]
+
+
+def test_bucket_refills_over_time(tmp_path, clock) -> None:
+    store = TokenBucketStore(str(tmp_path / "buckets.sqlite3"))
+    for remaining in (1, 0):
+        assert store.take("client", capacity=2, per_minute=6) == (True, remaining, 0)
+    # One token per 10 seconds
+    assert store.take("client", capacity=2, per_minute=6) == (False, 0, 10)
+    clock[0] += 5
+    allowed, tokens, retry_after = store.take("client", capacity=2, per_minute=6)
+    assert not allowed and tokens == pytest.approx(0.5) and retry_after == 5
+    clock[0] += 5
+    assert store.take("client", capacity=2, per_minute=6)[0]
+    # Refills never exceed the burst capacity
+    clock[0] += 3600
+    assert store.take("client", capacity=2, per_minute=6, cost=2) == (True, 0, 0)
+
+
+def test_buckets_are_shared_between_stores(tmp_path, clock) -> None:
+    path = str(tmp_path / "buckets.sqlite3")
+    assert TokenBucketStore(path).take("client", capacity=1, per_minute=1)[0]
+    assert not TokenBucketStore(path).take("client", capacity=1, per_minute=1)[0]
+    assert TokenBucketStore(path).take("other", capacity=1, per_minute=1)[0]
+
+
+def test_clients_are_keyed_by_api_key_then_ip(monkeypatch) -> None:
+    def request(headers):
+        return SimpleNamespace(headers=headers, client=SimpleNamespace(host="10.0.0.1"))
+
+    keyed = client_identity(request({"x-api-key": "secret"}))
+    assert keyed.startswith("key:") and "secret" not in keyed
+    assert client_identity(request({"x-forwarded-for": "1.2.3.4"})) == "ip:10.0.0.1"
+    monkeypatch.setattr(ratelimit, "TRUST_FORWARDED_FOR", True)
+    assert client_identity(request({"x-forwarded-for": "1.2.3.4, 10.0.0.1"})) == "ip:1.2.3.4"
+
+
+def test_generation_budget_is_enforced_per_client(fake_llm, clock) -> None:
+    requests = [("POST", "/api/v1/generate-house-svg", SPECS)] * 6
+    *allowed, limited = asyncio.run(_send(requests))
+    assert [response.status_code for response in allowed] == [200] * 5
+    assert [response.headers["x-ratelimit-remaining"] for response in allowed] == ["4", "3", "2", "1", "0"]
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "6" and limited.headers["x-ratelimit-limit"] == "5"
+    # Another client has its own bucket, and other routes their own budget
+    [other] = asyncio.run(_send(requests[:1], headers={"X-API-Key": "another"}))
+    assert other.status_code == 200
+    [stats] = asyncio.run(_send([("GET", "/api/v1/generation-stats", None)]))
+    assert stats.status_code == 200 and stats.headers["x-ratelimit-limit"] == "60"
+
+
+def test_batch_is_charged_per_item(fake_llm, clock) -> None:
+    batch, single = asyncio.run(_send([
+        ("POST", "/api/v1/generate-house-svg/batch", [SPECS] * 3),
+        ("POST", "/api/v1/generate-house-svg", SPECS),
+    ]))
+    assert batch.status_code == 200
+    assert batch.headers["x-ratelimit-remaining"] == "2"
+    assert single.headers["x-ratelimit-remaining"] == "1"
+
+
+def test_batch_larger_than_the_burst_is_rejected(fake_llm, clock) -> None:
+    batch, oversized, single = asyncio.run(_send([
+        ("POST", "/api/v1/generate-house-svg/batch", [SPECS] * 4),
+        ("POST", "/api/v1/generate-house-svg/batch", [SPECS] * 6),
+        ("POST", "/api/v1/generate-house-svg", SPECS),
+    ]))
+    assert batch.headers["x-ratelimit-remaining"] == "1"
+    assert oversized.status_code == 413
+    assert "at most 5" in oversized.json()["detail"] and "retry-after" not in oversized.headers
+    # The rejected batch wasn't charged
+    assert single.status_code == 200 and single.headers["x-ratelimit-remaining"] == "0"
+
+
+def test_headers_are_set_on_streamed_responses(fake_llm, clock) -> None:
+    [stream] = asyncio.run(_send([("POST", "/api/v1/generate-house-svg/stream", SPECS)]))
+    assert stream.headers["content-type"].startswith("text/event-stream")
+    assert stream.headers["x-ratelimit-remaining"] == "4"
+
+
+def test_rate_limit_can_be_disabled(fake_llm, monkeypatch) -> None:
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", False)
+    responses = asyncio.run(_send([("POST", "/api/v1/generate-house-svg", SPECS)] * 6))
+    assert [response.status_code for response in responses] == [200] * 6
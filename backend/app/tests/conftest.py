@@ -0,0 +1,122 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# Provider clients are built with dummy keys and never reach the network
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+from app.ai import demand, model  # noqa: E402
+from app.ai.admission import admission  # noqa: E402
+from app.ai.budget import token_budget  # noqa: E402
+from app.ai.cache import generation_cache  # noqa: E402
+from app.ai.plan_store import plan_store  # noqa: E402
+from app.ai.providers import ProviderStats, provider_router  # noqa: E402
+from app.ai.rescale import rescale_index  # noqa: E402
+from app.ai.similar import SimilarPlanIndex, similar_plans  # noqa: E402
+from app.ai.stream_guard import stream_stats  # noqa: E402
+from app.ai.svg_optimize import optimize_svg  # noqa: E402
+from app.api import ratelimit  # noqa: E402
+
+PLAN_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 200 150" width="200" height="150">'
+    '<rect x="0" y="0" width="200" height="150" fill="none" stroke="#000" stroke-width="4"/>'
+    '<rect x="0" y="0" width="100" height="150" fill="none" stroke="#000" stroke-width="2"/>'
+    '<text x="50" y="75">Bedroom</text>'
+    '<rect x="100" y="0" width="100" height="150" fill="none" stroke="#000" stroke-width="2"/>'
+    '<text x="150" y="75">Kitchen</text>'
+    "</svg>"
+)
+# PLAN_SVG as generation stores and returns it
+STORED_SVG = optimize_svg(PLAN_SVG)
+
+
+class FakeLLM:
+    """Chat model double answering every call with `reply` after `delay` seconds.
+
+    Like a provider, the reply ends before the first `stop` sequence. Streamed
+    replies arrive in chunks of `chunk_size` characters, followed by an empty
+    chunk reporting `usage` and `metadata`. With `error` set, calls raise it
+    instead.
+    """
+
+    usage = {"input_tokens": 1500, "output_tokens": 400, "total_tokens": 1900}
+    metadata = {"stop_reason": "stop_sequence"}
+
+    def __init__(self, reply=f"Here is the plan:\n{PLAN_SVG}", delay=0.0, chunk_size=16, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.error = error
+        self.calls = []
+        self.cancelled = 0
+        self.active = 0
+        self.max_active = 0  # Most calls in progress at once
+
+    def _text(self, stop=None):
+        text = self.reply
+        for sequence in stop or []:
+            text = text.split(sequence, 1)[0]
+        return text
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=self._text(kwargs.get("stop")), usage_metadata=self.usage, response_metadata=self.metadata)
+
+    async def astream(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        text = self._text(kwargs.get("stop"))
+        for i in range(0, len(text), self.chunk_size):
+            await asyncio.sleep(0)
+            yield AIMessageChunk(content=text[i:i + self.chunk_size])
+        yield AIMessageChunk(content="", usage_metadata=self.usage, response_metadata=self.metadata)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Answer every provider with one `FakeLLM`."""
+    llm = FakeLLM()
+    monkeypatch.setattr(model, "_llms", {"claude": llm, "deepseek": llm})
+    return llm
+
+
+@pytest.fixture(autouse=True)
+def generation_state(monkeypatch, tmp_path):
+    """Give each test an empty generation cache, plan store, demand log and rate limiter, and fresh statistics."""
+    monkeypatch.setattr(generation_cache, "directory", str(tmp_path / "cache"))
+    monkeypatch.setattr(generation_cache, "_memory", OrderedDict())
+    monkeypatch.setattr(generation_cache, "_memory_bytes", 0)
+    monkeypatch.setattr(generation_cache, "counters", dict.fromkeys(generation_cache.counters, 0))
+    monkeypatch.setattr(plan_store, "directory", str(tmp_path / "plans"))
+    monkeypatch.setattr(demand, "DEMAND_LOG", str(tmp_path / "demand" / "demand.log"))
+    monkeypatch.setattr(rescale_index, "_by_program", {})
+    monkeypatch.setattr(rescale_index, "_known", set())
+    monkeypatch.setattr(rescale_index, "_checked", set())
+    monkeypatch.setattr(rescale_index, "_version", None)
+    monkeypatch.setattr(rescale_index, "derived", 0)
+    for name, value in vars(SimilarPlanIndex(plan_store)).items():
+        monkeypatch.setattr(similar_plans, name, value)
+    monkeypatch.setattr(admission, "_providers", {})
+    monkeypatch.setattr(provider_router, "_stats", {name: ProviderStats() for name in provider_router.providers})
+    monkeypatch.setattr(token_budget, "_history", {})
+    monkeypatch.setattr(token_budget, "_truncated", {})
+    monkeypatch.setattr(token_budget, "counters", dict.fromkeys(token_budget.counters, 0))
+    monkeypatch.setattr(ratelimit, "_store", ratelimit.TokenBucketStore(str(tmp_path / "ratelimit.sqlite3")))
+    stream_stats.clear()
@@ -0,0 +1,120 @@
+import pytest
+
+from app.jobs import queue as job_queue
+from app.jobs.queue import BaseJobQueue, InMemoryJobQueue, SQLiteJobQueue, create_job_queue
+
+
+class Clock:
+    """Stand-in for `time.time` that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, "time", clock)
+    # Retry the full backoff, without jitter
+    monkeypatch.setattr(job_queue.random, "uniform", lambda low, high: high)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path, clock):
+    if request.param == "memory":
+        return InMemoryJobQueue()
+    return SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claim_takes_interactive_jobs_first(queue) -> None:
+    batch = queue.enqueue({"n": 1}, priority="batch")
+    interactive = queue.enqueue({"n": 2})
+    first = queue.claim("w1")
+    assert first["id"] == interactive and first["payload"] == {"n": 2}
+    assert first["status"] == "running" and first["attempts"] == 1
+    assert queue.claim("w2")["id"] == batch
+    assert queue.claim("w3") is None
+
+
+def test_completed_job_keeps_its_result(queue) -> None:
+    job_id = queue.enqueue({"n": 1})
+    queue.claim("w1")
+    queue.complete(job_id, "w1", {"svg": "<svg/>"})
+    job = queue.get(job_id)
+    assert job["status"] == "succeeded" and job["result"] == {"svg": "<svg/>"}
+    assert queue.stats() == {"succeeded": 1}
+    assert queue.get("missing") is None
+
+
+def test_job_of_a_dead_worker_is_handed_out_again(queue, clock) -> None:
+    job_id = queue.enqueue({"n": 1})
+    queue.claim("w1", visibility_timeout=60)
+    clock.now += 59
+    assert queue.claim("w2") is None
+    clock.now += 2
+    job = queue.claim("w2")
+    assert job["id"] == job_id and job["attempts"] == 2
+    # The first worker no longer owns the job
+    assert not queue.heartbeat(job_id, "w1")
+    queue.complete(job_id, "w1", {"stale": True})
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_heartbeat_extends_the_visibility_timeout(queue, clock) -> None:
+    job_id = queue.enqueue({"n": 1})
+    queue.claim("w1", visibility_timeout=60)
+    clock.now += 50
+    assert queue.heartbeat(job_id, "w1", visibility_timeout=60)
+    clock.now += 50
+    assert queue.claim("w2") is None
+
+
+def test_failed_job_is_retried_with_backoff(queue, clock, monkeypatch) -> None:
+    monkeypatch.setattr(job_queue, "RETRY_BACKOFF_BASE", 5)
+    job_id = queue.enqueue({"n": 1}, max_attempts=3)
+    queue.claim("w1")
+    queue.fail(job_id, "w1", "boom")
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["error"] == "boom"
+    clock.now += 4
+    assert queue.claim("w1") is None
+    clock.now += 1
+    queue.claim("w1")
+    queue.fail(job_id, "w1", "boom")
+    # The second retry waits twice as long
+    clock.now += 9
+    assert queue.claim("w1") is None
+    clock.now += 1
+    assert queue.claim("w1")["attempts"] == 3
+
+
+def test_job_fails_after_its_last_attempt(queue) -> None:
+    job_id = queue.enqueue({"n": 1}, max_attempts=1)
+    queue.claim("w1")
+    queue.fail(job_id, "w1", "boom")
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "boom"
+    assert queue.claim("w1") is None
+
+
+def test_sqlite_queue_is_shared_between_instances(tmp_path) -> None:
+    path = str(tmp_path / "jobs.sqlite3")
+    job_id = SQLiteJobQueue(path).enqueue({"n": 1})
+    assert SQLiteJobQueue(path).claim("w1")["id"] == job_id
+    assert SQLiteJobQueue(path).claim("w2") is None
+
+
+def test_queue_url(tmp_path) -> None:
+    assert isinstance(create_job_queue("memory://"), InMemoryJobQueue)
+    assert isinstance(create_job_queue(f"sqlite:///{tmp_path}/jobs.sqlite3"), SQLiteJobQueue)
+    with pytest.raises(ValueError, match="Unsupported"):
+        create_job_queue("redis://localhost")
+
+
+def test_base_queue_is_abstract() -> None:
+    with pytest.raises(TypeError):
+        BaseJobQueue()
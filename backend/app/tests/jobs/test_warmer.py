@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pytest
+
+from app.ai import plan_store as plan_store_module
+from app.ai.demand import record_demand
+from app.ai.generation import generate_svg
+from app.ai.svg_optimize import expand_for_raster
+from app.api.routes.generate_svg import HouseSpecifications
+from app.jobs import warmer
+from app.jobs.warmer import in_off_peak, warm_cache
+from app.tests.conftest import STORED_SVG
+
+
+def specs(**overrides):
+    return HouseSpecifications(**{"house_type": "modern", "num_marla": 5, "num_floors": 1, "num_bedrooms": 2, **overrides})
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    renders = []
+
+    def render(svg_content):
+        renders.append(svg_content)
+        return b"\x89PNG fake"
+
+    monkeypatch.setattr(plan_store_module, "svg_to_png_wand", render)
+    return renders
+
+
+@pytest.fixture
+def state(monkeypatch, tmp_path):
+    monkeypatch.setattr(warmer, "STATE_PATH", str(tmp_path / "warmer" / "warmer.json"))
+    monkeypatch.setattr(warmer, "LOCK_PATH", str(tmp_path / "warmer" / "warmer.lock"))
+    return tmp_path / "warmer" / "warmer.json"
+
+
+def test_popular_uncached_specs_are_warmed(fake_llm, renders) -> None:
+    for bedrooms in (3, 3, 4, 2):
+        record_demand(specs(num_bedrooms=bedrooms))
+    asyncio.run(generate_svg(specs(num_bedrooms=2), track_demand=False))
+    fake_llm.calls.clear()
+
+    summary = asyncio.run(warm_cache(top_n=5, budget=100000))
+    assert summary == {
+        "warmed": 2, "already_cached": 1, "not_cached": 0, "failed": 0, "tokens_spent": 2 * 1900, "stopped_by_budget": False,
+    }
+    assert len(fake_llm.calls) == 2
+    # Both answers are the same plan, which is rendered once
+    assert renders == [expand_for_raster(STORED_SVG)]
+    # Warming doesn't count as demand
+    again = asyncio.run(warm_cache(top_n=5, budget=100000))
+    assert again["already_cached"] == 3 and again["warmed"] == 0
+
+
+def test_warming_stops_at_the_token_budget(fake_llm, renders) -> None:
+    for bedrooms in (2, 3, 4):
+        record_demand(specs(num_bedrooms=bedrooms))
+    summary = asyncio.run(warm_cache(top_n=5, budget=5000))
+    # Each generation may use its full max_tokens (over 3000) on top of what was spent
+    assert summary["warmed"] == 1 and summary["stopped_by_budget"]
+
+
+def test_requested_modes_are_warmed(fake_llm, renders) -> None:
+    fake_llm.reply = "R 0 0 12 15 Bedroom\nR 12 0 13 15 Kitchen\nEND"
+    record_demand(specs(mode="layout"))
+    record_demand(specs(mode="procedural"))
+    summary = asyncio.run(warm_cache(top_n=5, budget=100000))
+    assert summary["warmed"] == 1 and len(fake_llm.calls) == 1
+    assert asyncio.run(generate_svg(specs(mode="layout"), track_demand=False)).cache_hit
+
+
+def test_uncached_generations_are_not_counted_as_warmed(fake_llm, renders) -> None:
+    asyncio.run(generate_svg(specs(num_marla=5), track_demand=False))
+    # Near enough to be rescaled from the stored plan, which isn't cached under its key
+    record_demand(specs(num_marla=5.2))
+    summary = asyncio.run(warm_cache(top_n=5, budget=100000))
+    assert summary["not_cached"] == 1 and summary["warmed"] == 0
+
+
+def test_failures_are_counted(fake_llm, renders) -> None:
+    fake_llm.error = RuntimeError("provider down")
+    record_demand(specs())
+    summary = asyncio.run(warm_cache(top_n=5, budget=100000))
+    assert summary["failed"] == 1 and summary["warmed"] == 0
+
+
+@pytest.mark.parametrize("hour,hours,expected", [
+    (2, "2-6", True), (5, "2-6", True), (6, "2-6", False), (23, "22-4", True), (3, "22-4", True), (12, "22-4", False),
+])
+def test_off_peak_hours(hour, hours, expected) -> None:
+    assert in_off_peak(hour, hours) is expected
+
+
+def test_warms_once_a_day(fake_llm, renders, state) -> None:
+    record_demand(specs())
+    asyncio.run(warmer._warm_once_today())
+    asyncio.run(warmer._warm_once_today())
+    saved = json.loads(state.read_text())
+    assert saved["warmed"] == 1
+    assert len(fake_llm.calls) == 1
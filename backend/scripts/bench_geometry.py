@@ -0,0 +1,91 @@
+"""Benchmark: parsing plans into `FloorPlan` arrays vs an ElementTree DOM, and
+the quality checks run on them.
+
+    cd backend && python scripts/bench_geometry.py [svg files or directories...]
+
+Defaults to the sample plan in the repository root, a procedural plan, a
+dense synthetic grid of rooms and every plan in the plan store (PLANS_DIR).
+"""
+import glob
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.geometry import FloorPlan  # noqa: E402
+from app.ai.plan_store import PLANS_DIR  # noqa: E402
+from app.ai.procedural import render_procedural  # noqa: E402
+from app.ai.quality import check_plan  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def corpus(paths):
+    if not paths:
+        specs = SimpleNamespace(house_type="modern", num_marla=10, num_bedrooms=4, num_floors=2, additional_preferences=[])
+        yield "procedural", render_procedural(specs)
+        yield "grid (1600 rooms)", grid(40)
+        paths = [os.path.join(ROOT, "image.svg"), PLANS_DIR]
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.svg"))) if os.path.isdir(path) else [path]
+        for name in files:
+            if os.path.exists(name):
+                with open(name, "r", encoding="utf-8") as f:
+                    yield os.path.basename(name), f.read()
+
+
+def grid(n, size=50):
+    """An `n` x `n` grid of labelled rooms with a door each, inside one outline."""
+    shapes = [f'<rect x="0" y="0" width="{n * size}" height="{n * size}" fill="none" stroke="black" stroke-width="4"/>']
+    for row in range(n):
+        for col in range(n):
+            x, y = col * size, row * size
+            shapes.append(f'<rect x="{x}" y="{y}" width="{size}" height="{size}" fill="none" stroke="black" stroke-width="2"/>')
+            shapes.append(f'<text x="{x + size / 2}" y="{y + size / 2}">Room {row * n + col}</text>')
+            shapes.append(f'<path d="M{x + 10},{y} A10,10 0 0,1 {x},{y + 10}" fill="none" stroke="black"/>')
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="-10 -10 {n * size + 20} {n * size + 20}">{"".join(shapes)}</svg>'
+
+
+def best_of(fn, arg, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def retained(fn, arg):
+    """Bytes still allocated by what `fn(arg)` returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn(arg)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    print(f"{'plan':<32}{'bytes':>8}{'shapes':>8}{'parse ms':>10}{'us/shape':>10}{'ET ms':>8}{'model KB':>10}{'ET KB':>8}{'check ms':>10}")
+    for name, svg in corpus(sys.argv[1:]):
+        try:
+            plan = FloorPlan.from_svg(svg)
+        except ValueError as e:
+            print(f"{name[:31]:<32}skipped: {e}")
+            continue
+        shapes = len(plan.rects) + len(plan.segments) + len(plan.doors) + len(plan.labels)
+        ms = best_of(FloorPlan.from_svg, svg)
+        print(
+            f"{name[:31]:<32}{len(svg):>8}{shapes:>8}{ms:>10.2f}{ms * 1000 / max(shapes, 1):>10.1f}"
+            f"{best_of(ET.fromstring, svg):>8.2f}{retained(FloorPlan.from_svg, svg) / 1024:>10.1f}"
+            f"{retained(ET.fromstring, svg) / 1024:>8.1f}{best_of(check_plan, plan):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
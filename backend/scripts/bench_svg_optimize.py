@@ -0,0 +1,74 @@
+"""Benchmark: size and time of the SVG optimizer over a corpus of generated plans.
+
+    cd backend && python scripts/bench_svg_optimize.py [svg files or directories...]
+
+Defaults to the sample plan in the repository root and every plan in the
+plan store (PLANS_DIR). Rendering times are reported when ImageMagick is
+available.
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.plan_store import PLANS_DIR  # noqa: E402
+from app.ai.svg_optimize import optimize_svg  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def corpus(paths):
+    if not paths:
+        paths = [os.path.join(ROOT, "image.svg"), PLANS_DIR]
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "*.svg")))
+        elif os.path.exists(path):
+            yield path
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def render_timer():
+    try:
+        from app.api.routes.helpers import svg_to_png_wand
+        svg_to_png_wand('<svg xmlns="http://www.w3.org/2000/svg" width="1" height="1"/>')
+    except Exception as e:
+        print(f"Not timing rendering: {e}")
+        return None
+    return lambda svg: best_of(svg_to_png_wand, svg, 3)
+
+
+def main():
+    files = list(corpus(sys.argv[1:]))
+    if not files:
+        print("No SVG files found")
+        return
+    render = render_timer()
+    header = f"{'plan':<32}{'bytes':>9}{'optimized':>11}{'saved':>7}{'ms':>8}"
+    print(header + (f"{'render ms':>11}{'after':>8}" if render else ""))
+    total_in = total_out = total_ms = 0
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            svg = f.read()
+        optimized = optimize_svg(svg)
+        ms = best_of(optimize_svg, svg, 5)
+        total_in, total_out, total_ms = total_in + len(svg), total_out + len(optimized), total_ms + ms
+        line = f"{os.path.basename(path)[:31]:<32}{len(svg):>9}{len(optimized):>11}{1 - len(optimized) / len(svg):>7.0%}{ms:>8.2f}"
+        if render:
+            line += f"{render(svg):>11.1f}{render(optimized):>8.1f}"
+        print(line)
+    print(f"{'total (' + str(len(files)) + ' plans)':<32}{total_in:>9}{total_out:>11}{1 - total_out / total_in:>7.0%}{total_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Micro-benchmark: SVG extraction with the old regex vs SVGExtractor.
+
+    cd backend && python scripts/bench_svg_parser.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.svg_parser import SVGExtractor  # noqa: E402
+
+REGEX = re.compile(r"(<svg[\s\S]*?<\/svg>)", re.IGNORECASE)
+
+
+def regex_extract(text):
+    match = REGEX.search(text)
+    return match.group(1) if match else None
+
+
+def extractor_extract(text):
+    extractor = SVGExtractor(max_chars=len(text))
+    return extractor.feed(text)
+
+
+def extractor_streamed(text, chunk_size=16):
+    # Roughly what a streamed response looks like: a few characters per chunk
+    extractor = SVGExtractor(max_chars=len(text))
+    for i in range(0, len(text), chunk_size):
+        if extractor.feed(text[i:i + chunk_size]) is not None:
+            return extractor.svg
+    return None
+
+
+def plan_output(rooms):
+    body = "".join(
+        f'<rect x="{i % 40 * 20}" y="{i // 40 * 20}" width="18" height="18" fill="#fff" stroke="#333"/>'
+        f'<text x="{i % 40 * 20 + 9}" y="{i // 40 * 20 + 9}">Room {i} 12\' x 14\'</text>'
+        for i in range(rooms)
+    )
+    return f'Here is your plan:\n```svg\n<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 800 800">{body}</svg>\n```\nLet me know!'
+
+
+CASES = {
+    # Typical generations, small to very large
+    "plan_20kb": plan_output(120),
+    "plan_1mb": plan_output(6000),
+    # Truncated output that mentions "<svg" often but never closes it: the lazy
+    # regex rescans to the end of the text from every "<svg"
+    "unclosed_2000_svg_starts": "<svg><rect/>" * 2000,
+}
+
+
+def bench(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    print(f"{'case':<28}{'chars':>10}{'regex ms':>12}{'extractor ms':>14}{'streamed ms':>13}")
+    for name, text in CASES.items():
+        repeat = 3 if len(text) > 100_000 else 20
+        assert extractor_extract(text) == regex_extract(text) == extractor_streamed(text)
+        print(
+            f"{name:<28}{len(text):>10}"
+            f"{bench(regex_extract, text, repeat):>12.2f}"
+            f"{bench(extractor_extract, text, repeat):>14.2f}"
+            f"{bench(extractor_streamed, text, repeat):>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()